@@ -22,7 +22,7 @@ class InventoryItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = InventoryItem
-        fields = '__all__'
+        exclude = ('version_key',)
 
 
 class BusinessUnitSerializer(serializers.ModelSerializer):
@@ -59,6 +59,9 @@ class PluginScriptRowSerializer(serializers.ModelSerializer):
 
 class FactSerializer(serializers.ModelSerializer):
 
+    fact_name = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    fact_data = serializers.CharField(source='value', read_only=True)
+
     class Meta:
         model = Fact
         fields = '__all__'
@@ -110,7 +113,9 @@ class MachineSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Machine
-        fields = '__all__'
+        # The version keys are only for sorting and filtering in the
+        # database.
+        exclude = tuple(Machine.VERSION_KEY_FIELDS.values())
 
     def __init__(self, *args, **kwargs):
         """Modify the serializer's fields for saved_search.
@@ -1,7 +1,11 @@
 """General functional tests for the API endpoints."""
 
 
+from unittest.mock import patch
+
+import server.utils
 from api.v2.tests.tools import SalAPITestCase, TestGeneratorMeta
+from server.models import Fact
 
 
 # pylint: disable=missing-docstring
@@ -18,6 +22,24 @@ class FactTest(SalAPITestCase, metaclass=TestGeneratorMeta):
         'machine_fixtures.json', 'fact_fixtures.json']
     tests = ['fact']
 
+    def test_filter_by_fact_name(self):
+        response = self.authed_get('fact-list', params={'fact_name': 'mountpoints=>/=>size'})
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['fact_name'], 'mountpoints=>/=>size')
+
+    @patch('server.utils.settings.FACT_VALUE_STORE_THRESHOLD', 10)
+    def test_filter_by_stored_fact_data(self):
+        large = 'x' * 100
+        fact = Fact.objects.first()
+        fact.fact_data = ''
+        fact.fact_value_id = server.utils.get_fact_values([large])[large]
+        fact.save()
+        response = self.authed_get('fact-list', params={'fact_data': large})
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['fact_data'], large)
+
 
 class InventoryTest(SalAPITestCase, metaclass=TestGeneratorMeta):
     fixtures = [
@@ -1,3 +1,4 @@
+import django_filters
 from django.http import Http404
 from rest_framework.decorators import action
 from rest_framework import generics
@@ -7,6 +8,7 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+import server.utils
 from .serializers import *
 from api.auth import *
 from .mixins import QueryFieldsMixin
@@ -21,12 +23,25 @@ class BusinessUnitViewSet(viewsets.ModelViewSet):
     filter_fields = ('name',)
 
 
+class FactFilterSet(django_filters.FilterSet):
+    # Filter by the name itself, rather than the FactName's ID.
+    fact_name = django_filters.CharFilter(field_name='fact_name__name')
+    fact_data = django_filters.CharFilter(method='filter_fact_data')
+
+    class Meta:
+        model = Fact
+        fields = (
+            'machine__serial', 'machine__hostname', 'machine__id', 'fact_name', 'fact_data',
+            'fact_value')
+
+    def filter_fact_data(self, queryset, name, value):
+        return queryset.filter(server.utils.get_fact_data_q('', value))
+
+
 class FactViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Fact.objects.all()
+    queryset = Fact.objects.select_related('fact_name', 'fact_value')
     serializer_class = FactSerializer
-    filter_fields = (
-        'machine__serial', 'machine__hostname', 'machine__id',
-        'fact_name', 'fact_data')
+    filterset_class = FactFilterSet
 
 
 class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
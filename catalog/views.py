@@ -1,27 +1,24 @@
 import plistlib
 
-from django.http import Http404, HttpResponse
+from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from catalog.models import Catalog
-from sal.decorators import key_auth_required
-from server.models import MachineGroup
+from sal.decorators import admission_control, get_submitted_machine_group, key_auth_required
 from utils import text_utils
 
 
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control('heavy')
 def submit_catalog(request):
     submission = request.POST
     key = submission.get('key')
     name = submission.get('name')
     if key:
-        try:
-            machine_group = MachineGroup.objects.get(key=key)
-        except MachineGroup.DoesNotExist:
-            raise Http404
+        machine_group = get_submitted_machine_group(key, request)
 
         compressed_catalog = submission.get('base64bz2catalog')
         if compressed_catalog:
@@ -41,14 +38,12 @@ def submit_catalog(request):
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control('light')
 def catalog_hash(request):
     submission = request.POST
     key = submission.get('key')
     if key:
-        try:
-            machine_group = MachineGroup.objects.get(key=key)
-        except MachineGroup.DoesNotExist:
-            raise Http404
+        machine_group = get_submitted_machine_group(key, request)
 
     output = []
     catalogs = submission.get('catalogs')
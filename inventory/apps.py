@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class InventoryAppConfig(AppConfig):
     name = "inventory"
+
+    def ready(self):
+        # Connect the signal receivers that maintain the install count
+        # rollup.
+        import inventory.install_counts  # noqa: F401
@@ -0,0 +1,189 @@
+"""Maintenance of the ApplicationInstallCount rollup.
+
+The inventory views need install counts per application for whole
+business units and machine groups, which is far too slow to count from
+InventoryItems on every page load. Instead, ApplicationInstallCount
+holds a count per application, machine group, version and path, of the
+InventoryItems on deployed machines.
+
+The rollup is changed by deltas rather than recomputed: inventory
+submission applies the difference between a machine's old and new
+items, and machines that move group, are undeployed or deleted have
+their items moved or subtracted. Counts are only ever incremented and
+decremented in the database, so concurrent submissions from machines
+in the same group don't lose updates. Rows whose count drops to zero
+are left in place (and ignored) until the next rebuild.
+"""
+
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+import server.utils
+from inventory.models import ApplicationInstallCount, InventoryItem
+from server.models import Machine, MachineGroup
+
+
+BATCH_SIZE = 500
+
+
+def get_item_key(application_id, version, path):
+    return (application_id, version, path or '')
+
+
+def update_install_counts(changes):
+    """Apply changes in install counts to the rollup.
+
+    Args:
+        changes (dict): (machine group ID, application ID, version,
+            path) to the number of installs added, or removed if
+            negative.
+    """
+    changes = {key: change for key, change in changes.items() if change}
+    if not changes:
+        return
+
+    with transaction.atomic():
+        ids = _get_rollup_ids(changes)
+        missing = [key for key in changes if key not in ids]
+        if missing:
+            server.utils.bulk_create(
+                ApplicationInstallCount,
+                (ApplicationInstallCount(
+                    machine_group_id=machine_group_id, application_id=application_id,
+                    version=version, path=path)
+                 for machine_group_id, application_id, version, path in missing),
+                ignore_conflicts=True)
+            ids.update(_get_rollup_ids(missing))
+
+        # Most changes are +1 or -1, so this is usually one or two
+        # UPDATEs, however many rows they touch.
+        by_change = defaultdict(list)
+        for key, change in changes.items():
+            by_change[change].append(ids[key])
+        for change, pks in by_change.items():
+            for start in range(0, len(pks), BATCH_SIZE):
+                ApplicationInstallCount.objects.filter(
+                    pk__in=pks[start:start + BATCH_SIZE]).update(count=F('count') + change)
+
+
+def get_machine_install_counts(machines):
+    """Count the InventoryItems of some machines, for the rollup.
+
+    Args:
+        machines (QuerySet): Machines to count.
+
+    Returns:
+        Counter of (machine group ID, application ID, version, path) to
+        number of installs.
+    """
+    items = (
+        InventoryItem.objects
+        .filter(machine__in=machines)
+        .order_by()
+        .values_list('machine__machine_group', 'application', 'version', 'path')
+        .annotate(installs=Count('id')))
+    counts = Counter()
+    for machine_group_id, application_id, version, path, installs in items:
+        counts[(machine_group_id, *get_item_key(application_id, version, path))] += installs
+    return counts
+
+
+def remove_machines(machines):
+    """Subtract some machines' installs from the rollup.
+
+    For use before machines are undeployed with a queryset update,
+    which doesn't send signals.
+    """
+    counts = get_machine_install_counts(machines)
+    update_install_counts({key: -installs for key, installs in counts.items()})
+
+
+def remove_deleted_machines(machines):
+    """Subtract machines that are about to be deleted from the rollup.
+
+    Deleting machines one by one through the `pre_delete` receiver
+    costs a few queries per machine. This does a whole queryset of
+    them at once, and marks them undeployed, which the receiver skips.
+    """
+    # Groups being deleted take their rollup rows with them.
+    remove_machines(machines.filter(deployed=True, machine_group__pending_deletion=False))
+    machines.update(deployed=False)
+
+
+def rebuild_install_counts():
+    """Replace the whole rollup with counts of the current inventory.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    counts = get_machine_install_counts(Machine.objects.filter(deployed=True))
+    with transaction.atomic():
+        ApplicationInstallCount.objects.all().delete()
+        server.utils.bulk_create(
+            ApplicationInstallCount,
+            (ApplicationInstallCount(
+                machine_group_id=machine_group_id, application_id=application_id,
+                version=version, path=path, count=installs)
+             for (machine_group_id, application_id, version, path), installs in counts.items()))
+    return len(counts)
+
+
+def _get_rollup_ids(keys):
+    keys = set(keys)
+    machine_group_ids = {key[0] for key in keys}
+    application_ids = sorted({key[1] for key in keys})
+    ids = {}
+    for start in range(0, len(application_ids), BATCH_SIZE):
+        rows = ApplicationInstallCount.objects.filter(
+            machine_group__in=machine_group_ids,
+            application__in=application_ids[start:start + BATCH_SIZE]).values_list(
+                'id', 'machine_group', 'application', 'version', 'path')
+        for pk, *key in rows:
+            if tuple(key) in keys:
+                ids[tuple(key)] = pk
+    return ids
+
+
+@receiver(pre_save, sender=Machine)
+def record_machine_placement(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Only look up the machine's old group and deployment when they may
+    # be changing; checkins only save the fields that changed.
+    instance._install_count_placement = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {'machine_group', 'deployed'} & set(update_fields):
+        return
+    instance._install_count_placement = (
+        Machine.objects.filter(pk=instance.pk).values_list('machine_group', 'deployed').first())
+
+
+@receiver(post_save, sender=Machine)
+def move_machine_install_counts(sender, instance, **kwargs):
+    old = getattr(instance, '_install_count_placement', None)
+    instance._install_count_placement = None
+    if old is None or old == (instance.machine_group_id, instance.deployed):
+        return
+
+    old_group, old_deployed = old
+    counts = get_machine_install_counts(Machine.objects.filter(pk=instance.pk))
+    changes = Counter()
+    for (_, *key), installs in counts.items():
+        if old_deployed:
+            changes[(old_group, *key)] -= installs
+        if instance.deployed:
+            changes[(instance.machine_group_id, *key)] += installs
+    update_install_counts(changes)
+
+
+@receiver(pre_delete, sender=Machine)
+def remove_machine_install_counts(sender, instance, **kwargs):
+    # Groups being deleted take their rollup rows with them.
+    if not instance.deployed or MachineGroup.objects.filter(
+            pk=instance.machine_group_id, pending_deletion=True).exists():
+        return
+    remove_machines(Machine.objects.filter(pk=instance.pk))
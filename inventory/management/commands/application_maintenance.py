@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand, CommandError
 
 import server.utils
 from inventory.models import Application
+from server.deletion import delete_in_batches
 
 
 class Command(BaseCommand):
@@ -22,6 +23,7 @@ class Command(BaseCommand):
         sleep(sleep_time)
 
         # # Clean up orphaned Application objects.
-        Application.objects.filter(inventoryitem=None).delete()
+        delete_in_batches(
+            Application.objects.filter(inventoryitem=None), checkpoint='orphaned_applications')
 
         gc.collect()
@@ -0,0 +1,14 @@
+"""Rebuilds the application install count rollup from the inventory."""
+
+
+from django.core.management.base import BaseCommand
+
+from inventory.install_counts import rebuild_install_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the application install count rollup from the inventory.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_install_counts()
+        self.stdout.write(f'Rebuilt {rows} application install counts.')
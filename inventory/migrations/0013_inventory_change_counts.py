@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_auto_20210731_1945'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='added',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='changed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='removed',
+            field=models.IntegerField(default=0),
+        ),
+    ]
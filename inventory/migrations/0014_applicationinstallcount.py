@@ -0,0 +1,55 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:40
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def populate_install_counts(apps, schema_editor):
+    """Count the existing InventoryItems of deployed machines."""
+    ApplicationInstallCount = apps.get_model('inventory', 'ApplicationInstallCount')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    items = (
+        InventoryItem.objects
+        .filter(machine__deployed=True)
+        .order_by()
+        .values_list('machine__machine_group', 'application', 'version', 'path')
+        .annotate(installs=Count('id')))
+    counts = Counter()
+    # NULL and blank paths are counted together.
+    for machine_group_id, application_id, version, path, installs in items.iterator():
+        counts[(machine_group_id, application_id, version, path or '')] += installs
+    ApplicationInstallCount.objects.bulk_create(
+        (ApplicationInstallCount(
+            machine_group_id=machine_group_id, application_id=application_id,
+            version=version, path=path, count=installs)
+         for (machine_group_id, application_id, version, path), installs in counts.items()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0102_deletionjob'),
+        ('inventory', '0013_inventory_change_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationInstallCount',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=64)),
+                ('path', models.TextField(blank=True)),
+                ('count', models.IntegerField(default=0)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='install_counts', to='inventory.application')),
+                ('machine_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='application_install_counts', to='server.machinegroup')),
+            ],
+            options={
+                'unique_together': {('application', 'machine_group', 'version', 'path')},
+            },
+        ),
+        migrations.RunPython(populate_install_counts, migrations.RunPython.noop),
+    ]
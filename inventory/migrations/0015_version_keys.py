@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_applicationinstallcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applicationinstallcount',
+            name='version_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='version_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from server.models import *
+from utils.versions import KEY_LENGTH, get_version_key
 
 
 class Application(models.Model):
@@ -61,6 +62,10 @@ class Inventory(models.Model):
     machine = models.OneToOneField(Machine, on_delete=models.CASCADE)
     datestamp = models.DateTimeField(auto_now=True)
     sha256hash = models.CharField(max_length=64)
+    # How the machine's InventoryItems changed with its last submission.
+    added = models.IntegerField(default=0)
+    removed = models.IntegerField(default=0)
+    changed = models.IntegerField(default=0)
 
     class Meta:
         ordering = ['datestamp']
@@ -71,7 +76,49 @@ class InventoryItem(models.Model):
     machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
     application = models.ForeignKey(Application, on_delete=models.CASCADE)
     version = models.CharField(db_index=True, max_length=64)
+    # Sortable key of the version; see utils.versions.
+    version_key = models.CharField(db_index=True, max_length=KEY_LENGTH, default='', editable=False)
     path = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['application', '-version']
+
+    def save(self, *args, **kwargs):
+        self.version_key = get_version_key(self.version)
+        super(InventoryItem, self).save(*args, **kwargs)
+
+    @classmethod
+    def prepare_for_bulk_create(cls, items):
+        for item in items:
+            item.version_key = get_version_key(item.version)
+
+
+class ApplicationInstallCount(models.Model):
+    """How many times an Application is installed in a MachineGroup.
+
+    Counts the InventoryItems of deployed machines, broken down by
+    version and path; sum them for per-group totals. These are kept up
+    to date as inventory is submitted and machines move between groups
+    by `inventory.install_counts`, and can be rebuilt from scratch with
+    the `rebuild_install_counts` management command.
+    """
+    id = models.BigAutoField(primary_key=True)
+    application = models.ForeignKey(
+        Application, related_name='install_counts', on_delete=models.CASCADE)
+    machine_group = models.ForeignKey(
+        MachineGroup, related_name='application_install_counts', on_delete=models.CASCADE)
+    version = models.CharField(max_length=64)
+    version_key = models.CharField(max_length=KEY_LENGTH, default='', editable=False)
+    path = models.TextField(blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('application', 'machine_group', 'version', 'path')
+
+    @classmethod
+    def prepare_for_bulk_create(cls, rows):
+        for row in rows:
+            row.version_key = get_version_key(row.version)
+
+    def __str__(self):
+        return f'{self.application} {self.version} in {self.machine_group}: {self.count}'
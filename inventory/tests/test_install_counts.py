@@ -0,0 +1,132 @@
+"""Tests for the application install count rollup."""
+
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from inventory import install_counts, views
+from inventory.models import Application, ApplicationInstallCount
+from inventory.tests.test_inventory import submit_inventory
+from server import deletion
+from server.models import BusinessUnit, MachineGroup, Machine, User
+
+
+@override_settings(BASIC_AUTH=False)
+class InstallCountTestCase(TestCase):
+    """Test the install count rollup is kept up to date."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        views.clear_application_id_cache()
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+        self.other_machine = Machine.objects.get(serial='C1DEADBEEF')
+        self.inventory = [
+            {'name': 'Safari', 'bundleid': 'com.apple.Safari', 'version': '14.0', 'path': '/Applications/Safari.app'},
+            {'name': 'Taco', 'bundleid': 'com.example.taco', 'version': '1.0'}]
+        submit_inventory(self.machine, self.inventory)
+        submit_inventory(self.other_machine, self.inventory[:1])
+
+    def get_counts(self):
+        return {
+            (row.machine_group_id, row.application.name, row.version, row.path): row.count
+            for row in ApplicationInstallCount.objects.filter(count__gt=0)}
+
+    def get_installs(self, group_type, group):
+        return {
+            application.name: application.install_count
+            for application in views.get_installed_applications(group_type, group)}
+
+    def test_submit_updates_counts(self):
+        self.assertEqual(self.get_counts(), {
+            (1, 'Safari', '14.0', '/Applications/Safari.app'): 2, (1, 'Taco', '1.0', ''): 1})
+
+        self.inventory[0]['version'] = '15.0'
+        del self.inventory[1]
+        submit_inventory(self.machine, self.inventory)
+        self.assertEqual(self.get_counts(), {
+            (1, 'Safari', '14.0', '/Applications/Safari.app'): 1,
+            (1, 'Safari', '15.0', '/Applications/Safari.app'): 1})
+
+    def test_machine_changes_update_counts(self):
+        self.machine.machine_group = MachineGroup.objects.get(pk=2)
+        self.machine.save()
+        self.assertEqual(self.get_counts(), {
+            (1, 'Safari', '14.0', '/Applications/Safari.app'): 1,
+            (2, 'Safari', '14.0', '/Applications/Safari.app'): 1, (2, 'Taco', '1.0', ''): 1})
+
+        self.machine.deployed = False
+        self.machine.save(update_fields=['deployed'])
+        self.assertEqual(self.get_counts(), {(1, 'Safari', '14.0', '/Applications/Safari.app'): 1})
+
+        self.other_machine.delete()
+        self.assertEqual(self.get_counts(), {})
+
+    def test_batched_delete_updates_counts_once(self):
+        machines = Machine.objects.filter(pk__in=[self.machine.pk, self.other_machine.pk])
+        with CaptureQueriesContext(connection) as queries:
+            deletion.delete_in_batches(
+                machines, before_delete=install_counts.remove_deleted_machines)
+        self.assertEqual(self.get_counts(), {})
+        # The rollup is updated for the whole batch, with one UPDATE
+        # per distinct change (-2 for Safari, -1 for Taco), rather than
+        # per machine.
+        rollup_updates = [
+            q for q in queries
+            if q['sql'].startswith('UPDATE "inventory_applicationinstallcount"')]
+        self.assertEqual(len(rollup_updates), 2)
+
+    def test_rebuild_matches(self):
+        self.machine.machine_group = MachineGroup.objects.get(pk=2)
+        self.machine.save()
+        counts = self.get_counts()
+        ApplicationInstallCount.objects.update(count=0)
+        install_counts.rebuild_install_counts()
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_installed_applications(self):
+        self.assertEqual(self.get_installs('all', None), {'Safari': 2, 'Taco': 1})
+        self.assertEqual(self.get_installs('business_unit', BusinessUnit.objects.get(pk=1)), {'Safari': 2, 'Taco': 1})
+        self.assertEqual(self.get_installs('machine_group', MachineGroup.objects.get(pk=2)), {})
+        self.assertEqual(self.get_installs('machine', self.other_machine), {'Safari': 1})
+
+    def test_detail_queries_constant(self):
+        user = User.objects.create(username='test')
+        BusinessUnit.objects.get(pk=1).users.add(user)
+        self.client.force_login(user)
+        url = f'/inventory/application/machine_group/1/{Application.objects.get(name="Safari").pk}/'
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+
+        self.inventory[0]['version'] = '9.0'
+        self.inventory[0]['path'] = '/Applications/Old Safari.app'
+        submit_inventory(self.machine, self.inventory)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(
+            [version['version'] for version in response.context['versions']], ['9.0', '14.0'])
+
+    def test_views_show_counts(self):
+        user = User.objects.create(username='test')
+        profile = user.userprofile
+        profile.level = 'GA'
+        profile.save()
+        self.client.force_login(user)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+        response = self.client.get('/inventory/business_unit/1/', **ajax)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['recordsTotal'], 2)
+        safari = Application.objects.get(name='Safari')
+        response = self.client.get(f'/inventory/application/business_unit/1/{safari.pk}/')
+        self.assertEqual(response.context['install_count'], 2)
+        self.assertEqual(
+            response.context['versions'], [{'version': '14.0', 'version_key': '214.10', 'count': 2}])
+        self.assertEqual(response.context['paths'], [{'path': '/Applications/Safari.app', 'count': 2}])
+        response = self.client.get(f'/inventory/list/all/0/{safari.pk}/', **ajax)
+        self.assertEqual(len(response.json()['data']), 2)
+        response = self.client.get('/inventory/csv_export/machine_group/1/')
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Safari,com.apple.Safari,,2', content)
@@ -1,9 +1,16 @@
 """Tests for the Inventory App"""
 
 
-from django.test import TestCase
+import base64
+import plistlib
 
-from server.models import BusinessUnit, MachineGroup, Machine, User, UserProfile
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from inventory import views
+from inventory.models import Application, Inventory, InventoryItem
+from server.models import BusinessUnit, Machine, User, UserProfile
 
 
 class AccessTestCase(TestCase):
@@ -101,3 +108,97 @@ class ApplicationDetailTestCase(TestCase):
         self.assertIn('count', response.context['versions'][0])
         self.assertIn('version', response.context['versions'][0])
         self.assertEqual(response.context['application'].bundlename, 'TacoFortress')
+
+
+def submit_inventory(machine, inventory):
+    data = base64.b64encode(plistlib.dumps(inventory)).decode()
+    return Client().post('/inventory/submit/', {'serial': machine.serial, 'base64inventory': data})
+
+
+@override_settings(BASIC_AUTH=False)
+class InventorySubmitTestCase(TestCase):
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        views.clear_application_id_cache()
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def test_applications_resolved(self):
+        existing = Application.objects.create(name='Safari', bundleid='com.apple.Safari', bundlename='Safari')
+        inventory = [
+            {'name': 'Safari', 'bundleid': 'com.apple.Safari', 'CFBundleName': 'Safari',
+             'version': '14.0', 'path': '/Applications/Safari.app'},
+            {'name': 'Safari', 'bundleid': 'com.apple.Safari', 'CFBundleName': 'Safari',
+             'version': '13.0', 'path': '/Volumes/Old/Safari.app'},
+            {'name': 'Taco', 'bundleid': 'com.example.taco', 'version': '1.0'},
+            {'name': 'Printer', 'bundleid': 'com.apple.print.PrinterProxy', 'version': '1.0'}]
+        response = submit_inventory(self.machine, inventory)
+        self.assertEqual(response.status_code, 200)
+
+        items = self.machine.inventoryitem_set.order_by('version')
+        self.assertEqual(
+            [(item.application.name, item.version) for item in items],
+            [('Taco', '1.0'), ('Safari', '13.0'), ('Safari', '14.0')])
+        self.assertEqual(items[1].application, existing)
+        self.assertEqual(Application.objects.get(name='Taco').bundlename, '')
+        self.assertFalse(Application.objects.filter(name='Printer').exists())
+
+    def test_inventory_synced(self):
+        inventory = [
+            {'name': 'Safari', 'bundleid': 'com.apple.Safari', 'version': '14.0', 'path': '/Applications/Safari.app'},
+            {'name': 'Taco', 'bundleid': 'com.example.taco', 'version': '1.0', 'path': '/Applications/Taco.app'},
+            {'name': 'Nachos', 'bundleid': 'com.example.nachos', 'version': '1.0', 'path': '/Applications/Nachos.app'}]
+        submit_inventory(self.machine, inventory)
+        inventory_meta = Inventory.objects.get(machine=self.machine)
+        self.assertEqual((inventory_meta.added, inventory_meta.removed, inventory_meta.changed), (3, 0, 0))
+        safari = self.machine.inventoryitem_set.get(application__name='Safari')
+        taco = self.machine.inventoryitem_set.get(application__name='Taco')
+
+        inventory[1]['version'] = '2.0'
+        inventory[2] = {'name': 'Burrito', 'bundleid': 'com.example.burrito', 'version': '1.0'}
+        submit_inventory(self.machine, inventory)
+        inventory_meta.refresh_from_db()
+        self.assertEqual((inventory_meta.added, inventory_meta.removed, inventory_meta.changed), (1, 1, 1))
+        items = {item.application.name: item for item in self.machine.inventoryitem_set.all()}
+        self.assertEqual(set(items), {'Safari', 'Taco', 'Burrito'})
+        self.assertEqual(items['Safari'].pk, safari.pk)
+        self.assertEqual((items['Taco'].pk, items['Taco'].version), (taco.pk, '2.0'))
+
+
+@override_settings(BASIC_AUTH=False)
+class InventorySubmitTransactionTestCase(TransactionTestCase):
+    """Test inventory submissions that depend on transactions committing."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        views.clear_application_id_cache()
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def test_applications_cached(self):
+        inventory = [
+            {'name': 'Safari', 'bundleid': 'com.apple.Safari', 'version': '14.0'},
+            {'name': 'Taco', 'bundleid': 'com.example.taco', 'version': '1.0'}]
+        submit_inventory(self.machine, inventory)
+        # Applications are looked up in the cache the second time.
+        with CaptureQueriesContext(connection) as queries:
+            submit_inventory(self.machine, inventory)
+        self.assertFalse([q for q in queries if 'inventory_application' in q['sql']])
+        self.assertEqual(InventoryItem.objects.filter(machine=self.machine).count(), 2)
+
+    def test_rolled_back_applications_not_cached(self):
+        key = ('Taco', 'com.example.taco', '')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            views.get_application_ids([key])
+            raise RuntimeError
+        self.assertIsNone(views.APPLICATION_ID_CACHE.get(key))
+        self.assertFalse(Application.objects.exists())
+
+    def test_deleted_application_recreated(self):
+        """Test a cached application deleted by another process is recreated."""
+        inventory = [{'name': 'Taco', 'bundleid': 'com.example.taco', 'version': '1.0'}]
+        submit_inventory(self.machine, inventory)
+        Application.objects.all().delete()
+        self.assertEqual(submit_inventory(self.machine, inventory).status_code, 200)
+        self.assertEqual(self.machine.inventoryitem_set.get().application.name, 'Taco')
@@ -3,11 +3,11 @@ import collections
 import copy
 import hashlib
 import itertools
-from distutils.version import LooseVersion
 from urllib.parse import quote
 
 # Django
-from django.db.models import Q, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Count, Sum
 from django.http import HttpResponse, HttpResponseNotFound
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
@@ -19,22 +19,32 @@ from django.views.generic import DetailView, View
 # 3rd Party Django
 from datatableview import Datatable
 from datatableview.datatables import cache_types
-from datatableview.columns import DisplayColumn, IntegerColumn
+from datatableview.columns import IntegerColumn
 from datatableview.views import DatatableView
 
 # local Django
 import server.utils
 import utils.csv
+from inventory import install_counts
 from inventory.models import Application, Inventory, InventoryItem
-from sal.decorators import (class_login_required, class_access_required, key_auth_required)
+from sal.decorators import (
+    admission_control, class_login_required, class_access_required, key_auth_required)
 from server.models import BusinessUnit, MachineGroup, Machine
 from utils import text_utils
+from utils.caching import LRUCache
+from utils.versions import get_version_key
 
 
 INVENTORY_PATTERN = server.utils.get_setting('inventory_exclusion_pattern')
 FILTER_VIRTUAL = server.utils.get_setting('filter_proxied_virtualization_apps', True)
 SHOW_INSTALL_COUNTS = server.utils.get_setting('show_inventory_install_counts', True)
 
+# IDs of the Applications recently submitted to this process, keyed by
+# (name, bundleid, bundlename). Many machines report the same apps, so
+# most uploads are resolved entirely from here.
+APPLICATION_ID_CACHE = LRUCache(maxsize=20000, ttl=300)
+APPLICATION_BATCH_SIZE = 500
+
 ApplicationTuple = collections.namedtuple(
     'Application', ['name', 'bundleid', 'bundlename', 'install_count'])
 
@@ -188,13 +198,9 @@ class CSVResponseMixin():
 
 class InventoryList(Datatable):
 
-    # Specifying no source means we cannot sort on this column; however
-    # the source value would be the total number of inventoryitem
-    # records, NOT the number returned by the get_install_count
-    # processor which filters by group_type. Without greatly increasing
-    # the processing time for the view, we therefore cannot sort by
-    # install count.
-    install_count = DisplayColumn("Install Count", source=None, processor='get_install_count')
+    # The queryset is annotated with the number of the application's
+    # installs on each machine, filtered by the view's field type.
+    install_count = IntegerColumn("Install Count", source='install_count')
 
     class Meta:
         columns = ['hostname', 'serial', 'last_checkin', 'console_user', 'install_count']
@@ -210,16 +216,6 @@ class InventoryList(Datatable):
 
         return f'<a href="{url}">{instance.hostname}</a>'
 
-    def get_install_count(self, instance, **kwargs):
-        queryset = instance.inventoryitem_set.filter(application=kwargs['view'].application)
-        field_type = kwargs['view'].field_type
-        field_value = kwargs['view'].field_value
-        if field_type == "path":
-            queryset = queryset.filter(path=field_value)
-        elif field_type == "version":
-            queryset = queryset.filter(version=field_value)
-        return queryset.count()
-
     def format_date(self, instance, **kwargs):
         return instance.last_checkin.strftime("%Y-%m-%d %H:%M:%S")
 
@@ -252,7 +248,10 @@ class InventoryListView(DatatableQuerystringMixin, DatatableView, GroupMixin):
             kwargs['inventoryitem__{}'.format(self.field_type)] = self.field_value
         field_q = Q(**kwargs)
 
-        return queryset.filter(application_q, field_q).distinct()
+        # Filtering before annotating limits the count to the matching
+        # items.
+        return queryset.filter(application_q, field_q).annotate(
+            install_count=Count('inventoryitem'))
 
     def get_context_data(self, **kwargs):
         context = super(InventoryListView, self).get_context_data(**kwargs)
@@ -279,7 +278,7 @@ class ApplicationListView(DatatableView, GroupMixin):
 
     class datatable_class(Datatable):
         install_count = IntegerColumn(
-            "Install Count", source='inventoryitem_set__count', processor='get_install_count'
+            "Install Count", source='install_count', processor='get_install_count'
         )
 
         class Meta:
@@ -303,9 +302,16 @@ class ApplicationListView(DatatableView, GroupMixin):
             link_kwargs['application_id'] = instance.pk
             url = reverse("inventory_list", kwargs=link_kwargs)
             anchor = '<a href="{}"><span class="badge">{}</span></a>'.format(
-                url, instance.inventoryitem_set.count())
+                url, instance.install_count)
             return anchor
 
+        def expand_object_list_from_cache(self, cache_type, cached_data):
+            # The default expansion requeries the model by primary key,
+            # which would lose the install_count annotation.
+            if cache_type == cache_types.PK_LIST:
+                return self.object_list.filter(pk__in=cached_data)
+            return super().expand_object_list_from_cache(cache_type, cached_data)
+
     def get_datatable(self):
         datatable = super().get_datatable()
         # Add the install count column dynamically.
@@ -316,7 +322,8 @@ class ApplicationListView(DatatableView, GroupMixin):
         return datatable
 
     def get_queryset(self):
-        queryset = self.filter_queryset_by_group(self.model.objects)
+        queryset = get_installed_applications(
+            self.kwargs['group_type'], self.get_group_instance())
 
         crufty_bundles = []
 
@@ -374,45 +381,42 @@ class ApplicationDetailView(DetailView, GroupMixin):
     template_name = "inventory/application_detail.html"
 
     def get_context_data(self, **kwargs):
-        details = self._get_filtered_queryset()
-        versions, paths = self._get_unique_items(details)
         context = super(ApplicationDetailView, self).get_context_data(**kwargs)
-        return self._build_context_data(context, details, versions, paths)
-
-    def _get_filtered_queryset(self):
-        """Filter results based on URL parameters / user access."""
-        return self.filter_queryset_by_group(self.object.inventoryitem_set)
-
-    def _get_unique_items(self, details):
-        """Use optimized DB methods for getting unique items if possible."""
-        if server.utils.is_postgres():
-            versions = (details
-                        .order_by("version")
-                        .distinct("version")
-                        .values_list("version", flat=True))
-            paths = details.order_by("path").distinct("path").values_list("path", flat=True)
-        else:
-            details = details.values()
-            versions = {item["version"] for item in details}
-            paths = {item["path"] for item in details}
-
-            # We need to sort the versions for non-Postgres.
-            versions = sorted(list(versions), key=lambda v: LooseVersion(v))
-
-        return (versions, paths)
-
-    def _build_context_data(self, context, details, versions, paths):
+        installs, count = self._get_installs()
         # Get list of dicts of installed versions and number of installs
         # for each.
-        context["versions"] = [
-            {"version": version, "count": details.filter(version=version).count()} for version in
-            versions]
+        context["versions"] = list(
+            installs.values('version', 'version_key').annotate(count=count).order_by('version_key'))
         # Get list of dicts of installation locations and number of
         # installs for each.
-        context["paths"] = [
-            {"path": path, "count": details.filter(path=path).count()} for path in paths]
+        context["paths"] = list(installs.values('path').annotate(count=count).order_by('path'))
         # Get the total number of installations.
-        context["install_count"] = details.count()
+        context["install_count"] = sum(version['count'] for version in context["versions"])
+        return self._build_context_data(context)
+
+    def _get_installs(self):
+        """Get the rows to count installs from, filtered to the group.
+
+        Single machines count their InventoryItems; anything larger
+        uses the ApplicationInstallCount rollup.
+
+        Returns:
+            Tuple of an unordered queryset and the aggregate that counts
+            its installs.
+        """
+        if self.kwargs['group_type'] == 'machine':
+            installs = self.filter_queryset_by_group(self.object.inventoryitem_set)
+            return installs.order_by(), Count('id')
+
+        self.group_instance = self.get_group_instance()
+        installs = self.object.install_counts.filter(count__gt=0)
+        if self.kwargs['group_type'] == 'business_unit':
+            installs = installs.filter(machine_group__business_unit=self.group_instance)
+        elif self.kwargs['group_type'] == 'machine_group':
+            installs = installs.filter(machine_group=self.group_instance)
+        return installs.order_by(), Sum('count')
+
+    def _build_context_data(self, context):
         # Add in access data.
         context["group_type"] = self.kwargs['group_type']
         context["group_id"] = self.kwargs['group_id']
@@ -452,12 +456,10 @@ class CSVExportView(CSVResponseMixin, GroupMixin, View):
                 self.components.append(group_id)
 
             fields = APPLICATION_FIELDS
-            # The data we're retuurning is Applications, so get a
-            # queryset of them to remove repetition of InventoryItems.
-            applications = Application.objects.filter(pk__in=queryset.values('application__pk'))
-            # Use the helper function to add attrs that wouldn't
-            # normally be on this model (i.e. install count).
-            data = (self.get_application_entry(item, queryset) for item in applications)
+            applications = get_installed_applications(group_type, self.group_instance)
+            data = (
+                ApplicationTuple(item.name, item.bundleid, item.bundlename, item.install_count)
+                for item in applications.iterator())
 
         else:
             # Inventory List for one application.
@@ -479,17 +481,40 @@ class CSVExportView(CSVResponseMixin, GroupMixin, View):
 
         return utils.csv.get_csv_response(data, fields, self.get_csv_filename())
 
-    def get_application_entry(self, item, queryset):
-        return ApplicationTuple(
-            item.name,
-            item.bundleid,
-            item.bundlename,
-            queryset.filter(application=item).count())
+
+def get_installed_applications(group_type, group_instance):
+    """Get the Applications installed on a group's deployed machines.
+
+    Counts for a single machine are taken from its InventoryItems; for
+    anything larger they come from the ApplicationInstallCount rollup.
+
+    Args:
+        group_type (str): One of: 'all', 'business_unit', 'machine',
+            or 'machine_group'.
+        group_instance: The group, or None for 'all'.
+
+    Returns:
+        QuerySet of Applications, annotated with their install_count.
+    """
+    if group_type == 'machine':
+        return Application.objects.filter(
+            inventoryitem__machine=group_instance,
+            inventoryitem__machine__deployed=True).annotate(install_count=Count('inventoryitem'))
+
+    kwargs = {'install_counts__count__gt': 0}
+    if group_type == 'business_unit':
+        kwargs['install_counts__machine_group__business_unit'] = group_instance
+    elif group_type == 'machine_group':
+        kwargs['install_counts__machine_group'] = group_instance
+    # Filtering before annotating limits the sum to the group's rows.
+    return Application.objects.filter(**kwargs).annotate(
+        install_count=Sum('install_counts__count'))
 
 
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control('heavy')
 def inventory_submit(request):
     # list of bundleids to ignore
     bundleid_ignorelist = ['com.apple.print.PrinterProxy']
@@ -523,39 +548,139 @@ def inventory_submit(request):
                 except Inventory.DoesNotExist:
                     inventory_meta = Inventory(machine=machine)
                 inventory_meta.sha256hash = hashlib.sha256(inventory_bytes).hexdigest()
-                # clear existing inventoryitems
-                machine.inventoryitem_set.all().delete()
-                # insert current inventory items
-                inventory_items_to_be_created = []
-                for item in inventory_list:
-                    app, _ = Application.objects.get_or_create(
-                        bundleid=item.get("bundleid", ""),
-                        name=item.get("name", ""),
-                        bundlename=item.get("CFBundleName", ""))
-                    # skip items in bundleid_ignorelist.
-                    if not item.get('bundleid') in bundleid_ignorelist:
-                        i_item = InventoryItem(
-                            application=app,
-                            version=item.get("version", ""),
-                            path=item.get('path', ''),
-                            machine=machine)
-                        if server.utils.is_postgres():
-                            inventory_items_to_be_created.append(i_item)
-                        else:
-                            i_item.save()
+                # sync inventoryitems with the current inventory,
+                # skipping items in bundleid_ignorelist.
+                inventory_list = [
+                    item for item in inventory_list
+                    if not item.get('bundleid') in bundleid_ignorelist]
                 machine.last_inventory_update = timezone.now()
-                inventory_meta.save()
 
-                if server.utils.is_postgres():
-                    InventoryItem.objects.bulk_create(inventory_items_to_be_created)
+                try:
+                    counts = sync_inventory_items(machine, inventory_list)
+                except IntegrityError:
+                    # An application this process had cached has since
+                    # been deleted as an orphan, so look them all up
+                    # again.
+                    clear_application_id_cache()
+                    counts = sync_inventory_items(machine, inventory_list)
+                inventory_meta.added = counts['inserted']
+                inventory_meta.removed = counts['deleted']
+                inventory_meta.changed = counts['updated']
+                inventory_meta.save()
 
             return HttpResponse("Inventory submitted for %s.\n" % submission.get('serial'))
 
     return HttpResponse("No inventory submitted.\n")
 
 
+def sync_inventory_items(machine, inventory_list):
+    """Update a machine's InventoryItems to match its submitted inventory.
+
+    Items are matched by application and path. Only new items are
+    inserted and only removed ones deleted; items whose version changed
+    are updated in place. The install count rollup is updated with the
+    difference, if the machine is deployed.
+
+    Returns:
+        dict of 'inserted', 'updated', and 'deleted' item counts.
+    """
+    items = get_inventory_items(machine, inventory_list)
+    machines = Machine.objects.filter(pk=machine.pk)
+    with transaction.atomic():
+        if machine.deployed:
+            old_counts = install_counts.get_machine_install_counts(machines)
+        counts = server.utils.reconcile(
+            machine.inventoryitem_set.all(), items,
+            key_fields=('application_id', 'path'), value_fields=('version', 'version_key'))
+        if machine.deployed and any(counts.values()):
+            changes = install_counts.get_machine_install_counts(machines)
+            changes.subtract(old_counts)
+            install_counts.update_install_counts(changes)
+    return counts
+
+
+def get_inventory_items(machine, inventory_list):
+    """Build unsaved InventoryItems for a machine's submitted inventory."""
+    application_ids = get_application_ids(
+        _get_application_key(item) for item in inventory_list)
+    return [
+        InventoryItem(
+            application_id=application_ids[_get_application_key(item)],
+            version=item.get("version", ""),
+            version_key=get_version_key(item.get("version", "")),
+            path=item.get('path', ''),
+            machine=machine)
+        for item in inventory_list]
+
+
+def get_application_ids(keys):
+    """Get the IDs of Applications, creating any that don't exist yet.
+
+    Keys recently resolved by this process are answered from the cache.
+    The rest are looked up together, and missing Applications are
+    inserted in bulk, tolerating other processes inserting the same
+    ones at the same time. They're only cached once the transaction
+    commits, so IDs from a rolled back insert are never reused.
+
+    Args:
+        keys (iterable of tuple): (name, bundleid, bundlename) of each
+            Application.
+
+    Returns:
+        dict of key to Application ID.
+    """
+    application_ids = {}
+    missing = []
+    for key in set(keys):
+        application_id = APPLICATION_ID_CACHE.get(key)
+        if application_id is None:
+            missing.append(key)
+        else:
+            application_ids[key] = application_id
+
+    if missing:
+        found = _find_application_ids(missing)
+        new = [key for key in missing if key not in found]
+        if new:
+            server.utils.bulk_create(
+                Application,
+                (Application(name=name, bundleid=bundleid, bundlename=bundlename)
+                 for name, bundleid, bundlename in new),
+                ignore_conflicts=True)
+            found.update(_find_application_ids(new))
+        server.utils.cache_on_commit(APPLICATION_ID_CACHE, found)
+        application_ids.update(found)
+
+    return application_ids
+
+
+def clear_application_id_cache():
+    APPLICATION_ID_CACHE.clear()
+
+
+def _find_application_ids(keys):
+    # Query by name alone, which is indexed, and match the whole key
+    # here; that's simpler for the database than OR-ing every key.
+    keys = set(keys)
+    names = sorted({name for name, _, _ in keys})
+    found = {}
+    for start in range(0, len(names), APPLICATION_BATCH_SIZE):
+        applications = Application.objects.filter(
+            name__in=names[start:start + APPLICATION_BATCH_SIZE]).values_list(
+                'id', 'name', 'bundleid', 'bundlename')
+        for application_id, *key in applications:
+            if tuple(key) in keys:
+                found[tuple(key)] = application_id
+    return found
+
+
+def _get_application_key(item):
+    return (item.get("name", ""), item.get("bundleid", ""), item.get("CFBundleName", ""))
+
+
 @csrf_exempt
 @key_auth_required
+@admission_control('light')
 def inventory_hash(request, serial):
     sha256hash = ""
     machine = None
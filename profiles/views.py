@@ -24,6 +24,7 @@ from utils import text_utils
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control('heavy')
 def submit_profiles(request):
     submission = request.POST
     serial = submission.get('serial').upper()
@@ -60,14 +61,9 @@ def submit_profiles(request):
                     verification_state=profile.get('ProfileVerificationState', ''),
                     install_date=parsed_date
                 )
+                profiles_to_be_added.append(profile_item)
 
-                if utils.is_postgres():
-                    profiles_to_be_added.append(profile_item)
-                else:
-                    profile_item.save()
-
-            if utils.is_postgres():
-                Profile.objects.bulk_create(profiles_to_be_added)
+            utils.bulk_create(Profile, profiles_to_be_added)
 
             stored_profiles = machine.profile_set.all()
             payloads_to_save = []
@@ -86,15 +82,10 @@ def submit_profiles(request):
                                 uuid=payload.get('PayloadUUID', ''),
                                 payload_type=payload.get('PayloadType', '')
                             )
-
-                            if utils.is_postgres():
-                                payloads_to_save.append(payload_item)
-                            else:
-                                payload_item.save()
+                            payloads_to_save.append(payload_item)
                 break
 
-            if utils.is_postgres():
-                Payload.objects.bulk_create(payloads_to_save)
+            utils.bulk_create(Payload, payloads_to_save)
 
             utils.run_profiles_plugin_processing(machine, profiles_list)
 
@@ -3,12 +3,16 @@
 
 import base64
 import logging
+import threading
+import time
 from functools import wraps
 
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import HttpResponse
 from django.http.response import Http404, HttpResponseServerError
 from django.shortcuts import get_object_or_404, redirect
@@ -17,9 +21,17 @@ from django.utils.decorators import method_decorator
 from django.views.generic import View
 
 from server.models import BusinessUnit, Machine, MachineGroup, ProfileLevel
+from utils.admission import Budget
+from utils.caching import TTLCache
 
 
 logger = logging.getLogger(__name__)
+# Authenticated MachineGroups by key. Changes made in this process
+# clear it right away; other processes pick them up within the TTL.
+MACHINE_GROUP_KEY_CACHE = TTLCache(ttl=300)
+# This process' admission control budgets, by kind of endpoint.
+ADMISSION_BUDGETS = {}
+ADMISSION_BUDGETS_LOCK = threading.Lock()
 
 
 def class_login_required(cls):
@@ -160,12 +172,12 @@ def key_auth_required(function):
             if len(auth) == 2:
                 if auth[0].lower() == "basic":
                     uname, key = base64.b64decode(auth[1]).decode('utf-8').split(':')
-                    try:
-                        machine_group = MachineGroup.objects.get(key=key)
-                    except MachineGroup.DoesNotExist:
-                        machine_group = None
+                    machine_group = get_machine_group_by_key(key) if uname == 'sal' else None
 
-                    if machine_group is not None and uname == 'sal':
+                    if machine_group is not None:
+                        # Let the view reuse the group instead of
+                        # looking it up again.
+                        request.machine_group = machine_group
                         return function(request, *args, **kwargs)
 
         # Either they did not provide an authorization header or
@@ -179,6 +191,114 @@ def key_auth_required(function):
     return wrap
 
 
+def admission_control(kind):
+    """Turn away client requests when too many are already in flight.
+
+    Each kind of endpoint ("heavy" or "light") has its own budget of
+    concurrent requests per process, set by the `CLIENT_REQUEST_LIMITS`
+    setting, so that a flood of expensive checkins doesn't also starve
+    the cheap endpoints, or the rest of the site. Requests over budget
+    get a 503 with a `Retry-After` header.
+
+    Args:
+        kind (str): Key of the budget in `CLIENT_REQUEST_LIMITS`.
+    """
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrap(request, *args, **kwargs):
+            budget = get_admission_budget(kind)
+            if budget is None:
+                return function(request, *args, **kwargs)
+
+            if not budget.acquire():
+                response = HttpResponse('Server is busy, please retry later.', status=503)
+                response['Retry-After'] = str(budget.retry_after())
+                return response
+
+            start = time.monotonic()
+            try:
+                return function(request, *args, **kwargs)
+            finally:
+                budget.release(time.monotonic() - start)
+
+        return wrap
+
+    return decorator
+
+
+def get_admission_budget(kind):
+    """Get this process' budget for a kind of endpoint.
+
+    Returns:
+        Budget, or `None` if that kind of endpoint isn't limited.
+    """
+    limit = getattr(settings, 'CLIENT_REQUEST_LIMITS', {}).get(kind)
+    if limit is None:
+        return None
+    with ADMISSION_BUDGETS_LOCK:
+        budget = ADMISSION_BUDGETS.get(kind)
+        if budget is None:
+            budget = ADMISSION_BUDGETS[kind] = Budget(limit)
+        budget.limit = limit
+    return budget
+
+
+def get_admission_stats():
+    """Return the state of this process' admission control budgets."""
+    with ADMISSION_BUDGETS_LOCK:
+        budgets = dict(ADMISSION_BUDGETS)
+    return {kind: budget.to_dict() for kind, budget in sorted(budgets.items())}
+
+
+def get_machine_group_by_key(key):
+    """Get a MachineGroup by its key.
+
+    Successful lookups are cached; unknown keys always query the
+    database so that they can't fill up the cache.
+
+    Args:
+        key (str): MachineGroup key to look up.
+
+    Returns:
+        MachineGroup, or `None` if no group has that key.
+    """
+    if not key:
+        return None
+    machine_group = MACHINE_GROUP_KEY_CACHE.get(key)
+    if machine_group is None:
+        machine_group = MachineGroup.objects.filter(key=key, pending_deletion=False).first()
+        if machine_group is not None:
+            MACHINE_GROUP_KEY_CACHE.set(key, machine_group)
+    return machine_group
+
+
+def get_submitted_machine_group(key, request=None):
+    """Get the MachineGroup for a submitted key.
+
+    Reuses the group that `key_auth_required` attached to the request
+    when the keys match.
+
+    Raises:
+        Http404 if no MachineGroup has that key.
+    """
+    machine_group = getattr(request, 'machine_group', None)
+    if machine_group is None or machine_group.key != key:
+        machine_group = get_machine_group_by_key(key)
+    if machine_group is None:
+        raise Http404('No MachineGroup matches the given query.')
+    return machine_group
+
+
+@receiver(post_save, sender=MachineGroup)
+@receiver(post_delete, sender=MachineGroup)
+def clear_machine_group_key_cache(sender, **kwargs):
+    # The old key of a re-keyed group is no longer known, so drop
+    # everything rather than just the group's current key.
+    MACHINE_GROUP_KEY_CACHE.clear()
+
+
 def has_access(user, business_unit):
     if is_global_admin(user):
         return True
@@ -211,6 +211,9 @@ class BasePlugin(IPlugin):
         if self.only_use_deployed_machines:
             queryset = self.model.objects.filter(deployed=True)
 
+        # Groups waiting to be deleted in the background are hidden.
+        queryset = queryset.filter(machine_group__pending_deletion=False)
+
         if group_type == "business_unit":
             queryset = queryset.filter(machine_group__business_unit__pk=group_id)
         elif group_type == "machine_group":
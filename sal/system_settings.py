@@ -19,6 +19,28 @@ DEPLOYED_ON_CHECKIN = False
 ADD_TO_ALL_BUSINESS_UNITS = False
 ADD_NEW_MACHINES = True
 INACTIVE_UNDEPLOYED = 0
+# Spool checkins to the database and return immediately, leaving the
+# processing to the `checkin_worker` management command.
+CHECKIN_QUEUE = False
+# Record per-phase timings of checkins. See `server.checkin_timing`.
+CHECKIN_TIMING = False
+# Largest checkin accepted, in bytes, after decompression.
+CHECKIN_MAX_BODY_SIZE = 50 * 1024 * 1024
+# Fact values longer than this many characters are stored once, in the
+# FactValue table, and shared by every fact with that value. None
+# keeps all values inline.
+FACT_VALUE_STORE_THRESHOLD = None
+# Most submissions accepted in one request to the batch checkin endpoint.
+CHECKIN_BATCH_MAX_SIZE = 500
+# Most client requests each server process works on at once. "heavy"
+# endpoints write client submissions (checkins, inventory, etc.);
+# "light" ones are cheap lookups (preflight, inventory hashes).
+# Requests past the limit are told to retry later. Set a limit to None
+# to disable it.
+CLIENT_REQUEST_LIMITS = {"heavy": 10, "light": 50}
+# Business units and machine groups with more machines than this are
+# deleted in the background by the `deletion_worker` management command.
+INLINE_DELETE_LIMIT = 100
 SEARCH_FACTS = []
 SEARCH_CONDITIONS = []
 DATA_UPLOAD_MAX_NUMBER_FIELDS = None
@@ -260,6 +282,12 @@ _SAL_LOGGING_CONFIG = {
             "level": "ERROR",
             "propagate": False,
         },
+        # Only logs when the CHECKIN_TIMING setting is enabled.
+        "server.checkin_timing": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
         # Configure additional Sal apps for logging here.
     },
 }
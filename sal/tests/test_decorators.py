@@ -1,15 +1,22 @@
 """General functional tests for the server app."""
 
 
+import base64
+from unittest.mock import patch
+
+from django.db import connection
+from django.http import HttpResponse
 from django.http.response import Http404, HttpResponseServerError
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from sal.decorators import (
     access_required, has_access, is_global_admin, staff_required, required_level, ProfileLevel,
-    key_auth_required)
+    key_auth_required, MACHINE_GROUP_KEY_CACHE, admission_control, get_admission_budget,
+    get_admission_stats, ADMISSION_BUDGETS)
 from sal.decorators import get_business_unit_by as func_get_business_unit
 from server.models import BusinessUnit, MachineGroup, Machine
 
@@ -181,3 +188,85 @@ class FunctionDecoratorsTest(TestCase):
         request.user = self.staff_user
         response = test_view(request)
         self.assertEqual(response, SUCCESS)
+
+
+@override_settings(BASIC_AUTH=True)
+class KeyAuthTest(TestCase):
+    """Test key authentication for client endpoints."""
+    fixtures = ['business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        MACHINE_GROUP_KEY_CACHE.clear()
+        self.factory = RequestFactory()
+        self.machine_group = MachineGroup.objects.get(pk=1)
+
+        @key_auth_required
+        def test_view(request, *args, **kwargs):
+            return request.machine_group
+
+        self.test_view = test_view
+
+    def get_request(self, key, uname='sal'):
+        auth = base64.b64encode(f'{uname}:{key}'.encode()).decode()
+        return self.factory.post('/test/', HTTP_AUTHORIZATION=f'Basic {auth}')
+
+    def test_valid_key(self):
+        response = self.test_view(self.get_request(self.machine_group.key))
+        self.assertEqual(response, self.machine_group)
+
+    def test_invalid_credentials(self):
+        for request in (self.get_request('Not a key'), self.get_request(self.machine_group.key, 'lol'),
+                        self.factory.post('/test/')):
+            response = self.test_view(request)
+            self.assertEqual(response.status_code, 401)
+
+    def test_key_cached(self):
+        self.test_view(self.get_request(self.machine_group.key))
+        with CaptureQueriesContext(connection) as queries:
+            self.test_view(self.get_request(self.machine_group.key))
+        self.assertEqual(len(queries), 0)
+
+    def test_cache_invalidated_on_delete(self):
+        self.test_view(self.get_request(self.machine_group.key))
+        key = self.machine_group.key
+        self.machine_group.delete()
+        response = self.test_view(self.get_request(key))
+        self.assertEqual(response.status_code, 401)
+
+
+class AdmissionControlTest(TestCase):
+    """Test admission control for client endpoints."""
+
+    def setUp(self):
+        ADMISSION_BUDGETS.clear()
+        self.factory = RequestFactory()
+
+        @admission_control('heavy')
+        def test_view(request, *args, **kwargs):
+            return HttpResponse()
+
+        self.test_view = test_view
+
+    @patch('sal.decorators.settings.CLIENT_REQUEST_LIMITS', {'heavy': 1})
+    def test_over_budget(self):
+        self.assertEqual(self.test_view(self.factory.post('/test/')).status_code, 200)
+        budget = get_admission_budget('heavy')
+        self.assertTrue(budget.acquire())
+        response = self.test_view(self.factory.post('/test/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        budget.release(0)
+        self.assertEqual(self.test_view(self.factory.post('/test/')).status_code, 200)
+        self.assertEqual(get_admission_stats()['heavy']['rejected'], 1)
+
+    @patch('sal.decorators.settings.CLIENT_REQUEST_LIMITS', {'heavy': 1, 'light': 1})
+    def test_budgets_separate(self):
+        light_view = admission_control('light')(lambda request: HttpResponse())
+        self.assertTrue(get_admission_budget('heavy').acquire())
+        self.assertEqual(self.test_view(self.factory.post('/test/')).status_code, 503)
+        self.assertEqual(light_view(self.factory.post('/test/')).status_code, 200)
+
+    @patch('sal.decorators.settings.CLIENT_REQUEST_LIMITS', {'heavy': None})
+    def test_unlimited(self):
+        self.assertEqual(self.test_view(self.factory.post('/test/')).status_code, 200)
+        self.assertIsNone(get_admission_budget('heavy'))
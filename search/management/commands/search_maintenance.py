@@ -6,13 +6,14 @@ import logging
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 
 from inventory.models import *
 from server.models import *
 from search.models import *
 from profiles.models import *
 import server.utils
+from server.deletion import delete_in_batches
 
 # This is down here because an import * from above is clobbering
 import datetime
@@ -34,7 +35,7 @@ class Command(BaseCommand):
             created__lt=datetime.datetime.today() - datetime.timedelta(days=30),
             save_search=False,
         )
-        old_searches.delete()
+        delete_in_batches(old_searches, checkpoint="old_searches")
 
         search_fields = []
 
@@ -44,7 +45,11 @@ class Command(BaseCommand):
 
         inventory_fields = ["Name", "Bundle ID", "Bundle Name", "Path"]
 
-        facts = Fact.objects.values("fact_name").distinct()
+        # Only the names of current facts; checking the small FactName
+        # table against the fact_name index avoids scanning every Fact.
+        facts = FactName.objects.filter(
+            Exists(Fact.objects.filter(fact_name=OuterRef("pk")))
+        ).values("name")
         plugin_sript_rows = PluginScriptRow.objects.values(
             "pluginscript_name", "submission__plugin"
         ).distinct()
@@ -52,7 +57,7 @@ class Command(BaseCommand):
 
         old_cache = SearchFieldCache.objects.all()
         if server.utils.is_postgres() is False:
-            old_cache.delete()
+            delete_in_batches(old_cache)
         for f in Machine._meta.fields:
             if f.name not in skip_fields:
                 cached_item = SearchFieldCache(
@@ -64,7 +69,7 @@ class Command(BaseCommand):
 
         for fact in facts.iterator():
             cached_item = SearchFieldCache(
-                search_model="Facter", search_field=fact["fact_name"]
+                search_model="Facter", search_field=fact["name"]
             )
             search_fields.append(cached_item)
             if server.utils.is_postgres() is False:
@@ -115,7 +120,7 @@ class Command(BaseCommand):
                     cached_item.save()
 
         if server.utils.is_postgres() is True:
-            old_cache.delete()
+            delete_in_batches(old_cache)
             try:
                 SearchFieldCache.objects.bulk_create(search_fields)
             # base exception is nasty, but bulk_create doesn't give much back
@@ -130,16 +135,17 @@ class Command(BaseCommand):
 
         # Build the fact cache
         items_to_be_inserted = []
-        SearchCache.objects.all().delete()
+        delete_in_batches(SearchCache.objects.all())
         if settings.SEARCH_FACTS != []:
             queries = []
             for f in settings.SEARCH_FACTS:
-                queries.append(Q(fact_name=f))
+                queries.append(Q(fact_name__name=f))
             qs = Q()
             for query in queries:
                 qs = qs | query
 
-            facts = Fact.objects.filter(qs)
+            # Stored values are all too long for the cache.
+            facts = Fact.objects.filter(qs, fact_value__isnull=True)
             for fact in facts.iterator():
                 # If someone ships a fact that is too long, we want to skip it
                 if len(fact.fact_data) <= 254:
@@ -17,6 +17,12 @@ from search.forms import *
 from search.models import *
 from server.models import *
 from profiles.models import *
+from utils.versions import get_version_key
+
+
+# Operators that compare versions by their sortable keys rather than
+# as text.
+RANGE_OPERATORS = ('__lt', '__lte', '__gt', '__gte')
 
 
 @login_required
@@ -59,7 +65,8 @@ def quick_search(machines, query_string):
         'cpu_type',
         'cpu_speed',
         'first_checkin',
-        'last_checkin'
+        'last_checkin',
+        *Machine.VERSION_KEY_FIELDS.values(),
     ]
 
     fields = []
@@ -133,23 +140,24 @@ def search_machines(search_id, machines, full=False):
             model = None
             if search_row.search_models == 'Machine':
                 model = Machine
-                querystring = {
-                    '%s%s' % (search_row.search_field, operator): search_row.search_term
-                }
+                search_field = search_row.search_field
+                search_term = search_row.search_term
+                # Compare versions by their sortable keys.
+                if search_field in Machine.VERSION_KEY_FIELDS and operator in RANGE_OPERATORS:
+                    search_field = Machine.VERSION_KEY_FIELDS[search_field]
+                    search_term = get_version_key(search_term)
+                querystring = {'%s%s' % (search_field, operator): search_term}
                 if operator != '':
                     q_object = Q(**querystring)
                 else:
                     q_object = ~Q(**querystring)
             elif search_row.search_models == 'Facter':
                 model = Fact
-                querystring = {
-                    'facts__fact_name': search_row.search_field,
-                    'facts__fact_data%s' % (operator): search_row.search_term
-                }
-                if operator != '':
-                    q_object = Q(**querystring)
-                else:
-                    q_object = ~Q(**querystring)
+                q_object = Q(
+                    facts__fact_name__name=search_row.search_field
+                ) & server.utils.get_fact_data_q(operator, search_row.search_term, prefix='facts__')
+                if operator == '':
+                    q_object = ~q_object
 
             elif search_row.search_models == 'Application Inventory':
                 model = Application
@@ -191,10 +199,16 @@ def search_machines(search_id, machines, full=False):
 
                 model = InventoryItem  # noqa: F841
                 app_name, bundleid = search_row.search_field.split('=>')
+                if operator in RANGE_OPERATORS:
+                    version_filter = 'inventoryitem__version_key%s' % (operator)
+                    search_term = get_version_key(search_row.search_term)
+                else:
+                    version_filter = 'inventoryitem__version%s' % (operator)
+                    search_term = search_row.search_term
                 querystring = {
                     'inventoryitem__application__name': app_name,
                     'inventoryitem__application__bundleid': bundleid,
-                    'inventoryitem__version%s' % (operator): search_row.search_term
+                    version_filter: search_term
                 }
                 if operator != '':
                     q_object = Q(**querystring)
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.forms import ModelForm, ModelMultipleChoiceField
 
 from server.models import *
-from server.utils import reload_plugins_model
+from server.utils import invalidate_submission_hashes, reload_plugins_model
 
 
 class BusinessUnitFilter(admin.SimpleListFilter):
@@ -94,7 +94,29 @@ class ManagementSourceAdmin(admin.ModelAdmin):
     list_display = ('name', )
 
 
-class ManagedItemAdmin(admin.ModelAdmin):
+class SubmittedDataAdmin(admin.ModelAdmin):
+    """Admin for rows written by checkins.
+
+    Edits and deletions invalidate the hash of the checkin section the
+    row came from, so that the machine's next checkin restores it.
+    """
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            invalidate_submission_hashes(self.model.objects.filter(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        invalidate_submission_hashes(self.model.objects.filter(pk=obj.pk))
+
+    def delete_model(self, request, obj):
+        invalidate_submission_hashes(self.model.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        invalidate_submission_hashes(queryset)
+        super().delete_queryset(request, queryset)
+
+
+class ManagedItemAdmin(SubmittedDataAdmin):
     list_display = ('name', 'management_source', 'machine', 'date_managed', 'status')
     list_filter = (
         'management_source', BusinessUnitFilter, MachineGroupFilter, 'date_managed', 'status')
@@ -109,23 +131,31 @@ class ManagedItemHistoryAdmin(admin.ModelAdmin):
     date_hierarchy = 'recorded'
 
 
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(SubmittedDataAdmin):
     list_display = ('text', 'get_message_type_display', 'management_source', 'machine', 'date')
     list_filter = (
         'management_source', BusinessUnitFilter, MachineGroupFilter, 'date', 'message_type')
     search_fields = ('text', 'machine__hostname', 'machine__serial')
 
 
-class FactAdmin(admin.ModelAdmin):
-    list_display = ('fact_name', 'fact_data', 'machine', 'management_source')
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('target_name', 'target_type', 'status', 'deleted', 'total', 'created', 'finished')
+    list_filter = ('target_type', 'status')
+    search_fields = ('target_name',)
+
+
+class FactAdmin(SubmittedDataAdmin):
+    list_display = ('fact_name', 'value', 'machine', 'management_source')
+    list_select_related = ('fact_name', 'fact_value', 'machine', 'management_source')
     list_filter = ('management_source', BusinessUnitFilter, MachineGroupFilter, 'fact_name')
-    search_fields = ('fact_name', 'fact_data', 'machine__hostname')
+    search_fields = ('fact_name__name', 'fact_data', 'machine__hostname')
 
 
 class HistoricalFactAdmin(admin.ModelAdmin):
-    list_display = ('fact_name', 'fact_data', 'machine', 'management_source', 'fact_recorded')
+    list_display = ('fact_name', 'value', 'machine', 'management_source', 'fact_recorded')
+    list_select_related = ('fact_name', 'fact_value', 'machine', 'management_source')
     list_filter = ('management_source', BusinessUnitFilter, MachineGroupFilter, 'fact_name')
-    search_fields = ('fact_name', 'fact_data', 'machine__hostname')
+    search_fields = ('fact_name__name', 'fact_data', 'machine__hostname')
     date_hierarchy = 'fact_recorded'
 
 
@@ -198,6 +228,13 @@ class PluginScriptSubmissionAdmin(admin.ModelAdmin):
     date_hierarchy = 'recorded'
 
 
+class QueuedCheckinAdmin(admin.ModelAdmin):
+    list_display = ('serial', 'received', 'available', 'attempts', 'failed')
+    list_filter = ('failed', 'received')
+    search_fields = ('serial',)
+    date_hierarchy = 'received'
+
+
 class ReportAdmin(admin.ModelAdmin):
     list_display = ('name',)
 
@@ -236,6 +273,7 @@ class CustomUserAdmin(admin.ModelAdmin):
 
 admin.site.register(ApiKey, ApiKeyAdmin)
 admin.site.register(BusinessUnit, BusinessUnitAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
 admin.site.register(Fact, FactAdmin)
 admin.site.register(FriendlyNameCache, FriendlyNameCacheAdmin)
 admin.site.register(HistoricalFact, HistoricalFactAdmin)
@@ -249,6 +287,7 @@ admin.site.register(Message, MessageAdmin)
 admin.site.register(Plugin, PluginAdmin)
 admin.site.register(PluginScriptRow, PluginScriptRowAdmin)
 admin.site.register(PluginScriptSubmission, PluginScriptSubmissionAdmin)
+admin.site.register(QueuedCheckin, QueuedCheckinAdmin)
 admin.site.register(Report, ReportAdmin)
 admin.site.register(SalSetting, SalSettingAdmin)
 admin.site.unregister(User)
@@ -0,0 +1,185 @@
+"""Durable spool for deferred client checkins.
+
+When the `CHECKIN_QUEUE` setting is enabled, the checkin view only
+validates a submission and writes it to the `QueuedCheckin` table. The
+`checkin_worker` management command then drains the spool with a pool
+of worker processes.
+
+Each submission is assigned a shard computed from its serial number,
+and every worker only processes the shards that belong to it. This
+means all of the checkins for one machine are handled by the same
+worker, in the order they were received. Workers also lock each
+submission while they process it, so if their shards overlap, e.g.
+because two `checkin_worker` commands were started, a submission is
+still only processed once.
+"""
+
+
+import datetime
+import json
+import logging
+import zlib
+
+import django.utils.timezone
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Min
+from django.db.models.functions import Mod
+from django.http import Http404
+
+import server.utils
+from server.models import QueuedCheckin
+
+
+# Shards are fixed at enqueue time, so this must not change while
+# there are submissions in the spool. Workers are assigned shards with
+# `shard % workers`, so any worker count up to this value works.
+SHARD_COUNT = 1024
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def get_shard(serial):
+    return zlib.crc32(serial.encode()) % SHARD_COUNT
+
+
+def enqueue(serial, submission):
+    """Write a validated submission to the spool.
+
+    Args:
+        serial (str): Normalized serial number of the machine.
+        submission (str): The checkin JSON, as submitted.
+
+    Returns:
+        The new QueuedCheckin.
+    """
+    return QueuedCheckin.objects.create(
+        serial=serial, shard=get_shard(serial), submission=submission)
+
+
+def enqueue_many(submissions):
+    """Write many validated submissions to the spool at once.
+
+    Args:
+        submissions (iterable of tuple): Pairs of normalized serial
+            number and checkin JSON, in the order they were received.
+
+    Returns:
+        List of the new QueuedCheckins.
+    """
+    return server.utils.bulk_create(QueuedCheckin, [
+        QueuedCheckin(serial=serial, shard=get_shard(serial), submission=submission)
+        for serial, submission in submissions])
+
+
+def get_queue_stats():
+    """Return the current depth and lag of the checkin spool.
+
+    Returns:
+        dict:
+            depth (int): Submissions waiting to be processed.
+            failed (int): Submissions that exhausted their retries.
+            lag (float): Age in seconds of the oldest waiting
+                submission, or 0 if the spool is empty.
+    """
+    pending = QueuedCheckin.objects.filter(failed=False)
+    oldest = pending.aggregate(oldest=Min('received'))['oldest']
+    lag = (django.utils.timezone.now() - oldest).total_seconds() if oldest else 0
+    return {
+        'depth': pending.count(),
+        'failed': QueuedCheckin.objects.filter(failed=True).count(),
+        'lag': lag}
+
+
+def drain(worker=0, workers=1, batch_size=100, max_attempts=5):
+    """Process one batch of spooled checkins for a worker.
+
+    Submissions are handled in the order they were received. If a
+    submission fails, or is waiting to be retried, no later
+    submissions for that serial are processed until it succeeds or
+    runs out of attempts. The same goes for submissions that another
+    worker has claimed.
+
+    Args:
+        worker (int): Index of this worker, starting at 0.
+        workers (int): Total number of workers draining the spool.
+        batch_size (int): Maximum number of submissions to consider.
+        max_attempts (int): Number of tries before a submission is
+            marked as failed.
+
+    Returns:
+        Number of submissions successfully processed.
+    """
+    now = django.utils.timezone.now()
+    pending = QueuedCheckin.objects.filter(failed=False)
+    waiting_serials = pending.filter(available__gt=now).values('serial')
+    jobs = pending.exclude(serial__in=waiting_serials)
+    if workers > 1:
+        jobs = jobs.annotate(worker=Mod('shard', workers)).filter(worker=worker)
+
+    blocked = set()
+    processed = 0
+    for job in jobs.order_by('id')[:batch_size]:
+        if job.serial in blocked:
+            continue
+        try:
+            with transaction.atomic():
+                if not claim(job):
+                    blocked.add(job.serial)
+                    continue
+                process_job(job)
+                # Delete by query, so that the job keeps its primary
+                # key for retry_later if the commit fails.
+                QueuedCheckin.objects.filter(pk=job.pk).delete()
+            processed += 1
+        except Exception as error:
+            if isinstance(error, IntegrityError):
+                # Cached rows may have been deleted by another process;
+                # look them up again for the retry.
+                server.utils.clear_checkin_caches()
+            blocked.add(job.serial)
+            retry_later(job, error, max_attempts)
+
+    return processed
+
+
+def claim(job):
+    """Lock a submission's row until the current transaction ends.
+
+    Returns:
+        False if another worker has it locked, or has processed or
+        retried it since it was listed.
+    """
+    jobs = QueuedCheckin.objects.filter(pk=job.pk, failed=False, attempts=job.attempts)
+    # Without SKIP LOCKED (e.g. on SQLite, which only has one writer
+    # anyway), a claim only checks the job hasn't been touched.
+    if connection.features.has_select_for_update_skip_locked:
+        jobs = jobs.select_for_update(skip_locked=True)
+    return bool(list(jobs.values_list('pk', flat=True)))
+
+
+def process_job(job):
+    # Import here to avoid a circular import; the view module needs
+    # this one to spool submissions.
+    from server.non_ui_views import process_checkin
+    process_checkin(json.loads(job.submission), received=job.received)
+
+
+def retry_later(job, error, max_attempts):
+    job.attempts += 1
+    job.last_error = repr(error)
+    # A missing machine or machine group will not appear by retrying.
+    if isinstance(error, Http404) or job.attempts >= max_attempts:
+        job.failed = True
+        logger.error("Checkin for '%s' failed permanently: %s", job.serial, job.last_error)
+    else:
+        delay = min(10 * 2 ** job.attempts, MAX_RETRY_DELAY)
+        job.available = django.utils.timezone.now() + datetime.timedelta(seconds=delay)
+        logger.warning(
+            "Checkin for '%s' failed, retrying in %s seconds: %s", job.serial, delay,
+            job.last_error)
+    # Update by query, so that a job another worker has since finished
+    # isn't inserted again.
+    QueuedCheckin.objects.filter(pk=job.pk).update(
+        attempts=job.attempts, last_error=job.last_error, failed=job.failed,
+        available=job.available)
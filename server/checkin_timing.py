@@ -0,0 +1,135 @@
+"""Per-phase timing of the checkin pipeline.
+
+When the `CHECKIN_TIMING` setting is enabled, the checkin view records
+how long each phase of processing takes, and how many queries it runs.
+Each checkin's timings are returned in a `Server-Timing` response
+header, logged as a JSON line, and added to in-process histograms
+that GAs can read from the checkin metrics page.
+
+Code being timed only needs to wrap a phase with `phase(name)`; when
+there is no active recording, that is a no-op.
+"""
+
+
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from django.db import connection
+
+
+# Upper bounds, in milliseconds, of the histogram buckets.
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('checkin_timing', default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+_noop = contextlib.nullcontext()
+
+
+class Recorder:
+    """Records the phases of one checkin.
+
+    Use as a context manager around the work to be timed; phases
+    entered within it are recorded in `phases` as tuples of name,
+    duration in milliseconds and number of queries.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.queries = 0
+        self.total = 0.0
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.total = (time.perf_counter() - self._start) * 1000
+        self._wrapper.__exit__(*exc_info)
+        _current.reset(self._token)
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            self.phases.append(
+                (name, (time.perf_counter() - start) * 1000, self.queries - queries))
+
+    def server_timing(self):
+        """Format the phases as a `Server-Timing` header value."""
+        metrics = [
+            f'{name};desc="{queries} queries";dur={duration:.1f}'
+            for name, duration, queries in self.phases]
+        metrics.append(f'total;desc="{self.queries} queries";dur={self.total:.1f}')
+        return ', '.join(metrics)
+
+    def finish(self, **extra):
+        """Log the recording and add it to the histograms."""
+        logger.info(json.dumps({
+            'event': 'checkin_timing',
+            'total_ms': round(self.total, 2),
+            'queries': self.queries,
+            'phases': [
+                {'name': name, 'ms': round(duration, 2), 'queries': queries}
+                for name, duration, queries in self.phases],
+            **extra}))
+
+        with _histograms_lock:
+            for name, duration, _ in self.phases + [('total', self.total, self.queries)]:
+                _histograms.setdefault(name, Histogram()).add(duration)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in BUCKETS] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum, 2),
+            'buckets': dict(zip(bounds, self.buckets))}
+
+
+def phase(name):
+    """Time a phase of the current checkin, if one is being recorded."""
+    recorder = _current.get()
+    if recorder is None:
+        return _noop
+    return recorder.phase(name)
+
+
+def get_histograms():
+    """Return this process' timing histograms, keyed by phase name."""
+    with _histograms_lock:
+        return {name: histogram.to_dict() for name, histogram in sorted(_histograms.items())}
+
+
+def clear_histograms():
+    with _histograms_lock:
+        _histograms.clear()
@@ -0,0 +1,206 @@
+"""Deletion of large querysets in small batches.
+
+`QuerySet.delete()` has Django's collector gather everything the
+deletion cascades to, all in one transaction. For the unbounded
+querysets the maintenance commands delete, that can mean loading
+millions of related objects into memory, and holding locks on them
+until it's done.
+
+`delete_in_batches` deletes a batch of primary keys at a time instead,
+committing each batch, so memory use is bounded by the batch size no
+matter how many rows are removed. Batches are still deleted through
+the collector, which removes models with no further cascades or delete
+signals with a single DELETE, without loading them; only cascades that
+need it are collected, and only for one batch.
+
+Models with delete signals can't be deleted that way, so the collector
+loads each batch to send them. Machines are one: their `pre_delete`
+receiver keeps the inventory install count rollup up to date, one
+machine at a time. The machine deletions here take each batch out of
+the rollup in one go first, with `install_counts.remove_deleted_machines`,
+which leaves the receiver nothing to do.
+
+When given a checkpoint name, the last primary key deleted is stored as
+a SalSetting after each batch, so a run that is interrupted picks up
+where it left off rather than scanning the rows it already got through.
+
+Business units and machine groups with more machines than can be
+deleted during a request are instead queued as `DeletionJob`s, for the
+`deletion_worker` management command to delete in the background.
+"""
+
+
+import logging
+
+import django.utils.timezone
+from django.db import transaction
+
+import server.utils
+from inventory import install_counts
+from server.models import BusinessUnit, DeletionJob, Machine, MachineGroup, SalSetting
+
+
+DELETE_BATCH_SIZE = 1000
+CHECKPOINT_PREFIX = 'deletion_checkpoint_'
+# Groups with at most this many machines are deleted immediately.
+INLINE_DELETE_LIMIT = server.utils.get_django_setting('INLINE_DELETE_LIMIT', 100)
+
+logger = logging.getLogger(__name__)
+
+
+def delete_in_batches(
+        queryset, batch_size=DELETE_BATCH_SIZE, checkpoint=None, progress=None, before_delete=None):
+    """Delete every row of a queryset, in primary key order.
+
+    Args:
+        queryset (QuerySet): The rows to delete.
+        batch_size (int): Number of rows to delete per transaction.
+        checkpoint (str): Name to record progress under, so that the
+            deletion can be resumed from there if it's interrupted.
+            Defaults to not keeping a checkpoint.
+        progress (callable): Called with the running total of rows
+            deleted after each batch.
+        before_delete (callable): Called with a queryset of each batch,
+            in the batch's transaction, before it is deleted.
+
+    Returns:
+        int: Number of rows of the queryset's model deleted, not
+        counting cascades.
+    """
+    model = queryset.model
+    using = queryset.db
+    setting_name = f'{CHECKPOINT_PREFIX}{checkpoint}' if checkpoint else None
+    last_pk = get_checkpoint(checkpoint) if checkpoint else None
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+
+    deleted = 0
+    while True:
+        remaining = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+        batch = list(remaining[:batch_size])
+        if not batch:
+            break
+
+        with transaction.atomic(using=using):
+            batch_queryset = model._base_manager.using(using).filter(pk__in=batch)
+            if before_delete:
+                before_delete(batch_queryset)
+            batch_queryset.delete()
+            if setting_name:
+                SalSetting.objects.using(using).update_or_create(
+                    name=setting_name, defaults={'value': str(batch[-1])})
+
+        deleted += len(batch)
+        last_pk = batch[-1]
+        logger.info('Deleted %d %s', deleted, model._meta.verbose_name_plural)
+        if progress:
+            progress(deleted)
+
+    if setting_name:
+        SalSetting.objects.using(using).filter(name=setting_name).delete()
+    return deleted
+
+
+def get_checkpoint(checkpoint):
+    """Return the last primary key deleted under a checkpoint, or None."""
+    setting = SalSetting.objects.filter(name=f'{CHECKPOINT_PREFIX}{checkpoint}').first()
+    return setting.value if setting else None
+
+
+def delete_group(target):
+    """Delete a business unit or machine group, or queue it for deletion.
+
+    Groups with more than `INLINE_DELETE_LIMIT` machines are marked
+    pending deletion and queued as a DeletionJob.
+
+    Returns:
+        DeletionJob, or `None` if the group was deleted immediately.
+    """
+    machines = _get_machines(target)
+    total = machines.count()
+    if total <= INLINE_DELETE_LIMIT:
+        delete_in_batches(machines, before_delete=install_counts.remove_deleted_machines)
+        target.delete()
+        return None
+
+    if isinstance(target, BusinessUnit):
+        target_type = 'business_unit'
+        machine_groups = list(target.machinegroup_set.all())
+    else:
+        target_type = 'machine_group'
+        machine_groups = [target]
+
+    with transaction.atomic():
+        target.pending_deletion = True
+        target.save()
+        # Saving each group, rather than updating them all at once,
+        # clears the cache checkins look up group keys in.
+        for machine_group in machine_groups:
+            machine_group.pending_deletion = True
+            machine_group.save()
+        return DeletionJob.objects.create(
+            target_type=target_type, target_id=target.pk, target_name=target.name, total=total)
+
+
+def run_deletion_job(job):
+    """Delete a job's machines in batches, then its business unit or group.
+
+    Jobs that were interrupted resume from their checkpoint.
+    """
+    model = BusinessUnit if job.target_type == 'business_unit' else MachineGroup
+    DeletionJob.objects.filter(pk=job.pk).update(status='RUNNING')
+    target = model.objects.filter(pk=job.target_id).first()
+    try:
+        if target is not None:
+            already_deleted = job.deleted if get_checkpoint(f'deletion_job_{job.pk}') else 0
+
+            def update_progress(deleted):
+                DeletionJob.objects.filter(pk=job.pk).update(deleted=already_deleted + deleted)
+
+            # Other processes accept checkins for the target until their
+            # cached copies of it expire, and the machines those create
+            # may be behind the checkpoint, so go round again until none
+            # are left for deleting the target to cascade to.
+            machines = _get_machines(target)
+            while True:
+                already_deleted += delete_in_batches(
+                    machines, checkpoint=f'deletion_job_{job.pk}', progress=update_progress,
+                    before_delete=install_counts.remove_deleted_machines)
+                if not machines.exists():
+                    break
+            target.delete()
+    except Exception as error:
+        logger.exception('Deletion job %s failed', job.pk)
+        DeletionJob.objects.filter(pk=job.pk).update(status='FAILED', last_error=str(error))
+        return False
+
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status='DONE', deleted=job.total, finished=django.utils.timezone.now())
+    return True
+
+
+def retry_deletion_job(job):
+    """Queue a failed job to run again, from its checkpoint.
+
+    Returns:
+        bool: Whether the job had failed, and was queued.
+    """
+    return bool(DeletionJob.objects.filter(pk=job.pk, status='FAILED').update(
+        status='QUEUED', last_error=None))
+
+
+def run_deletion_jobs():
+    """Run every queued or interrupted deletion job, oldest first.
+
+    Returns:
+        int: Number of jobs run.
+    """
+    jobs = list(DeletionJob.objects.filter(status__in=('QUEUED', 'RUNNING')))
+    for job in jobs:
+        run_deletion_job(job)
+    return len(jobs)
+
+
+def _get_machines(target):
+    if isinstance(target, BusinessUnit):
+        return Machine.objects.filter(machine_group__business_unit=target)
+    return Machine.objects.filter(machine_group=target)
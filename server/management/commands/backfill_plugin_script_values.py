@@ -0,0 +1,53 @@
+"""Fills in the typed columns of existing plugin script rows"""
+
+
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from server.models import PluginScriptRow
+from utils.typed_values import get_typed_values
+
+
+TYPED_FIELDS = ('pluginscript_data_int', 'pluginscript_data_string', 'pluginscript_data_date')
+
+
+class Command(BaseCommand):
+    help = 'Fills in the typed columns of existing plugin script rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sleep_time', type=int, nargs='?', default=0)
+        parser.add_argument(
+            '--batch-size', help='Rows to process per query', default=5000, type=int)
+
+    def handle(self, *args, **options):
+        sleep(options['sleep_time'])
+        batch_size = options['batch_size']
+
+        last_id = 0
+        checked = updated = 0
+        while True:
+            rows = list(
+                PluginScriptRow.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'pluginscript_data', *TYPED_FIELDS)[:batch_size])
+            if not rows:
+                break
+
+            typed_values = get_typed_values(row.pluginscript_data for row in rows)
+            changed = []
+            for row in rows:
+                typed_value = typed_values[row.pluginscript_data]
+                if typed_value != (
+                        row.pluginscript_data_int, row.pluginscript_data_string,
+                        row.pluginscript_data_date):
+                    row.set_typed_values(typed_value)
+                    changed.append(row)
+            PluginScriptRow.objects.bulk_update(changed, TYPED_FIELDS)
+
+            checked += len(rows)
+            updated += len(changed)
+            last_id = rows[-1].id
+
+        self.stdout.write(f'Checked {checked} plugin script rows, updated {updated}.')
@@ -0,0 +1,66 @@
+"""Fills in the sortable version keys of existing machines and inventory"""
+
+
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from inventory.models import ApplicationInstallCount, InventoryItem
+from server.models import Machine
+from utils.versions import get_version_key
+
+
+# Models with version keys, and their version fields' key fields.
+VERSION_KEY_MODELS = (
+    (Machine, Machine.VERSION_KEY_FIELDS),
+    (InventoryItem, {'version': 'version_key'}),
+    (ApplicationInstallCount, {'version': 'version_key'}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Fills in the sortable version keys of existing machines and inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sleep_time', type=int, nargs='?', default=0)
+        parser.add_argument(
+            '--batch-size', help='Rows to process per query', default=5000, type=int)
+
+    def handle(self, *args, **options):
+        sleep(options['sleep_time'])
+        for model, key_fields in VERSION_KEY_MODELS:
+            checked, updated = self.backfill(model, key_fields, options['batch_size'])
+            self.stdout.write(
+                f'Checked {checked} {model._meta.verbose_name_plural}, updated {updated}.')
+
+    def backfill(self, model, key_fields, batch_size):
+        last_id = 0
+        checked = updated = 0
+        while True:
+            rows = list(
+                model.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', *key_fields, *key_fields.values())[:batch_size])
+            if not rows:
+                break
+
+            changed = []
+            for row in rows:
+                row_changed = False
+                for name, key_name in key_fields.items():
+                    key = get_version_key(getattr(row, name))
+                    if key != getattr(row, key_name):
+                        setattr(row, key_name, key)
+                        row_changed = True
+                if row_changed:
+                    changed.append(row)
+            # Queryset updates don't go through save(), so the rows'
+            # other fields are left alone.
+            model.objects.bulk_update(changed, list(key_fields.values()))
+
+            checked += len(rows)
+            updated += len(changed)
+            last_id = rows[-1].id
+
+        return checked, updated
@@ -0,0 +1,358 @@
+"""Measures checkin throughput with synthetic client submissions
+
+Checkins are generated for a set of fake machines and replayed against
+the checkin endpoint, either in-process with Django's test client or
+over HTTP against a running server (e.g. a local gunicorn). Each
+machine checks in once per round, so later rounds exercise updating
+existing rows rather than only inserting new ones. Machines left over
+from a previous run are deleted first.
+
+WARNING: The fake machines, and everything they submit, are written to
+the configured database; don't run this against production.
+"""
+
+
+import base64
+import bz2
+import datetime
+import gzip
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from server.models import BusinessUnit, Machine, MachineGroup
+from utils import compression
+
+
+BENCHMARK_NAME = 'Checkin Benchmark'
+STATUSES = ('PRESENT', 'PENDING', 'ERROR', 'ABSENT')
+PERCENTILES = (50, 95, 99)
+
+
+class Command(BaseCommand):
+    help = 'Measures checkin throughput with synthetic client submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--machines', '-m', help='Number of machines to check in', default=50, type=int)
+        parser.add_argument(
+            '--rounds', '-r', help='Number of checkins per machine', default=2, type=int)
+        parser.add_argument(
+            '--concurrency', '-c', help='Number of concurrent clients', default=1, type=int)
+        parser.add_argument(
+            '--facts', help='Number of facts per management source', default=100, type=int)
+        parser.add_argument(
+            '--managed-items', help='Number of Munki managed items', default=100, type=int)
+        parser.add_argument(
+            '--messages', help='Number of Munki messages', default=5, type=int)
+        parser.add_argument(
+            '--plugin-rows', help='Number of plugin_results rows', default=20, type=int)
+        parser.add_argument(
+            '--churn', help='Fraction of facts and managed items changed each round',
+            default=0.1, type=float)
+        parser.add_argument(
+            '--content-encoding', help='Compress checkins with gzip, bzip2 or zstd',
+            choices=('gzip', 'bzip2', 'zstd'))
+        parser.add_argument(
+            '--url', help='Base URL of a running Sal server. Defaults to the test client.')
+        parser.add_argument('--seed', help='Random seed', default=0, type=int)
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this path')
+        parser.add_argument('--compare', help='Compare the results to a previous JSON output')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['machines'] < 1 or options['rounds'] < 1:
+            raise CommandError('--machines, --rounds and --concurrency must be at least 1')
+        encoding = options['content_encoding']
+        if encoding == 'zstd' and compression.zstandard is None:
+            raise CommandError('Please install the zstandard package: `pip install zstandard`')
+
+        business_unit, _ = BusinessUnit.objects.get_or_create(name=BENCHMARK_NAME)
+        machine_group, _ = MachineGroup.objects.get_or_create(
+            business_unit=business_unit, name=BENCHMARK_NAME)
+        # Start every run from the same state, rather than on top of
+        # whatever an earlier run with other options left behind.
+        Machine.objects.filter(machine_group=machine_group).delete()
+
+        # Generate every payload up front so it isn't part of the timing.
+        clients = [[] for _ in range(options['concurrency'])]
+        for round_number in range(options['rounds']):
+            for index in range(options['machines']):
+                payload = json.dumps(
+                    generate_checkin(index, round_number, machine_group.key, options)).encode()
+                clients[index % options['concurrency']].append(compress(payload, encoding))
+
+        transport = HTTPTransport if options['url'] else TestClientTransport
+        baseline_rss = get_peak_rss()
+        try:
+            results = run(clients, lambda: transport(machine_group.key, options['url'], encoding))
+        except requests.ConnectionError as error:
+            raise CommandError(f"Unable to connect to {options['url']}: {error}")
+
+        report = summarize(results)
+        # The server's memory use can only be seen in-process. Payloads
+        # are generated before the baseline, so growth past it is down
+        # to processing the checkins.
+        report['peak_rss_mb'] = None if options['url'] else get_peak_rss()
+        report['baseline_rss_mb'] = None if options['url'] else baseline_rss
+        report['meta'] = {
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': get_commit(),
+            'database': connection.vendor,
+            'transport': 'http' if options['url'] else 'test_client',
+            'options': {
+                key: options[key] for key in (
+                    'machines', 'rounds', 'concurrency', 'facts', 'managed_items', 'messages',
+                    'plugin_rows', 'churn', 'seed', 'content_encoding')}}
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self.stdout.write(compare(json.load(handle), report))
+
+
+def generate_checkin(index, round_number, key, options):
+    """Build a synthetic checkin submission.
+
+    A machine's data is the same every round, except for a random
+    `churn` fraction of its facts and managed items. Changed managed
+    items keep their new status in later rounds.
+    """
+    rng = random.Random(f"{options['seed']}-{index}")
+    churn_rng = random.Random(f"{options['seed']}-{index}-{round_number}")
+
+    def churned(value, changed):
+        return changed if churn_rng.random() < options['churn'] else value
+
+    # Clients report when items were managed, which only moves on when
+    # an item's status changes.
+    managed = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(
+        minutes=rng.randrange(10 ** 5))
+    serial = f'BENCH{index:07d}'
+    facts = {
+        f'fact_{n}': churned(f'value_{rng.randrange(1000)}', f'value_{churn_rng.randrange(1000)}')
+        for n in range(options['facts'])}
+    managed_items = {}
+    for n in range(options['managed_items']):
+        status = rng.choice(STATUSES)
+        changed_round = get_last_change(f"{options['seed']}-{index}-{n}", round_number, options['churn'])
+        if changed_round:
+            status = random.Random(f"{options['seed']}-{index}-{n}-{changed_round}-status").choice(STATUSES)
+        managed_items[f'item_{n}'] = {
+            'date_managed': (managed + datetime.timedelta(days=changed_round)).isoformat(),
+            'status': status,
+            'data': {'type': 'ManagedInstalls', 'version': f'{rng.randrange(10)}.{rng.randrange(10)}'}}
+
+    return {
+        'Machine': {
+            'extra_data': {
+                'serial': serial,
+                'hostname': f'bench-{index}',
+                'console_user': f'user{index}',
+                'os_family': 'Darwin',
+                'operating_system': '10.15.7',
+                'hd_space': rng.randrange(10 ** 9),
+                'hd_total': 10 ** 9,
+                'hd_percent': str(rng.randrange(100)),
+                'machine_model': 'MacBookPro16,1',
+                'cpu_type': 'Intel Core i9',
+                'cpu_speed': '2.3 GHz',
+                'memory': '16 GB',
+                'memory_kb': 16777216}},
+        'Sal': {'extra_data': {'key': key, 'sal_version': '4.1.0'}},
+        'Munki': {
+            'extra_data': {'munki_version': '5.2.0', 'manifest': f'manifest_{index % 10}'},
+            'facts': facts,
+            'managed_items': managed_items,
+            'messages': [
+                {'message_type': 'WARNING', 'text': f'Warning {n}', 'date': managed.isoformat()}
+                for n in range(options['messages'])]},
+        'Puppet': {'facts': {f'puppet_{name}': value for name, value in facts.items()}},
+        'plugin_results': [{
+            'plugin': 'Benchmark',
+            'historical': False,
+            'data': {f'row_{n}': churned(str(n), str(churn_rng.randrange(1000)))
+                     for n in range(options['plugin_rows'])}}]}
+
+
+def get_last_change(seed, round_number, churn):
+    """Return the latest round, up to `round_number`, an item changed in."""
+    for changed_round in range(round_number, 0, -1):
+        if random.Random(f'{seed}-{changed_round}').random() < churn:
+            return changed_round
+    return 0
+
+
+def compress(payload, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(payload)
+    if encoding == 'bzip2':
+        return bz2.compress(payload)
+    if encoding == 'zstd':
+        return compression.zstandard.ZstdCompressor().compress(payload)
+    return payload
+
+
+def get_peak_rss():
+    """Peak resident set size of this process in MB, if available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class QueryRecorder:
+    """Database execute wrapper counting queries and written rows."""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+class TestClientTransport:
+
+    def __init__(self, key, url=None, encoding=None):
+        auth = base64.b64encode(f'sal:{key}'.encode()).decode()
+        headers = {'HTTP_AUTHORIZATION': f'Basic {auth}'}
+        if encoding:
+            headers['HTTP_CONTENT_ENCODING'] = encoding
+        self.client = Client(**headers)
+
+    def post(self, payload):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.post('/checkin/', data=payload, content_type='application/json')
+        return response.status_code, recorder.queries, recorder.rows
+
+    def close(self):
+        # Each client thread gets its own database connection.
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+class HTTPTransport:
+
+    def __init__(self, key, url, encoding=None):
+        self.url = url.rstrip('/') + '/checkin/'
+        self.session = requests.Session()
+        self.session.auth = ('sal', key)
+        self.headers = {'Content-Type': 'application/json'}
+        if encoding:
+            self.headers['Content-Encoding'] = encoding
+
+    def post(self, payload):
+        response = self.session.post(self.url, data=payload, headers=self.headers)
+        # Query and row counts can only be recorded in-process.
+        return response.status_code, None, None
+
+    def close(self):
+        self.session.close()
+
+
+def run(clients, get_transport):
+    """Replay each client's payloads, with the clients in parallel.
+
+    Returns:
+        dict:
+            elapsed (float): Wall clock seconds for all clients.
+            checkins (list of tuple): Latency in seconds, status,
+                queries and rows written for each checkin.
+    """
+    def run_client(payloads):
+        transport = get_transport()
+        checkins = []
+        try:
+            for payload in payloads:
+                start = time.perf_counter()
+                status, queries, rows = transport.post(payload)
+                checkins.append((time.perf_counter() - start, status, queries, rows))
+        finally:
+            transport.close()
+        return checkins
+
+    start = time.perf_counter()
+    if len(clients) == 1:
+        client_results = [run_client(clients[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            client_results = list(executor.map(run_client, clients))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'elapsed': elapsed,
+        'checkins': [checkin for checkins in client_results for checkin in checkins]}
+
+
+def summarize(results):
+    checkins = results['checkins']
+    latencies = sorted(checkin[0] * 1000 for checkin in checkins)
+    queries = [checkin[2] for checkin in checkins if checkin[2] is not None]
+    rows = [checkin[3] for checkin in checkins if checkin[3] is not None]
+    summary = {
+        'checkins': len(checkins),
+        'errors': sum(1 for checkin in checkins if checkin[1] >= 400),
+        'elapsed': round(results['elapsed'], 3),
+        'requests_per_second': round(len(checkins) / results['elapsed'], 2),
+        'latency_ms': {f'p{pct}': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+        'queries_per_checkin': round(sum(queries) / len(queries), 1) if queries else None,
+        'rows_written_per_checkin': round(sum(rows) / len(rows), 1) if rows else None,
+        'rows_written': sum(rows) if rows else None}
+    summary['latency_ms']['mean'] = round(sum(latencies) / len(latencies), 2)
+    summary['latency_ms']['max'] = round(latencies[-1], 2)
+    return summary
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(math.ceil(pct / 100 * len(values)) - 1, 0)]
+
+
+def compare(previous, current):
+    lines = [f"Compared to {previous['meta'].get('commit')} ({previous['meta'].get('database')}):"]
+    metrics = [('requests_per_second', previous, current)]
+    metrics += [
+        (f'latency_ms.p{pct}', previous['latency_ms'], current['latency_ms']) for pct in PERCENTILES]
+    metrics += [
+        ('queries_per_checkin', previous, current), ('rows_written_per_checkin', previous, current)]
+    for name, old, new in metrics:
+        key = name.split('.')[-1]
+        before, after = old.get(key), new.get(key)
+        if before and after is not None:
+            lines.append(f'  {name}: {before} -> {after} ({(after - before) / before:+.1%})')
+        else:
+            lines.append(f'  {name}: {before} -> {after}')
+    return '\n'.join(lines) + '\n'
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
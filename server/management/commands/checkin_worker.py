@@ -0,0 +1,71 @@
+"""Processes checkins spooled by the checkin view when CHECKIN_QUEUE is enabled."""
+
+
+import json
+import logging
+import multiprocessing
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from server import checkin_queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Processes checkins spooled by the checkin view when CHECKIN_QUEUE is enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', '-w', help='Number of worker processes', default=1, type=int)
+        parser.add_argument(
+            '--batch-size', help='Submissions to process per pass', default=100, type=int)
+        parser.add_argument(
+            '--max-attempts', help='Tries before a submission is marked failed', default=5,
+            type=int)
+        parser.add_argument(
+            '--poll-interval', help='Seconds to wait when the spool is empty', default=5,
+            type=int)
+        parser.add_argument(
+            '--once', help='Exit once the spool is empty', action='store_true')
+        parser.add_argument(
+            '--status', help='Print the spool depth and lag and exit', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.stdout.write(json.dumps(checkin_queue.get_queue_stats()))
+            return
+
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            run_worker(0, 1, options)
+            return
+
+        # Child processes must open their own database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=(index, workers, options))
+            for index in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+def run_worker(index, workers, options):
+    while True:
+        processed = checkin_queue.drain(
+            worker=index, workers=workers, batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'])
+        if processed:
+            logger.info(
+                'Worker %s processed %s checkins. Spool: %s', index, processed,
+                checkin_queue.get_queue_stats())
+            continue
+        if options['once']:
+            break
+        sleep(options['poll_interval'])
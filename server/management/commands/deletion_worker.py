@@ -0,0 +1,35 @@
+"""Deletes business units and machine groups queued for deletion."""
+
+
+import logging
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from server import deletion
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deletes business units and machine groups queued for deletion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval', help='Seconds to wait when there are no jobs', default=10,
+            type=int)
+        parser.add_argument(
+            '--once', help='Exit once there are no jobs', action='store_true')
+
+    def handle(self, *args, **options):
+        # Jobs still marked as running were interrupted, and are picked
+        # up again from their checkpoint, so only run one worker.
+        while True:
+            processed = deletion.run_deletion_jobs()
+            if processed:
+                logger.info('Ran %s deletion jobs', processed)
+                continue
+            if options['once']:
+                break
+            sleep(options['poll_interval'])
@@ -0,0 +1,44 @@
+"""Partitions the history tables by month, and creates future partitions"""
+
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+import django.utils.timezone
+
+import server.utils
+from server import partitions
+
+
+class Command(BaseCommand):
+    help = 'Partitions the history tables by month, and creates future partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Convert unpartitioned history tables. This locks them while their rows '
+                 'are copied, so stop checkins first.')
+        parser.add_argument(
+            '--months-ahead', help='Months of partitions to create in advance',
+            default=partitions.MONTHS_AHEAD, type=int)
+
+    def handle(self, *args, **options):
+        if not server.utils.is_postgres():
+            raise CommandError('Partitioning is only supported on Postgres.')
+
+        months_ahead = options['months_ahead']
+        # Rows past the retention limit are about to be deleted, so
+        # they go in the default partition rather than monthly ones.
+        historical_days = server.utils.get_setting('historical_retention')
+        datelimit = django.utils.timezone.now() - datetime.timedelta(days=historical_days)
+        for model in partitions.PARTITIONED_FIELDS:
+            table = model._meta.db_table
+            if not partitions.is_partitioned(model):
+                if not options['convert']:
+                    self.stdout.write(f'{table} is not partitioned; use --convert to partition it.')
+                    continue
+                partitions.convert_to_partitioned(model, months_ahead, datelimit)
+                self.stdout.write(f'Converted {table} to a partitioned table.')
+
+            for name in partitions.create_future_partitions(model, months_ahead):
+                self.stdout.write(f'Created partition {name}.')
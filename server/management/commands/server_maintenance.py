@@ -7,11 +7,16 @@ from time import sleep
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 import django.utils.timezone
 
 import server.utils
-from server.models import (PluginScriptSubmission, HistoricalFact, Machine, ManagedItemHistory,
-                           ManagementSource)
+from inventory import install_counts
+from server import partitions
+from server.deletion import delete_in_batches
+from server.models import (PluginScriptSubmission, Fact, FactValue, HistoricalFact, Machine,
+                           ManagedItemHistory, ManagementSource)
 
 
 class Command(BaseCommand):
@@ -30,20 +35,38 @@ class Command(BaseCommand):
         datelimit = django.utils.timezone.now() - datetime.timedelta(days=historical_days)
 
         # Clear out too-old plugin script submissions.
-        PluginScriptSubmission.objects.filter(recorded__lt=datelimit).delete()
-
-        # Clear out-of-date ManagedItemHistories
-        ManagedItemHistory.objects.filter(recorded__lt=datelimit).delete()
+        delete_in_batches(
+            PluginScriptSubmission.objects.filter(recorded__lt=datelimit),
+            checkpoint='plugin_script_submissions')
+
+        # Clear out-of-date ManagedItemHistories. Partitioned history
+        # tables drop whole months at a time, and get partitions created
+        # ahead of the rows that will go in them.
+        partitions.enforce_retention(ManagedItemHistory, datelimit)
+        for model in partitions.PARTITIONED_FIELDS:
+            if partitions.is_partitioned(model):
+                partitions.create_future_partitions(model)
 
         for source in ManagementSource.objects.exclude(name__in=('Machine', 'Sal')):
             if (not source.manageditem_set.count()
                     and not source.manageditemhistory_set.count()  # noqa
                     and not source.facts.count()  # noqa
                     and not source.historical_facts.count()  # noqa
-                    and not source.messages.count()):  # noqa
+                    and not source.messages.count()  # noqa
+                    and not source.submissionhash_set.count()):  # noqa
                 source.delete()
+        server.utils.clear_management_source_cache()
+
+        partitions.enforce_retention(HistoricalFact, datelimit)
 
-        HistoricalFact.objects.filter(fact_recorded__lt=datelimit).delete()
+        # Remove stored fact values that no fact refers to any more.
+        # Rather than tracking which values lose their last reference,
+        # this checks every stored value against the fact_value indexes
+        # of both fact tables. There's only one row per distinct large
+        # value, so the table stays small next to the facts.
+        delete_in_batches(FactValue.objects.filter(
+            ~Exists(Fact.objects.filter(fact_value=OuterRef('pk'))),
+            ~Exists(HistoricalFact.objects.filter(fact_value=OuterRef('pk')))))
 
         try:
             inactive_undeploy = int(settings.INACTIVE_UNDEPLOYED)
@@ -51,8 +74,12 @@ class Command(BaseCommand):
             if inactive_undeploy > 0:
                 now = django.utils.timezone.now()
                 inactive_days = now - datetime.timedelta(days=inactive_undeploy)
-                Machine.deployed_objects.filter(
-                    last_checkin__lte=inactive_days).update(deployed=False)
+                inactive = Machine.deployed_objects.filter(last_checkin__lte=inactive_days)
+                # Queryset updates don't send signals, so take the
+                # machines out of the install count rollup first.
+                with transaction.atomic():
+                    install_counts.remove_machines(inactive)
+                    inactive.update(deployed=False)
         except Exception:
             pass
 
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0095_auto_20240421_1542'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedCheckin',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('serial', models.CharField(db_index=True, max_length=100)),
+                ('shard', models.IntegerField(db_index=True)),
+                ('submission', models.TextField()),
+                ('received', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('available', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('attempts', models.IntegerField(default=0)),
+                ('failed', models.BooleanField(db_index=True, default=False)),
+                ('last_error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
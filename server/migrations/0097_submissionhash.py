@@ -0,0 +1,26 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0096_queuedcheckin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionHash',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('sha256', models.CharField(max_length=64)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server.machine')),
+                ('management_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server.managementsource')),
+            ],
+            options={
+                'unique_together': {('machine', 'management_source')},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+
+
+# Rows updated per transaction, so that converting large tables doesn't
+# hold one huge transaction open.
+CHUNK_SIZE = 50000
+FACT_MODELS = ('Fact', 'HistoricalFact')
+
+
+def id_ranges(model):
+    ids = model.objects.aggregate(first=Min('id'), last=Max('id'))
+    if ids['first'] is None:
+        return
+    for start in range(ids['first'], ids['last'] + 1, CHUNK_SIZE):
+        yield start, start + CHUNK_SIZE
+
+
+def populate_fact_names(apps, schema_editor):
+    """Point every fact at the FactName for its name.
+
+    Work is done in chunks of IDs, each committed on its own, and only
+    rows without a FactName are touched; if interrupted, running the
+    migration again picks up where it left off.
+    """
+    FactName = apps.get_model('server', 'FactName')
+    for model_name in FACT_MODELS:
+        model = apps.get_model('server', model_name)
+        names = set(model.objects.values_list('fact_name', flat=True).distinct())
+        FactName.objects.bulk_create(
+            [FactName(name=name) for name in names], batch_size=1000, ignore_conflicts=True)
+
+        fact_name_id = FactName.objects.filter(name=OuterRef('fact_name')).values('id')[:1]
+        for start, end in id_ranges(model):
+            with transaction.atomic():
+                model.objects.filter(
+                    id__gte=start, id__lt=end, fact_name_ref__isnull=True,
+                ).update(fact_name_ref=Subquery(fact_name_id))
+
+
+def restore_fact_names(apps, schema_editor):
+    FactName = apps.get_model('server', 'FactName')
+    for model_name in FACT_MODELS:
+        model = apps.get_model('server', model_name)
+        name = FactName.objects.filter(id=OuterRef('fact_name_ref')).values('name')[:1]
+        for start, end in id_ranges(model):
+            with transaction.atomic():
+                model.objects.filter(id__gte=start, id__lt=end).update(fact_name=Subquery(name))
+
+
+class Migration(migrations.Migration):
+
+    # Each chunk is committed as it's done.
+    atomic = False
+
+    dependencies = [
+        ('server', '0098_factname'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_fact_names, restore_fact_names),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0099_populate_factnames'),
+    ]
+
+    operations = [
+        # The defaults let the text columns be added back, before
+        # they're filled in, if this is reversed.
+        migrations.AlterField(
+            model_name='fact',
+            name='fact_name',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='historicalfact',
+            name='fact_name',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='fact',
+            name='fact_name',
+        ),
+        migrations.RenameField(
+            model_name='fact',
+            old_name='fact_name_ref',
+            new_name='fact_name',
+        ),
+        migrations.AlterField(
+            model_name='fact',
+            name='fact_name',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, related_name='facts',
+                to='server.factname'),
+        ),
+        migrations.RemoveField(
+            model_name='historicalfact',
+            name='fact_name',
+        ),
+        migrations.RenameField(
+            model_name='historicalfact',
+            old_name='fact_name_ref',
+            new_name='fact_name',
+        ),
+        migrations.AlterField(
+            model_name='historicalfact',
+            name='fact_name',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, related_name='historical_facts',
+                to='server.factname'),
+        ),
+        migrations.AlterModelOptions(
+            name='fact',
+            options={'ordering': ['fact_name__name']},
+        ),
+        migrations.AlterModelOptions(
+            name='historicalfact',
+            options={'ordering': ['fact_name__name', 'fact_recorded']},
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0100_fact_name_fk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactValue',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fact',
+            name='fact_value',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='facts', to='server.factvalue'),
+        ),
+        migrations.AddField(
+            model_name='historicalfact',
+            name='fact_value',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='historical_facts', to='server.factvalue'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0102_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='munki_version_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='operating_system_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='sal_version_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0103_machine_version_keys'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='fact',
+            options={'ordering': ['fact_name_id']},
+        ),
+        migrations.AlterModelOptions(
+            name='historicalfact',
+            options={'ordering': ['fact_name_id', 'fact_recorded']},
+        ),
+    ]
@@ -1,11 +1,8 @@
 import plistlib
 import secrets
 import string
-from datetime import datetime
 from xml.parsers.expat import ExpatError
 
-import pytz
-from dateutil.parser import parse
 from ulid2 import generate_ulid_as_uuid
 
 from django.contrib.auth.models import User
@@ -13,6 +10,8 @@ from django.db import models
 from django.utils import timezone
 
 from utils import text_utils
+from utils.typed_values import get_typed_value, get_typed_values
+from utils.versions import KEY_LENGTH, get_version_key
 
 
 OS_CHOICES = (
@@ -75,6 +74,7 @@ User.userprofile = property(lambda u: UserProfile.objects.get_or_create(user=u)[
 class BusinessUnit(models.Model):
     name = models.CharField(max_length=100)
     users = models.ManyToManyField(User, blank=True)
+    pending_deletion = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
@@ -92,6 +92,7 @@ class MachineGroup(models.Model):
     name = models.CharField(max_length=100)
     key = models.CharField(db_index=True, max_length=255, unique=True,
                            blank=True, null=True, editable=False)
+    pending_deletion = models.BooleanField(default=False)
 
     def save(self, **kwargs):
         if not self.id:
@@ -143,9 +144,36 @@ class Machine(models.Model):
     munki_version = models.CharField(db_index=True, max_length=256, null=True, blank=True)
     manifest = models.CharField(db_index=True, max_length=256, null=True, blank=True)
 
+    # Sortable keys of the version fields, for ordering and range
+    # filtering them in the database; see utils.versions.
+    sal_version_key = models.CharField(
+        db_index=True, max_length=KEY_LENGTH, null=True, blank=True, editable=False)
+    operating_system_key = models.CharField(
+        db_index=True, max_length=KEY_LENGTH, null=True, blank=True, editable=False)
+    munki_version_key = models.CharField(
+        db_index=True, max_length=KEY_LENGTH, null=True, blank=True, editable=False)
+
     objects = models.Manager()  # The default manager.
     deployed_objects = DeployedManager()
 
+    VERSION_KEY_FIELDS = {
+        'sal_version': 'sal_version_key',
+        'operating_system': 'operating_system_key',
+        'munki_version': 'munki_version_key'}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+        for name, key_name in self.VERSION_KEY_FIELDS.items():
+            if update_fields is None or name in update_fields:
+                setattr(self, key_name, get_version_key(getattr(self, name)))
+                if update_fields is not None:
+                    update_fields.add(key_name)
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super(Machine, self).save(*args, **kwargs)
+
     def get_fields(self):
         return [(field.name, field.value_to_string(self)) for field in Machine._meta.fields]
 
@@ -195,35 +223,23 @@ class PluginScriptRow(models.Model):
     submission_and_script_name = models.TextField()
 
     def save(self):
-        try:
-            self.pluginscript_data_int = int(self.pluginscript_data)
-        except (ValueError, TypeError):
-            self.pluginscript_data_int = 0
-
-        self.pluginscript_data_string = str(self.pluginscript_data)
-
-        try:
-            date_data = parse(self.pluginscript_data)
-            if not date_data.tzinfo:
-                date_data = date_data.replace(tzinfo=pytz.UTC)
-            self.pluginscript_data_date = date_data
-        except ValueError:
-            # Try converting it to an int if we're here
-            try:
-                if int(self.pluginscript_data) != 0:
-
-                    try:
-                        self.pluginscript_data_date = datetime.fromtimestamp(
-                            int(self.pluginscript_data), tz=pytz.UTC)
-                    except (ValueError, TypeError):
-                        self.pluginscript_data_date = None
-                else:
-                    self.pluginscript_data_date = None
-            except (ValueError, TypeError):
-                self.pluginscript_data_date = None
-
+        self.set_typed_values()
         super(PluginScriptRow, self).save()
 
+    @classmethod
+    def prepare_for_bulk_create(cls, rows):
+        typed_values = get_typed_values(row.pluginscript_data for row in rows)
+        for row in rows:
+            row.set_typed_values(typed_values[row.pluginscript_data])
+
+    def set_typed_values(self, typed_value=None):
+        """Fill the typed copies of `pluginscript_data` used by search."""
+        if typed_value is None:
+            typed_value = get_typed_value(self.pluginscript_data)
+        self.pluginscript_data_int = typed_value.int_value
+        self.pluginscript_data_string = typed_value.string_value
+        self.pluginscript_data_date = typed_value.date_value
+
     def __str__(self):
         return '%s: %s' % (self.pluginscript_name, self.pluginscript_data)
 
@@ -347,19 +363,59 @@ class ManagedItemHistory(models.Model):
             f"{self.recorded}")
 
 
+class FactName(models.Model):
+    """Each distinct fact name, stored once for all Facts.
+
+    Facts and HistoricalFacts refer to their name by ID, rather than
+    repeating it on every row. Use `server.utils.get_fact_names` to
+    look names up when writing facts.
+    """
+    name = models.TextField(unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
+class FactValue(models.Model):
+    """A large fact value, stored once for all Facts that have it.
+
+    When the `FACT_VALUE_STORE_THRESHOLD` setting is enabled, facts
+    with longer values refer to one of these by the SHA-256 of the
+    value, and leave their own `fact_data` empty. Use
+    `server.utils.get_fact_values` to store values when writing facts.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    data = models.TextField()
+
+    def __str__(self):
+        return self.sha256
+
+
 class Fact(models.Model):
     id = models.BigAutoField(primary_key=True)
     machine = models.ForeignKey(Machine, related_name='facts', on_delete=models.CASCADE)
     management_source = models.ForeignKey(
         ManagementSource, related_name='facts', on_delete=models.CASCADE, null=True)
-    fact_name = models.TextField()
+    fact_name = models.ForeignKey(FactName, related_name='facts', on_delete=models.PROTECT)
     fact_data = models.TextField()
+    fact_value = models.ForeignKey(
+        FactValue, related_name='facts', on_delete=models.PROTECT, null=True, blank=True)
 
     def __str__(self):
-        return '%s: %s' % (self.fact_name, self.fact_data)
+        return '%s: %s' % (self.fact_name, self.value)
+
+    @property
+    def value(self):
+        """The fact's value, whether it's stored inline or not."""
+        return self.fact_value.data if self.fact_value_id else self.fact_data
 
     class Meta:
-        ordering = ['fact_name']
+        # Sorting by name would join FactName on every query; views that
+        # list facts sort them by name themselves.
+        ordering = ['fact_name_id']
 
 
 class HistoricalFact(models.Model):
@@ -367,15 +423,24 @@ class HistoricalFact(models.Model):
     machine = models.ForeignKey(Machine, related_name='historical_facts', on_delete=models.CASCADE)
     management_source = models.ForeignKey(
         ManagementSource, related_name='historical_facts', on_delete=models.CASCADE, null=True)
-    fact_name = models.CharField(max_length=255)
+    fact_name = models.ForeignKey(
+        FactName, related_name='historical_facts', on_delete=models.PROTECT)
     fact_data = models.TextField()
+    fact_value = models.ForeignKey(
+        FactValue, related_name='historical_facts', on_delete=models.PROTECT, null=True,
+        blank=True)
     fact_recorded = models.DateTimeField()
 
     def __str__(self):
-        return self.fact_name
+        return str(self.fact_name)
+
+    @property
+    def value(self):
+        """The fact's value, whether it's stored inline or not."""
+        return self.fact_value.data if self.fact_value_id else self.fact_data
 
     class Meta:
-        ordering = ['fact_name', 'fact_recorded']
+        ordering = ['fact_name_id', 'fact_recorded']
 
 
 class Message(models.Model):
@@ -392,3 +457,76 @@ class Message(models.Model):
         ('DEBUG', 'Debug'),
     )
     message_type = models.CharField(max_length=7, choices=MESSAGE_TYPES, default='OTHER')
+
+
+class SubmissionHash(models.Model):
+    """Hash of the last checkin section a machine sent for a source."""
+    id = models.BigAutoField(primary_key=True)
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
+    management_source = models.ForeignKey(ManagementSource, on_delete=models.CASCADE)
+    sha256 = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f'{self.machine}: {self.management_source}'
+
+    class Meta:
+        unique_together = ('machine', 'management_source')
+
+
+class DeletionJob(models.Model):
+    """A business unit or machine group queued for deletion.
+
+    The `deletion_worker` management command deletes the target's
+    machines in batches, then the target itself. Until it's done, the
+    target is marked `pending_deletion`, so it's left out of dashboards
+    and its machines can't check in. That includes jobs that have
+    failed, until they're retried.
+    """
+    TARGET_TYPES = (
+        ('business_unit', 'Business Unit'),
+        ('machine_group', 'Machine Group'),
+    )
+    STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+    target_type = models.CharField(max_length=20, choices=TARGET_TYPES)
+    target_id = models.IntegerField()
+    target_name = models.CharField(max_length=100)
+    status = models.CharField(db_index=True, max_length=7, choices=STATUS_CHOICES, default='QUEUED')
+    total = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.get_target_type_display()} {self.target_name}: {self.status}'
+
+    @property
+    def percent_done(self):
+        return int(self.deleted * 100 / self.total) if self.total else 100
+
+    class Meta:
+        ordering = ['id']
+
+
+class QueuedCheckin(models.Model):
+    """A client checkin spooled for processing by the checkin worker."""
+    id = models.BigAutoField(primary_key=True)
+    serial = models.CharField(db_index=True, max_length=100)
+    shard = models.IntegerField(db_index=True)
+    submission = models.TextField()
+    received = models.DateTimeField(db_index=True, default=timezone.now)
+    available = models.DateTimeField(db_index=True, default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    failed = models.BooleanField(db_index=True, default=False)
+    last_error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.serial}: {self.received}'
+
+    class Meta:
+        ordering = ['id']
@@ -1,16 +1,24 @@
+import hashlib
 import itertools
 import json
 import logging
 import re
-from collections import defaultdict
+import threading
+from collections import Counter
 
 import dateutil.parser
 import pytz
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 import django.utils.timezone
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from django.http import HttpResponse, JsonResponse, Http404, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
@@ -18,9 +26,12 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils.html import escape
 
+import server.checkin_queue
+import server.checkin_timing
 import server.utils
+import utils.compression
 import utils.csv
-from sal.decorators import key_auth_required
+from sal.decorators import admission_control, get_submitted_machine_group, key_auth_required
 from sal.plugin import Widget, ReportPlugin, PluginManager
 from server.models import (
     Machine,
@@ -32,11 +43,13 @@ from server.models import (
     Report,
     ManagedItem,
     MachineDetailPlugin,
-    ManagementSource,
     ManagedItemHistory,
+    SubmissionHash,
 )
 
 
+# ijson's errors don't subclass ValueError.
+JSON_ERRORS = (ijson.JSONError, StopIteration) if ijson is not None else ()
 # The database probably isn't going to change while this is loaded.
 IS_POSTGRES = server.utils.is_postgres()
 HISTORICAL_FACTS = set(server.utils.get_django_setting("HISTORICAL_FACTS", []))
@@ -46,13 +59,26 @@ if server.utils.get_django_setting("IGNORE_FACTS"):
     )
 else:
     IGNORE_PREFIXES = None
+# Sections are only skipped if they hash the same under the same
+# fact filtering.
+HASH_SALT = (IGNORE_PREFIXES.pattern if IGNORE_PREFIXES else "").encode()
+SECTION_STATS = Counter()
+SECTION_STATS_LOCK = threading.Lock()
 # Build a translation table for serial numbers, to remove garbage
 # VMware puts in.
 SERIAL_TRANSLATE = {ord(c): None for c in "+/"}
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+# Stands in for the lines of an NDJSON checkin batch that aren't JSON.
+INVALID_JSON = object()
+
 logger = logging.getLogger(__name__)
 
 
+class InvalidSubmission(ValueError):
+    pass
+
+
 @login_required
 def tableajax(request, plugin_name, data, group_type="all", group_id=None):
     """Table ajax for dataTables"""
@@ -181,6 +207,7 @@ def export_csv(request, plugin_name, data, group_type="all", group_id=None):
 
 @csrf_exempt
 @key_auth_required
+@admission_control("light")
 def preflight_v2(request):
     """Find plugins that have embedded preflight scripts."""
     # Load in the default plugins if needed
@@ -208,6 +235,7 @@ def preflight_v2(request):
 
 @csrf_exempt
 @key_auth_required
+@admission_control("light")
 def preflight_v2_get_script(request, plugin_name, script_name):
     output = []
     plugin = PluginManager.get_plugin_by_name(plugin_name)
@@ -222,6 +250,7 @@ def preflight_v2_get_script(request, plugin_name, script_name):
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control("light")
 def report_broken_client(request):
     data = request.POST
 
@@ -232,7 +261,7 @@ def report_broken_client(request):
     machine = get_object_or_404(Machine, serial=serial)
 
     machine_group_key = data.get("key")
-    machine.machine_group = get_object_or_404(MachineGroup, key=machine_group_key)
+    machine.machine_group = get_submitted_machine_group(machine_group_key, request)
 
     machine.last_checkin = django.utils.timezone.now()
     machine.hostname = data.get("name", "<NO NAME>")
@@ -253,39 +282,364 @@ def report_broken_client(request):
 @csrf_exempt
 @require_POST
 @key_auth_required
+@admission_control("heavy")
 def checkin(request):
+    if not server.utils.get_django_setting("CHECKIN_TIMING", False):
+        return _checkin(request)
+
+    with server.checkin_timing.Recorder() as recorder:
+        response = _checkin(request)
+    response["Server-Timing"] = recorder.server_timing()
+    recorder.finish(status=response.status_code)
+    return response
+
+
+def _checkin(request):
     if request.content_type != "application/json":
         return HttpResponseBadRequest(
             'Checkin must be content-type "application/json"!'
         )
     # Ensure we have the bare minimum data before continuing.
     try:
-        submission = json.loads(request.body.decode())
-    except json.JSONDecodeError:
+        with server.checkin_timing.phase("decode"):
+            submission = load_checkin_body(request)
+    except utils.compression.BodyTooLarge as error:
+        return HttpResponse(str(error), status=413)
+    except utils.compression.UnsupportedEncoding as error:
+        return HttpResponse(str(error), status=415)
+    except (ValueError, OSError, EOFError) + JSON_ERRORS:
+        # Decompression errors are OSErrors or EOFErrors, bad JSON
+        # ValueErrors.
         return HttpResponseBadRequest("Checkin has invalid JSON!")
-    if not isinstance(submission, dict) or "Machine" not in submission:
-        return HttpResponseBadRequest('Checkin JSON is missing required key "Machine"!')
-
     # Process machine submission information.
     try:
-        serial = submission["Machine"]["extra_data"].get("serial")
-    except KeyError:
+        serial = get_submission_serial(submission)
+    except InvalidSubmission as error:
+        return HttpResponseBadRequest(str(error))
+
+    machine_group = get_submitted_machine_group(
+        submission["Sal"]["extra_data"].get("key"), request
+    )
+
+    if server.utils.get_django_setting("CHECKIN_QUEUE", False):
+        if not server.utils.get_django_setting("ADD_NEW_MACHINES", True):
+            get_object_or_404(Machine, serial=serial)
+        with server.checkin_timing.phase("enqueue"):
+            server.checkin_queue.enqueue(serial, json.dumps(submission))
+        msg = f"Sal report queued for {serial}"
+        status = 202
+    else:
+        machine = process_checkin_in_transaction(submission, machine_group)
+        msg = f"Sal report submitted for {machine.serial}"
+        status = 200
+
+    if server.utils.get_setting("send_data") in (None, True):
+        # If setting is None, it hasn't been configured yet; assume True
+        try:
+            # If the report server is down, don't halt all submissions
+            with server.checkin_timing.phase("send_report"):
+                server.utils.send_report()
+        except Exception as e:
+            logger.debug(e)
+
+    logger.debug(msg)
+    return HttpResponse(msg, status=status)
+
+
+@csrf_exempt
+@require_POST
+@key_auth_required
+@admission_control("heavy")
+def checkin_batch(request):
+    """Process many checkins in one request.
+
+    Meant for relays that buffer checkins and replay them later. The
+    body is either a JSON array of checkin submissions, or one
+    submission per line with a content-type of "application/x-ndjson".
+    Bodies may be compressed, as for `checkin`.
+
+    Each submission succeeds or fails on its own. The response is a
+    JSON object whose "results" list has the serial, HTTP status code
+    and message of every submission, in the order they were sent.
+    """
+    if request.content_type not in ("application/json",) + NDJSON_CONTENT_TYPES:
         return HttpResponseBadRequest(
-            'Checkin JSON is missing required "Machine" key "serial"!'
+            'Checkin batches must be content-type "application/json" or "application/x-ndjson"!'
         )
-    if not serial:
-        return HttpResponseBadRequest(
-            'Checkin JSON is missing required "Machine" key "serial"!'
+    try:
+        submissions = load_checkin_batch(request)
+    except utils.compression.BodyTooLarge as error:
+        return HttpResponse(str(error), status=413)
+    except utils.compression.UnsupportedEncoding as error:
+        return HttpResponse(str(error), status=415)
+    except (ValueError, OSError, EOFError) + JSON_ERRORS:
+        return HttpResponseBadRequest("Checkin batch has invalid JSON!")
+
+    results = process_checkin_batch(submissions)
+
+    if server.utils.get_setting("send_data") in (None, True):
+        try:
+            server.utils.send_report()
+        except Exception as e:
+            logger.debug(e)
+
+    return JsonResponse({"results": results})
+
+
+def load_checkin_batch(request):
+    """Decompress and parse a batch of checkins.
+
+    Returns:
+        list of submissions. Lines of an NDJSON batch that can't be
+        parsed are returned as `INVALID_JSON`, so that only they fail.
+
+    Raises:
+        utils.compression.BodyTooLarge if the batch has more than
+        `CHECKIN_BATCH_MAX_SIZE` submissions, or is larger than
+        `CHECKIN_MAX_BODY_SIZE` after decompression.
+        utils.compression.UnsupportedEncoding for unknown encodings.
+        ValueError, OSError or EOFError if the body can't be
+        decompressed or parsed.
+    """
+    stream = utils.compression.open_encoded_stream(
+        request,
+        request.headers.get("Content-Encoding", ""),
+        server.utils.get_django_setting("CHECKIN_MAX_BODY_SIZE"),
+    )
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        submissions = (_load_json_line(line) for line in _read_lines(stream) if line.strip())
+    elif ijson is not None:
+        events = ijson.parse(stream, use_float=True)
+        first = next(events)
+        if first[1] != "start_array":
+            raise ValueError("Checkin batch is not a list")
+        submissions = ijson.items(itertools.chain([first], events), "item")
+    else:
+        submissions = json.loads(stream.read())
+        if not isinstance(submissions, list):
+            raise ValueError("Checkin batch is not a list")
+
+    max_size = server.utils.get_django_setting("CHECKIN_BATCH_MAX_SIZE")
+    # Stop parsing as soon as the batch is known to be too big.
+    batch = list(itertools.islice(submissions, max_size + 1))
+    if len(batch) > max_size:
+        raise utils.compression.BodyTooLarge(
+            f"Checkin batches may have at most {max_size} submissions"
+        )
+    return batch
+
+
+def _read_lines(stream):
+    remainder = b""
+    for chunk in iter(lambda: stream.read(utils.compression.CHUNK_SIZE), b""):
+        *lines, remainder = (remainder + chunk).split(b"\n")
+        yield from lines
+    yield remainder
+
+
+def _load_json_line(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return INVALID_JSON
+
+
+def process_checkin_batch(submissions):
+    """Record a batch of checkin submissions.
+
+    All of the batch's machines and machine groups are looked up
+    up front, in one query each. Every submission is then processed in
+    its own transaction, so one failing doesn't affect the others.
+
+    Args:
+        submissions (list): Decoded checkin submissions.
+
+    Returns:
+        list of dicts with the "serial", "status" and "message" of each
+        submission.
+    """
+    results = []
+    valid = []
+    for submission in submissions:
+        result = {"serial": None, "status": 200, "message": ""}
+        results.append(result)
+        if submission is INVALID_JSON:
+            result.update(status=400, message="Checkin has invalid JSON!")
+            continue
+        try:
+            result["serial"] = get_submission_serial(submission)
+        except InvalidSubmission as error:
+            result.update(status=400, message=str(error))
+            continue
+        valid.append((result, submission, _get_submission_key(submission)))
+
+    machine_groups = {
+        machine_group.key: machine_group
+        for machine_group in MachineGroup.objects.filter(
+            key__in={key for *_, key in valid if key}, pending_deletion=False
         )
+    }
+    machines = {
+        machine.serial: machine
+        for machine in Machine.objects.filter(serial__in={result["serial"] for result, *_ in valid})
+    }
+    found = set(machines)
+    add_new_machines = server.utils.get_django_setting("ADD_NEW_MACHINES", True)
+    use_queue = server.utils.get_django_setting("CHECKIN_QUEUE", False)
+    queued = []
+
+    for result, submission, key in valid:
+        serial = result["serial"]
+        machine_group = machine_groups.get(key)
+        if machine_group is None:
+            result.update(status=404, message="No MachineGroup matches the given query.")
+            continue
+        if serial not in found and not add_new_machines:
+            result.update(status=404, message="No Machine matches the given query.")
+            continue
+
+        if use_queue:
+            queued.append((serial, json.dumps(submission)))
+            result.update(status=202, message=f"Sal report queued for {serial}")
+            continue
+
+        machine = machines.get(serial)
+        if machine is None and serial not in found:
+            machine = Machine(serial=serial)
+            logger.debug("Creating new machine for checkin: '%s'", serial)
+        try:
+            machines[serial] = process_checkin_in_transaction(
+                submission, machine_group, machine=machine)
+        except Http404 as error:
+            machines.pop(serial, None)
+            result.update(status=404, message=str(error))
+        except Exception as error:
+            # Drop the machine, as its state may not match the rolled
+            # back database; a later submission will fetch it again.
+            machines.pop(serial, None)
+            logger.exception("Checkin for '%s' in batch failed", serial)
+            result.update(status=500, message=f"Checkin failed: {error!r}")
+        else:
+            result["message"] = f"Sal report submitted for {serial}"
+
+    if queued:
+        server.checkin_queue.enqueue_many(queued)
+
+    return results
+
 
-    machine = process_checkin_serial(serial)
-    machine_group = get_object_or_404(
-        MachineGroup, key=submission["Sal"]["extra_data"].get("key")
+def get_submission_serial(submission):
+    """Return the normalized serial number of a checkin submission.
+
+    Raises:
+        InvalidSubmission if the submission is missing required data.
+    """
+    if not isinstance(submission, dict) or "Machine" not in submission:
+        raise InvalidSubmission('Checkin JSON is missing required key "Machine"!')
+    try:
+        serial = submission["Machine"]["extra_data"].get("serial")
+    except (KeyError, TypeError, AttributeError):
+        serial = None
+    if not serial or not isinstance(serial, str):
+        raise InvalidSubmission('Checkin JSON is missing required "Machine" key "serial"!')
+    # Take out some of the weird junk VMware puts in.
+    return serial.upper().translate(SERIAL_TRANSLATE)
+
+
+def _get_submission_key(submission):
+    try:
+        return submission["Sal"]["extra_data"].get("key")
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def load_checkin_body(request):
+    """Decompress and parse a checkin body as it is read.
+
+    Bodies may be compressed with any `Content-Encoding` supported by
+    `utils.compression`. The JSON is parsed straight from the
+    decompressing stream with `ijson`, so no copy of the whole document
+    is held in memory; installs without it fall back to reading the
+    whole body.
+
+    Raises:
+        utils.compression.BodyTooLarge if the decompressed body is
+        larger than the `CHECKIN_MAX_BODY_SIZE` setting.
+        utils.compression.UnsupportedEncoding for unknown encodings.
+        ValueError, OSError or EOFError if the body can't be
+        decompressed or parsed.
+    """
+    stream = utils.compression.open_encoded_stream(
+        request,
+        request.headers.get("Content-Encoding", ""),
+        server.utils.get_django_setting("CHECKIN_MAX_BODY_SIZE"),
     )
-    machine.machine_group = machine_group
-    machine.broken_client = False
-    machine.save()
-    clean_related(machine)
+    if ijson is not None:
+        return next(ijson.items(stream, "", use_float=True))
+    return json.loads(stream.read())
+
+
+def process_checkin_in_transaction(submission, machine_group=None, machine=None, received=None):
+    """Record a checkin submission in a single transaction.
+
+    Machine groups, management sources, fact names and fact values are
+    cached by each process, and another process may delete rows that
+    are still cached here. A checkin that refers to one fails its
+    foreign key checks when it commits; it is then retried once, with
+    empty caches and the machine and its group looked up again.
+
+    Foreign keys are only checked when the outermost transaction
+    commits, so this must not be called inside another one.
+
+    Arguments and return value are as for `process_checkin`.
+
+    Raises:
+        Http404 if the machine group no longer exists on retry, as
+        well as anything `process_checkin` raises.
+    """
+    try:
+        with transaction.atomic():
+            # process_checkin removes the plugin results from the
+            # submission, so give it a copy in case of a retry.
+            return process_checkin(dict(submission), machine_group, machine=machine, received=received)
+    except IntegrityError:
+        logger.warning(
+            "Checkin for '%s' referred to deleted rows; retrying",
+            submission["Machine"]["extra_data"].get("serial"))
+        server.utils.clear_checkin_caches()
+        with transaction.atomic():
+            return process_checkin(dict(submission), received=received)
+
+
+def process_checkin(submission, machine_group=None, machine=None, received=None):
+    """Record a checkin submission in the database.
+
+    The submission must already have been checked for the required
+    "Machine" data.
+
+    Args:
+        submission (dict): Decoded checkin JSON.
+        machine_group (MachineGroup): Group the machine belongs to. If
+            omitted, it's looked up with the submission's "Sal" key.
+        machine (Machine): The machine checking in, if it has already
+            been looked up. If omitted, it's looked up by serial.
+        received (datetime): When the submission was received. Used
+            as the checkin time, so spooled checkins are recorded when
+            they happened. Defaults to now.
+
+    Returns:
+        The Machine that checked in.
+
+    Raises:
+        Http404 if the machine group doesn't exist, or the machine
+        doesn't exist and new machines may not be added.
+    """
+    if machine_group is None:
+        machine_group = get_submitted_machine_group(submission["Sal"]["extra_data"].get("key"))
+
+    with server.checkin_timing.phase("machine"):
+        if machine is None:
+            machine = process_checkin_serial(submission["Machine"]["extra_data"]["serial"])
 
     object_queue = {
         "facts": [],
@@ -293,38 +647,53 @@ def checkin(request):
         "managed_items": [],
         "managed_item_histories": [],
         "messages": [],
+        "machine_fields": set(),
+        "unchanged_sources": set(),
+        "received": received or django.utils.timezone.now(),
     }
 
+    update_machine(machine, object_queue, machine_group=machine_group, broken_client=False)
+    if machine.pk is None:
+        # New machines need a primary key before their related objects
+        # can be built.
+        machine.save()
+        object_queue["machine_fields"].clear()
+
     # Pop off the plugin_results, because they are a list instead of
     # a dict.
     plugin_results = submission.pop("plugin_results", {})
-    for management_source_name, management_data in submission.items():
-        management_source, _ = ManagementSource.objects.get_or_create(
-            name=management_source_name
-        )
-
-        object_queue = process_management_submission(
-            management_source, management_data, machine, object_queue
-        )
-
-    object_queue = process_managed_item_histories(object_queue, machine)
+    stored_hashes = {row.management_source_id: row for row in machine.submissionhash_set.all()}
+    section_hashes = {}
+    with server.checkin_timing.phase("sources"):
+        for management_source_name, management_data in submission.items():
+            management_source = server.utils.get_management_source(management_source_name)
+            section_hash = hash_section(management_data)
+            section_hashes[management_source.pk] = section_hash
+            stored_hash = stored_hashes.get(management_source.pk)
+            unchanged = bool(stored_hash and stored_hash.sha256 == section_hash)
+            if unchanged:
+                object_queue["unchanged_sources"].add(management_source.pk)
+
+            object_queue = process_management_submission(
+                management_source, management_data, machine, object_queue, unchanged
+            )
+    record_section_stats(len(section_hashes), len(object_queue["unchanged_sources"]))
 
-    create_objects(object_queue)
+    with server.checkin_timing.phase("histories"):
+        object_queue = process_managed_item_histories(object_queue, machine)
 
-    server.utils.process_plugin_script(plugin_results, machine)
-    server.utils.run_plugin_processing(machine, submission)
+    with server.checkin_timing.phase("reconcile"):
+        flush_machine(machine, object_queue)
+        churn = reconcile_objects(object_queue, machine)
+        save_section_hashes(machine, stored_hashes, section_hashes)
+    logger.debug("Checkin row churn for %s: %s", machine.serial, churn)
 
-    if server.utils.get_setting("send_data") in (None, True):
-        # If setting is None, it hasn't been configured yet; assume True
-        try:
-            # If the report server is down, don't halt all submissions
-            server.utils.send_report()
-        except Exception as e:
-            logger.debug(e)
+    with server.checkin_timing.phase("plugin_script"):
+        server.utils.process_plugin_script(plugin_results, machine)
+    with server.checkin_timing.phase("plugins"):
+        server.utils.run_plugin_processing(machine, submission)
 
-    msg = f"Sal report submitted for {machine.serial}"
-    logger.debug(msg)
-    return HttpResponse(msg)
+    return machine
 
 
 def process_checkin_serial(serial):
@@ -344,24 +713,7 @@ def process_checkin_serial(serial):
     return machine
 
 
-def clean_related(machine):
-    # Clear out existing Facts and start from scratch.
-    facts = machine.facts.all()
-    if facts.exists():
-        facts._raw_delete(facts.db)
-
-    # Clear out existing ManagedItems and start from scratch.
-    managed_items = machine.manageditem_set.all()
-    if managed_items.exists():
-        managed_items._raw_delete(managed_items.db)
-
-    # Clear out existing Messages and start from scratch.
-    messages = machine.messages.all()
-    if messages.exists():
-        messages._raw_delete(messages.db)
-
-
-def process_management_submission(source, management_data, machine, object_queue):
+def process_management_submission(source, management_data, machine, object_queue, unchanged=False):
     """Process a single management source's data
 
     This function first optionally calls any additional processors for
@@ -369,11 +721,18 @@ def process_management_submission(source, management_data, machine, object_queue
 
     Then it processes Facts.
     Then ManagedItems.
+
+    If the section is `unchanged` since the machine's last checkin, its
+    stored rows are left as they are, so only historical facts are
+    processed.
     """
     # Add custom processor funcs to this dictionary.
     # The key should be the same name used in the submission for ManagementSource.
     # The func's signature must be
     # f(management_data: dict, machine: Machine, object_queue: dict)
+    # Funcs must not save the machine; use `update_machine` (or add
+    # the names of changed fields to object_queue["machine_fields"])
+    # and the changes are written once the submission is processed.
     processing_funcs = {
         "Machine": process_machine_submission,
         "Sal": process_sal_submission,
@@ -384,76 +743,132 @@ def process_management_submission(source, management_data, machine, object_queue
     if processing_func:
         object_queue = processing_func(management_data, machine, object_queue)
 
-    object_queue = process_facts(source, management_data, machine, object_queue)
-    object_queue = process_managed_items(source, management_data, machine, object_queue)
-    object_queue = process_messages(source, management_data, machine, object_queue)
+    object_queue = process_facts(source, management_data, machine, object_queue, unchanged)
+    if not unchanged:
+        object_queue = process_managed_items(source, management_data, machine, object_queue)
+        object_queue = process_messages(source, management_data, machine, object_queue)
 
     return object_queue
 
 
+def update_machine(machine, object_queue, **fields):
+    """Set Machine fields, recording the changed ones for flushing.
+
+    Args:
+        machine (Machine): The machine checking in.
+        object_queue (dict): The checkin's object queue.
+        **fields: Machine field names and their new values.
+    """
+    for name, value in fields.items():
+        field = Machine._meta.get_field(name)
+        current = getattr(machine, field.attname)
+        if name != field.attname:
+            # Compare relations by primary key.
+            new = value.pk if value is not None else None
+        else:
+            new = field.to_python(value)
+        if new != current:
+            setattr(machine, name, value)
+            object_queue["machine_fields"].add(name)
+
+
+def flush_machine(machine, object_queue):
+    """Write the machine's changed fields in a single UPDATE."""
+    if object_queue["machine_fields"]:
+        machine.save(update_fields=object_queue["machine_fields"])
+        object_queue["machine_fields"] = set()
+
+
 def process_machine_submission(machine_submission, machine, object_queue):
     extra_data = machine_submission.get("extra_data", {})
-    machine.hostname = extra_data.get("hostname", "<NO NAME>")
     # Drop the setup assistant user if encountered.
     console_user = extra_data.get("console_user")
     console_user = console_user if console_user != "_mbsetupuser" else None
-    machine.console_user = console_user
-    machine.os_family = extra_data.get("os_family", "Darwin")
-    machine.operating_system = extra_data.get("operating_system")
-    machine.hd_space = extra_data.get("hd_space")
-    machine.hd_total = extra_data.get("hd_total")
-    machine.hd_percent = extra_data.get("hd_percent")
-    machine.machine_model = extra_data.get("machine_model")
-    machine.machine_model_friendly = extra_data.get("machine_model_friendly")
-    machine.cpu_type = extra_data.get("cpu_type")
-    machine.cpu_speed = extra_data.get("cpu_speed")
-    machine.memory = extra_data.get("memory")
-    machine.memory_kb = extra_data.get("memory_kb", 0)
-    machine.save()
+    update_machine(
+        machine,
+        object_queue,
+        hostname=extra_data.get("hostname", "<NO NAME>"),
+        console_user=console_user,
+        os_family=extra_data.get("os_family", "Darwin"),
+        operating_system=extra_data.get("operating_system"),
+        hd_space=extra_data.get("hd_space"),
+        hd_total=extra_data.get("hd_total"),
+        hd_percent=extra_data.get("hd_percent"),
+        machine_model=extra_data.get("machine_model"),
+        machine_model_friendly=extra_data.get("machine_model_friendly"),
+        cpu_type=extra_data.get("cpu_type"),
+        cpu_speed=extra_data.get("cpu_speed"),
+        memory=extra_data.get("memory"),
+        memory_kb=extra_data.get("memory_kb", 0),
+    )
     return object_queue
 
 
 def process_sal_submission(sal_submission, machine, object_queue):
     extras = sal_submission.get("extra_data", {})
-    machine.sal_version = extras.get("sal_version")
-    machine.last_checkin = django.utils.timezone.now()
+    update_machine(
+        machine,
+        object_queue,
+        sal_version=extras.get("sal_version"),
+        last_checkin=object_queue["received"],
+    )
 
     if server.utils.get_django_setting("DEPLOYED_ON_CHECKIN", True):
-        machine.deployed = True
+        update_machine(machine, object_queue, deployed=True)
 
-    machine.save()
     return object_queue
 
 
 def process_munki_extra_keys(management_data, machine, object_queue):
     extra_data = management_data.get("extra_data", {})
-    machine.munki_version = extra_data.get("munki_version")
-    machine.manifest = extra_data.get("manifest")
-    machine.save()
+    update_machine(
+        machine,
+        object_queue,
+        munki_version=extra_data.get("munki_version"),
+        manifest=extra_data.get("manifest"),
+    )
     return object_queue
 
 
-def process_facts(management_source, management_data, machine, object_queue):
-    now = django.utils.timezone.now()
-    for fact_name, fact_data in management_data.get("facts", {}).items():
-        if IGNORE_PREFIXES and IGNORE_PREFIXES.match(fact_name):
-            continue
-
-        object_queue["facts"].append(
-            Fact(
-                machine=machine,
-                fact_data=fact_data,
-                fact_name=fact_name,
-                management_source=management_source,
+def process_facts(management_source, management_data, machine, object_queue, unchanged=False):
+    now = object_queue["received"]
+    facts = {
+        fact_name: fact_data
+        for fact_name, fact_data in management_data.get("facts", {}).items()
+        if not (IGNORE_PREFIXES and IGNORE_PREFIXES.match(fact_name))
+    }
+    if unchanged:
+        # Only history is recorded for unchanged sections, so don't
+        # look up the names and values of the other facts.
+        facts = {name: data for name, data in facts.items() if name in HISTORICAL_FACTS}
+    fact_names = server.utils.get_fact_names(facts)
+    fact_values = server.utils.get_fact_values(
+        value for value in facts.values() if server.utils.should_store_fact_value(value)
+    )
+    for fact_name, fact_data in facts.items():
+        # Large values are stored once and referred to by hash.
+        fact_value_id = fact_values.get(fact_data) if isinstance(fact_data, str) else None
+        if fact_value_id:
+            fact_data = ""
+
+        if not unchanged:
+            object_queue["facts"].append(
+                Fact(
+                    machine=machine,
+                    fact_data=fact_data,
+                    fact_value_id=fact_value_id,
+                    fact_name=fact_names[fact_name],
+                    management_source=management_source,
+                )
             )
-        )
 
         if fact_name in HISTORICAL_FACTS:
             object_queue["historical_facts"].append(
                 HistoricalFact(
                     machine=machine,
                     fact_data=fact_data,
-                    fact_name=fact_name,
+                    fact_value_id=fact_value_id,
+                    fact_name=fact_names[fact_name],
                     management_source=management_source,
                     fact_recorded=now,
                 )
@@ -463,7 +878,7 @@ def process_facts(management_source, management_data, machine, object_queue):
 
 
 def process_managed_items(management_source, management_data, machine, object_queue):
-    now = django.utils.timezone.now()
+    now = object_queue["received"]
     for name, managed_item in management_data.get("managed_items", {}).items():
         object_queue["managed_items"].append(
             _process_managed_item(name, managed_item, machine, management_source, now)
@@ -493,12 +908,12 @@ def _process_managed_item(name, managed_item, machine, management_source, now):
 
 
 def process_managed_item_histories(object_queue, machine):
-    histories = machine.manageditemhistory_set.all()
+    latest_histories = _get_latest_histories(machine)
     for managed_item in object_queue["managed_items"]:
-        item_histories = histories.filter(
-            name=managed_item.name, management_source=managed_item.management_source
+        last_history = latest_histories.get(
+            (managed_item.management_source_id, managed_item.name)
         )
-        if _history_creation_needed(managed_item, item_histories.first()):
+        if _history_creation_needed(managed_item, last_history):
             object_queue["managed_item_histories"].append(
                 ManagedItemHistory(
                     name=managed_item.name,
@@ -512,6 +927,32 @@ def process_managed_item_histories(object_queue, machine):
     return object_queue
 
 
+def _get_latest_histories(machine):
+    """Get the newest ManagedItemHistory for each of a machine's items.
+
+    This is done in a single query, regardless of the number of items.
+
+    Returns:
+        dict of (management source ID, name) to ManagedItemHistory.
+    """
+    histories = machine.manageditemhistory_set.only(
+        "machine", "management_source", "name", "status"
+    )
+    if IS_POSTGRES:
+        latest = histories.order_by("management_source", "name", "-recorded").distinct(
+            "management_source", "name"
+        )
+    else:
+        newer = ManagedItemHistory.objects.filter(
+            machine=OuterRef("machine"),
+            management_source=OuterRef("management_source"),
+            name=OuterRef("name"),
+            recorded__gt=OuterRef("recorded"),
+        )
+        latest = histories.filter(~Exists(newer)).order_by()
+    return {(history.management_source_id, history.name): history for history in latest}
+
+
 def _history_creation_needed(managed_item, last_history):
     if not last_history or last_history.status != managed_item.status:
         return True
@@ -520,7 +961,7 @@ def _history_creation_needed(managed_item, last_history):
 
 
 def process_messages(management_source, management_data, machine, object_queue):
-    now = django.utils.timezone.now()
+    now = object_queue["received"]
     for message_item in management_data.get("messages", []):
         object_queue["messages"].append(
             Message(
@@ -535,23 +976,107 @@ def process_messages(management_source, management_data, machine, object_queue):
     return object_queue
 
 
-def create_objects(object_queue):
-    """Bulk create Fact, HistoricalFact, Message, and ManagedItem objects."""
+def reconcile_objects(object_queue, machine):
+    """Bring the machine's related objects in line with the object queue.
+
+    Facts, ManagedItems, and Messages are diffed against what is
+    already stored for the machine, so only new rows are inserted, only
+    changed rows are updated, and rows that are no longer submitted are
+    removed. Rows of sources in object_queue["unchanged_sources"] are
+    left alone entirely. HistoricalFacts and ManagedItemHistories are
+    only ever added.
+
+    Returns:
+        dict of object queue names to dicts of 'inserted', 'updated',
+        and 'deleted' row counts.
+    """
+    unchanged = object_queue.get("unchanged_sources", set())
+
+    def changed_objects(name):
+        return [
+            obj for obj in object_queue[name] if obj.management_source_id not in unchanged
+        ]
+
+    churn = {
+        "facts": server.utils.reconcile(
+            machine.facts.exclude(management_source__in=unchanged),
+            changed_objects("facts"),
+            ("management_source_id", "fact_name_id"),
+            ("fact_data", "fact_value"),
+        ),
+        "managed_items": server.utils.reconcile(
+            machine.manageditem_set.exclude(management_source__in=unchanged),
+            changed_objects("managed_items"),
+            ("management_source_id", "name"),
+            ("date_managed", "status", "data"),
+        ),
+        "messages": server.utils.reconcile(
+            machine.messages.exclude(management_source__in=unchanged),
+            changed_objects("messages"),
+            ("management_source_id", "message_type", "text"),
+            ("date",),
+        ),
+    }
+
     models = {
-        "facts": Fact,
         "historical_facts": HistoricalFact,
-        "managed_items": ManagedItem,
-        "messages": Message,
         "managed_item_histories": ManagedItemHistory,
     }
+    for name, model in models.items():
+        server.utils.bulk_create(model, object_queue[name])
+        churn[name] = {"inserted": len(object_queue[name]), "updated": 0, "deleted": 0}
 
-    for name, objects in object_queue.items():
-        _bulk_create_or_iterate_save(objects, models[name])
+    return churn
 
 
-def _bulk_create_or_iterate_save(objects, model):
-    if objects and IS_POSTGRES:
-        model.objects.bulk_create(objects)
-    else:
-        for item in objects:
-            item.save()
+def hash_section(management_data):
+    """Return a hash of a management source's checkin section.
+
+    Key order and whitespace don't affect the hash.
+    """
+    canonical = json.dumps(management_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(HASH_SALT + canonical.encode()).hexdigest()
+
+
+def save_section_hashes(machine, stored_hashes, section_hashes):
+    """Store the hashes of this checkin's sections.
+
+    Args:
+        machine (Machine): The machine checking in.
+        stored_hashes (dict): SubmissionHashes from the last checkin,
+            by management source ID.
+        section_hashes (dict): This checkin's section hashes, by
+            management source ID.
+    """
+    to_create = []
+    to_update = []
+    for source_id, section_hash in section_hashes.items():
+        stored = stored_hashes.get(source_id)
+        if stored is None:
+            to_create.append(
+                SubmissionHash(machine=machine, management_source_id=source_id, sha256=section_hash)
+            )
+        elif stored.sha256 != section_hash:
+            stored.sha256 = section_hash
+            to_update.append(stored)
+
+    # Sources that weren't submitted have had their rows removed.
+    to_delete = [row.pk for source_id, row in stored_hashes.items() if source_id not in section_hashes]
+    if to_delete:
+        SubmissionHash.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        SubmissionHash.objects.bulk_update(to_update, ["sha256"])
+    server.utils.bulk_create(SubmissionHash, to_create)
+
+
+def record_section_stats(checked, unchanged):
+    with SECTION_STATS_LOCK:
+        SECTION_STATS["checked"] += checked
+        SECTION_STATS["skipped"] += unchanged
+
+
+def get_section_stats():
+    """Return this process' counts of checkin sections skipped as unchanged."""
+    with SECTION_STATS_LOCK:
+        checked, skipped = SECTION_STATS["checked"], SECTION_STATS["skipped"]
+    return {"checked": checked, "skipped": skipped, "skip_ratio": skipped / checked if checked else 0}
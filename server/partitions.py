@@ -0,0 +1,270 @@
+"""Monthly range partitioning of the history tables on Postgres.
+
+HistoricalFact and ManagedItemHistory grow with every checkin, and
+enforcing the retention limit with a DELETE means rewriting most of
+the table. On Postgres, the `partition_history` management command can
+convert them to tables partitioned by month on their recorded date.
+Once they are, `server_maintenance` enforces retention by detaching and
+dropping whole partitions, and queries that filter on the recorded
+date only read the partitions in range.
+
+Clients supply their own recorded dates, so rows can fall outside every
+monthly partition; those go in a DEFAULT partition, which retention
+deletes from like an unpartitioned table.
+
+Partitioning is opt-in, and everything here is a no-op for tables that
+haven't been converted, including on databases other than Postgres.
+"""
+
+
+import datetime
+import logging
+import re
+
+from django.db import connection, transaction
+
+import server.utils
+from server.deletion import delete_in_batches
+from server.models import HistoricalFact, ManagedItemHistory
+
+
+# Models that may be partitioned, and the field each is partitioned on.
+PARTITIONED_FIELDS = {
+    HistoricalFact: 'fact_recorded',
+    ManagedItemHistory: 'recorded',
+}
+MONTHS_AHEAD = 3
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value):
+    """Return midnight UTC on the first day of `value`'s month."""
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def get_partition_name(model, start):
+    return f'{model._meta.db_table}_p{start:%Y%m}'
+
+
+def get_default_partition_name(model):
+    return f'{model._meta.db_table}_default'
+
+
+def parse_partition_name(model, name):
+    """Return the first day of the month a partition holds, or None."""
+    match = re.fullmatch(re.escape(model._meta.db_table) + r'_p(\d{4})(\d{2})', name)
+    if not match:
+        return None
+    return datetime.datetime(
+        int(match.group(1)), int(match.group(2)), 1, tzinfo=datetime.timezone.utc)
+
+
+def is_partitioned(model):
+    if not server.utils.is_postgres():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass',
+            [model._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(model):
+    """Return a dict of month start to partition name for a model."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass',
+            [model._meta.db_table])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        start = parse_partition_name(model, name)
+        if start:
+            partitions[start] = name
+    return partitions
+
+
+def has_default_partition(model):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [get_default_partition_name(model)])
+        return cursor.fetchone()[0] is not None
+
+
+def create_default_partition(model):
+    """Create the partition for rows outside the monthly ones, if missing.
+
+    Returns:
+        The name of the partition if it was created, or None.
+    """
+    if has_default_partition(model):
+        return None
+    name = get_default_partition_name(model)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} PARTITION OF {quote(model._meta.db_table)} DEFAULT')
+    return name
+
+
+def create_partitions(model, start, end):
+    """Create any missing monthly partitions from `start` up to `end`.
+
+    Rows the default partition holds for a new partition's month are
+    moved into it, as Postgres won't create the partition otherwise.
+
+    Returns:
+        list of the names of the partitions created.
+    """
+    existing = get_partitions(model)
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    column = quote(model._meta.get_field(PARTITIONED_FIELDS[model]).column)
+    default = quote(get_default_partition_name(model)) if has_default_partition(model) else None
+    created = []
+    month = month_start(start)
+    with connection.cursor() as cursor:
+        while month <= end:
+            next_month = add_months(month, 1)
+            if month not in existing:
+                name = get_partition_name(model, month)
+                with transaction.atomic():
+                    if default:
+                        cursor.execute(f'CREATE TEMPORARY TABLE moved_rows (LIKE {default})')
+                        cursor.execute(
+                            f'WITH moved AS (DELETE FROM {default} '
+                            f'WHERE {column} >= %s AND {column} < %s RETURNING *) '
+                            f'INSERT INTO moved_rows SELECT * FROM moved', [month, next_month])
+                    cursor.execute(
+                        f'CREATE TABLE {quote(name)} PARTITION OF {table} '
+                        f'FOR VALUES FROM (%s) TO (%s)', [month, next_month])
+                    if default:
+                        cursor.execute(f'INSERT INTO {table} SELECT * FROM moved_rows')
+                        cursor.execute('DROP TABLE moved_rows')
+                created.append(name)
+            month = next_month
+    return created
+
+
+def create_future_partitions(model, months_ahead=MONTHS_AHEAD, now=None):
+    """Make sure partitions exist for this month and `months_ahead` more.
+
+    Tables converted before they had a default partition get one too.
+    """
+    start = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    default = create_default_partition(model)
+    created = create_partitions(model, start, add_months(start, months_ahead))
+    return [default] + created if default else created
+
+
+def drop_partitions_before(model, cutoff):
+    """Detach and drop every partition that only holds rows before `cutoff`.
+
+    Returns:
+        list of the names of the partitions dropped.
+    """
+    dropped = []
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for start, name in sorted(get_partitions(model).items()):
+            if add_months(start, 1) > cutoff:
+                break
+            partition = connection.ops.quote_name(name)
+            with transaction.atomic():
+                cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {partition}')
+                cursor.execute(f'DROP TABLE {partition}')
+            logger.info('Dropped partition %s', name)
+            dropped.append(name)
+    return dropped
+
+
+def enforce_retention(model, cutoff):
+    """Delete a model's history from before `cutoff`.
+
+    Partitioned tables drop whole partitions first, so only the
+    partition the cutoff falls in and the default partition need rows
+    deleted from them. Other tables delete the rows in batches.
+    """
+    if is_partitioned(model):
+        drop_partitions_before(model, cutoff)
+    field = PARTITIONED_FIELDS[model]
+    delete_in_batches(
+        model.objects.filter(**{f'{field}__lt': cutoff}),
+        checkpoint=f'{model._meta.db_table}_retention')
+
+
+def convert_to_partitioned(model, months_ahead=MONTHS_AHEAD, start=None):
+    """Replace a model's table with one partitioned by month.
+
+    Existing rows are copied into partitions covering their months.
+    This locks the table for the duration, so should be done while no
+    clients are checking in.
+
+    Args:
+        model: The model whose table to convert.
+        months_ahead (int): Months of partitions to create in advance.
+        start (datetime): The earliest month to create a partition
+            for, usually the retention cutoff. Older rows, e.g. ones
+            with a bogus 1970 date, go in the default partition rather
+            than getting a partition for every month since.
+    """
+    table = model._meta.db_table
+    field = PARTITIONED_FIELDS[model]
+    column = model._meta.get_field(field).column
+    pk = model._meta.pk.column
+    old_table = f'{table}_unpartitioned'
+    quote = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Keep the definitions of the table's indexes and constraints,
+        # other than its primary key and NOT NULLs (which LIKE copies),
+        # to recreate on the new table.
+        # They refer to the table by name, so apply to the new one.
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ('
+            'SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)',
+            [table, table])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype NOT IN (%s, %s)',
+            [table, 'p', 'n'])
+        constraints = cursor.fetchall()
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, pk])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN({quote(column)}) FROM {quote(table)}')
+        earliest = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old_table)} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ({quote(column)})')
+        # Unique constraints on a partitioned table have to include the
+        # partition key.
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk)}, {quote(column)})')
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # Partitions start from the earliest row, but no earlier than
+        # `start`, and no later than this month.
+        first = earliest or now
+        if start is not None:
+            first = max(first, start)
+        create_default_partition(model)
+        create_partitions(model, min(first, now), add_months(month_start(now), months_ahead))
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}')
+        if sequence:
+            cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.{quote(pk)}')
+        # Dropping the old table frees up its index and constraint names.
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+
+        for index in indexes:
+            cursor.execute(index)
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
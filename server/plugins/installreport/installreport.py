@@ -7,7 +7,8 @@ from django.shortcuts import get_object_or_404
 
 import sal.plugin
 from catalog.models import Catalog
-from server.models import BusinessUnit, ManagedItem, ManagementSource
+import server.utils
+from server.models import BusinessUnit, ManagedItem
 
 
 class InstallReport(sal.plugin.ReportPlugin):
@@ -32,10 +33,7 @@ class InstallReport(sal.plugin.ReportPlugin):
                     'description', '')
 
         output = []
-        try:
-            munki = ManagementSource.objects.get(name='Munki')
-        except ManagementSource.DoesNotExist:
-            munki = None
+        munki = server.utils.get_management_source('Munki', create=False)
 
         installed_updates = (
             ManagedItem.objects
@@ -43,6 +41,8 @@ class InstallReport(sal.plugin.ReportPlugin):
             .values('name')
             .order_by()
             .distinct())
+        if munki is None:
+            installed_updates = installed_updates.none()
 
         for installed_update in installed_updates:
             item = {'name': installed_update['name']}
@@ -89,9 +89,8 @@ class InstallReport(sal.plugin.ReportPlugin):
         if not name:
             return None, None
 
-        try:
-            munki = ManagementSource.objects.get(name='Munki')
-        except ManagementSource.DoesNotExist:
+        munki = server.utils.get_management_source('Munki', create=False)
+        if munki is None:
             return None, None
 
         title = f'Machines with {name} {status}'
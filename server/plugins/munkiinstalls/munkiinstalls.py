@@ -1,8 +1,11 @@
 from datetime import datetime, time, timedelta
 
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 import sal.plugin
+import server.utils
 from server.models import ManagedItemHistory
 
 
@@ -17,6 +20,7 @@ class MunkiInstalls(sal.plugin.Widget):
 
     def get_context(self, queryset, **kwargs):
         context = self.super_get_context(queryset, **kwargs)
+        munki = server.utils.get_management_source('Munki', create=False)
 
         # Set up 14 days back of time ranges as a generator.
         now = timezone.now()
@@ -26,20 +30,30 @@ class MunkiInstalls(sal.plugin.Widget):
             timezone.make_aware(datetime.combine(d, time.max))) for d in days)
 
         # For each day, get a count of installs, pending, and errors,
-        # and the date, as a list of dicts.
+        # and the date, as a list of dicts. These are all counted in one
+        # query, limited to the whole 14 days so that a partitioned
+        # history table only reads the partitions in range.
+        time_ranges = list(time_ranges)
+        counts = {
+            f'{key}_{index}': Count(
+                'id', filter=Q(status_lower=key, recorded__range=time_range))
+            for index, time_range in enumerate(time_ranges) for key in STATUSES}
+        if munki is None:
+            # Nothing has been recorded by Munki yet.
+            totals = dict.fromkeys(counts, 0)
+        else:
+            totals = (
+                ManagedItemHistory.objects
+                .filter(
+                    recorded__range=(time_ranges[-1][0], time_ranges[0][1]),
+                    machine__in=queryset,
+                    management_source=munki)
+                .annotate(status_lower=Lower('status'))
+                .aggregate(**counts))
+
         context['data'] = []
-        for time_range in time_ranges:
-            day_status = {key: self._filter(queryset, key, time_range) for key in STATUSES}
+        for index, time_range in enumerate(time_ranges):
+            day_status = {key: totals[f'{key}_{index}'] for key in STATUSES}
             day_status['date'] = time_range[0].strftime("%Y-%m-%d")
             context['data'].append(day_status)
         return context
-
-    def _filter(self, queryset, data, time_range):
-        return (
-            ManagedItemHistory.objects
-            .filter(
-                status__iexact=data,
-                recorded__range=time_range,
-                machine__in=queryset,
-                management_source__name='Munki')
-            .count())
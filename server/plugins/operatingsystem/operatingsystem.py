@@ -1,6 +1,5 @@
 import urllib
 from collections import defaultdict, OrderedDict
-from distutils.version import LooseVersion
 
 from django.db.models import Count
 
@@ -20,15 +19,15 @@ class OperatingSystem(sal.plugin.Widget):
 
     def get_context(self, machines, **kwargs):
         context = self.super_get_context(machines, **kwargs)
-        # Remove invalid versions, then annotate with a count.
+        # Remove invalid versions, then annotate with a count, newest
+        # versions first.
         os_info = (
             machines
             .exclude(operating_system__isnull=True)
             .exclude(operating_system='')
-            .order_by('operating_system')
-            .values('operating_system', 'os_family')
-            .distinct()
-            .annotate(count=Count('operating_system')))
+            .values('operating_system', 'operating_system_key', 'os_family')
+            .annotate(count=Count('operating_system'))
+            .order_by('-operating_system_key'))
 
         grouped = defaultdict(list)
         for version in os_info:
@@ -64,10 +63,7 @@ class OperatingSystem(sal.plugin.Widget):
                     chrome_items.append(item_to_add)
 
             grouped['Chrome OS'] = chrome_items
-        # you and your lambdas @sheacraig...
-        os_key = lambda x: LooseVersion(x["operating_system"])  # noqa: E731
-        output = [
-            (key, sorted(grouped[key], key=os_key, reverse=True)) for key in OS_TABLE.values()]
+        output = [(key, grouped[key]) for key in OS_TABLE.values()]
         context['os_info'] = output
 
         return context
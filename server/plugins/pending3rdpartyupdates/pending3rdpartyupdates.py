@@ -1,6 +1,7 @@
 from django.db.models import Count
 
 import sal.plugin
+import server.utils
 from server.models import ManagedItem
 
 
@@ -22,7 +23,7 @@ class Pending3rdPartyUpdates(sal.plugin.Widget):
             .objects
             .filter(machine__in=queryset,
                     status='PENDING',
-                    management_source__name__in=THIRD_PARTIES)
+                    management_source__in=self._get_sources())
             .values('name')
             .order_by('name')
             .annotate(count=Count('name')))
@@ -34,5 +35,10 @@ class Pending3rdPartyUpdates(sal.plugin.Widget):
         machines = machines.filter(
             manageditem__name=data,
             manageditem__status='PENDING',
-            manageditem__management_source__name__in=THIRD_PARTIES)
+            manageditem__management_source__in=self._get_sources())
         return machines, f'Machines that need to install {data}'
+
+    def _get_sources(self):
+        sources = (
+            server.utils.get_management_source(name, create=False) for name in THIRD_PARTIES)
+        return [source for source in sources if source is not None]
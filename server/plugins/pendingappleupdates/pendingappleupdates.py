@@ -1,6 +1,7 @@
 from django.db.models import Count
 
 import sal.plugin
+import server.utils
 from server.models import ManagedItem
 
 
@@ -12,12 +13,16 @@ class PendingAppleUpdates(sal.plugin.Widget):
 
     def get_context(self, queryset, **kwargs):
         context = self.super_get_context(queryset, **kwargs)
+        source = server.utils.get_management_source('Apple Software Update', create=False)
+        if source is None:
+            context['data'] = []
+            return context
         updates = (
             ManagedItem
             .objects
             .filter(machine__in=queryset,
                     status="PENDING",
-                    management_source__name='Apple Software Update')
+                    management_source=source)
             .values('name')
             .order_by('name')
             .annotate(count=Count('name')))
@@ -26,8 +31,11 @@ class PendingAppleUpdates(sal.plugin.Widget):
         return context
 
     def filter(self, machines, data):
+        source = server.utils.get_management_source('Apple Software Update', create=False)
+        if source is None:
+            return machines.none(), f'Machines that need to install {data}'
         machines = machines.filter(
             manageditem__name=data,
             manageditem__status='PENDING',
-            manageditem__management_source__name='Apple Software Update')
+            manageditem__management_source=source)
         return machines, f'Machines that need to install {data}'
@@ -2,13 +2,12 @@ from datetime import timedelta
 
 import django.utils.timezone
 from django.db.models import (Q, DateTimeField)
-from django.db.models.functions import Cast
+from django.db.models.functions import Cast, Coalesce
 
 import sal.plugin
+import server.utils
 
 
-PUPPET_Q = Q(facts__management_source__name='Puppet')
-
 TITLES = {
     'puppeterror': 'Machines with Puppet errors',
     '1month': 'Machines that haven\'t run Puppet for more than 1 Month',
@@ -42,33 +41,41 @@ class PuppetStatus(sal.plugin.Widget):
     def _get_active_machines(self, queryset):
         """Return collection of machine ids actively puppeting."""
         return queryset.filter(
-            PUPPET_Q,
-            facts__fact_data__isnull=False,
-            facts__fact_name='last_puppet_run')
+            self._puppet_q(),
+            server.utils.get_fact_data_q('__isnull', False, prefix='facts__'),
+            facts__fact_name__name='last_puppet_run')
 
     def _filter(self, machines, data):
         if data == 'puppeterror':
             machines = machines.filter(
-                PUPPET_Q,
-                facts__fact_name='puppet_errors',
-                facts__fact_data__gt=0)
+                self._puppet_q(),
+                server.utils.get_fact_data_q('__gt', 0, prefix='facts__'),
+                facts__fact_name__name='puppet_errors')
 
         elif data == '1month':
             now = django.utils.timezone.now()
             today = now - timedelta(hours=24)
             month_ago = today - timedelta(days=30)
 
-            # fact_data is TextField so cast on the fly
+            # fact_data is TextField so cast on the fly. Long values
+            # are stored in a FactValue instead.
             machines = machines.filter(
-                PUPPET_Q,
-                facts__fact_name='last_puppet_run').annotate(
-                    last=Cast('facts__fact_data', output_field=DateTimeField())).filter(
+                self._puppet_q(),
+                facts__fact_name__name='last_puppet_run').annotate(
+                    last=Cast(
+                        Coalesce('facts__fact_value__data', 'facts__fact_data'),
+                        output_field=DateTimeField())).filter(
                 last__lte=month_ago)
 
         elif data == 'success':
             machines = machines.filter(
-                PUPPET_Q,
-                facts__fact_name='puppet_errors',
-                facts__fact_data=0)
+                self._puppet_q(),
+                server.utils.get_fact_data_q('', '0', prefix='facts__'),
+                facts__fact_name__name='puppet_errors')
 
         return machines
+
+    def _puppet_q(self):
+        puppet = server.utils.get_management_source('Puppet', create=False)
+        # Filtering on a missing source would match facts without one.
+        return Q(facts__management_source=puppet) if puppet else Q(pk__in=[])
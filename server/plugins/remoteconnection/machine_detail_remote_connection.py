@@ -18,7 +18,7 @@ class RemoteConnection(sal.plugin.DetailPlugin):
         if queryset.facts.count() > 0:
             try:
                 ip_addresses = queryset.facts.get(
-                    fact_name="ipv4_address").fact_data
+                    fact_name__name="ipv4_address").value
                 # Machines may have multiple IPs. Just use the first.
                 ip_address = ip_addresses.split(",")[0]
             except Fact.DoesNotExist:
@@ -4,14 +4,14 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.context_processors import csrf
 from django.urls import reverse
 
 import sal.plugin
-from sal.decorators import ga_required, staff_required
-from server import utils
+from sal.decorators import ga_required, get_admission_stats, staff_required
+from server import checkin_queue, checkin_timing, non_ui_views, utils
 from server import forms
 from server.models import ProfileLevel, Plugin, ApiKey, Report, MachineDetailPlugin, UserProfile
 from server.views import index as index_view
@@ -172,6 +172,18 @@ def settings_page(request):
     return render(request, 'server/settings.html', context)
 
 
+@login_required
+@ga_required
+def checkin_metrics(request):
+    """Return this process' checkin statistics and the spool status."""
+    return JsonResponse({
+        'timing_enabled': utils.get_django_setting('CHECKIN_TIMING', False),
+        'timing': checkin_timing.get_histograms(),
+        'sections': non_ui_views.get_section_stats(),
+        'admission': get_admission_stats(),
+        'queue': checkin_queue.get_queue_stats()})
+
+
 @login_required
 @ga_required
 def senddata_enable(request):
@@ -1,6 +1,5 @@
 import json
 import time
-from distutils.version import LooseVersion
 
 import dateutil.parser
 
@@ -10,6 +9,7 @@ from django.utils.timezone import utc
 
 import utils.text_utils
 from server.models import MachineGroup, BusinessUnit
+from utils.versions import get_version_key
 
 
 register = template.Library()
@@ -59,7 +59,7 @@ def cat(arg1, arg2):
 
 @register.filter
 def macos(os_version):
-    if LooseVersion(os_version) > LooseVersion("10.11.99"):
+    if get_version_key(os_version) > get_version_key("10.11.99"):
         return "macOS"
     else:
         return "OS X"
@@ -71,7 +71,7 @@ def bu_machine_count(bu_id):
     BusinessUnit.id"""
     # Get the BusinessUnit
     business_unit = get_object_or_404(BusinessUnit, pk=bu_id)
-    machine_groups = business_unit.machinegroup_set.all()
+    machine_groups = business_unit.machinegroup_set.filter(pending_deletion=False)
     count = 0
     for machinegroup in machine_groups:
         count = count + machinegroup.machine_set.filter(deployed=True).count()
@@ -3,11 +3,14 @@
 
 import unittest.mock
 
-from django.test import TestCase
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 import sal.plugin
 from server import utils
-from server.models import Plugin
+from server.models import Fact, FactName, FactValue, HistoricalFact, Plugin
 
 
 class PluginUtilsTest(TestCase):
@@ -26,6 +29,50 @@ class PluginUtilsTest(TestCase):
         self.assertNotEqual(Plugin.objects.count(), 0)
 
 
+class PluginHookTest(TestCase):
+    """Test the plugin processing hook registry."""
+
+    def setUp(self):
+        utils.clear_plugin_hook_cache()
+        self.calls = []
+
+        class Processor(sal.plugin.Widget):
+            def checkin_processor(plugin, machine, report_data):
+                self.calls.append(report_data)
+
+        self.plugins = {'Processor': Processor(), 'NoOp': sal.plugin.Widget()}
+        patcher = unittest.mock.patch(
+            'server.utils.PluginManager.get_plugin_by_name', side_effect=self.plugins.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Plugin.objects.create(name='NoOp', order=0)
+        Plugin.objects.create(name='Processor', order=1)
+
+    def test_only_overriding_plugins(self):
+        hooks = utils.get_plugin_hooks('checkin_processor')
+        self.assertEqual([name for name, _ in hooks], ['Processor'])
+        self.assertEqual(utils.get_plugin_hooks('profiles_processor'), [])
+        utils.run_plugin_processing(None, {'checkin': 1})
+        self.assertEqual(self.calls, [{'checkin': 1}])
+
+    def test_registry_cached(self):
+        utils.get_plugin_hooks('checkin_processor')
+        with CaptureQueriesContext(connection) as queries:
+            utils.run_plugin_processing(None, {})
+        self.assertEqual(len(queries), 0)
+
+    def test_registry_cleared_on_disable(self):
+        utils.get_plugin_hooks('checkin_processor')
+        Plugin.objects.get(name='Processor').delete()
+        self.assertEqual(utils.get_plugin_hooks('checkin_processor'), [])
+
+    @unittest.mock.patch('server.utils.SLOW_PLUGIN_HOOK', -1)
+    def test_slow_hook_logged(self):
+        with self.assertLogs('server.utils', 'WARNING') as logs:
+            utils.run_plugin_processing(None, {})
+        self.assertIn('Plugin Processor took', logs.output[0])
+
+
 class ServerUtilsTest(TestCase):
     """Test the server app utilities"""
 
@@ -38,3 +85,70 @@ class ServerUtilsTest(TestCase):
         version_result = utils.get_server_version()
 
         self.assertEqual(version_result, version)
+
+
+class FactNameTest(TransactionTestCase):
+    """Test the fact name dictionary.
+
+    Names are only cached once their transaction commits, so these
+    tests need real transactions.
+    """
+
+    def setUp(self):
+        utils.clear_fact_name_cache()
+
+    def test_get_fact_names(self):
+        FactName.objects.create(name='existing')
+        fact_names = utils.get_fact_names(['existing', 'new', 'new'])
+        self.assertEqual(set(fact_names), {'existing', 'new'})
+        self.assertEqual(FactName.objects.count(), 2)
+        self.assertEqual(fact_names['new'], FactName.objects.get(name='new'))
+
+    def test_fact_names_cached(self):
+        utils.get_fact_names(['a', 'b'])
+        with CaptureQueriesContext(connection) as queries:
+            fact_names = utils.get_fact_names(['a', 'b'])
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(fact_names['a'].name, 'a')
+
+    def test_rolled_back_fact_names_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            utils.get_fact_names(['rolled_back'])
+            raise RuntimeError
+        self.assertIsNone(utils.FACT_NAME_CACHE.get('rolled_back'))
+        self.assertEqual(utils.get_fact_names(['rolled_back'])['rolled_back'].name, 'rolled_back')
+        self.assertTrue(FactName.objects.filter(name='rolled_back').exists())
+
+    def test_default_ordering_without_join(self):
+        for model in (Fact, HistoricalFact):
+            self.assertNotIn('server_factname', str(model.objects.all().query))
+
+    @unittest.mock.patch('server.utils.FACT_NAME_BATCH_SIZE', 2)
+    def test_fact_names_batched(self):
+        names = [f'name_{n}' for n in range(5)]
+        self.assertEqual(set(utils.get_fact_names(names)), set(names))
+
+
+class FactValueTest(TransactionTestCase):
+    """Test the fact value store."""
+
+    def setUp(self):
+        utils.clear_fact_value_cache()
+
+    def test_get_fact_values(self):
+        hashes = utils.get_fact_values(['a' * 50, 'b' * 50, 'a' * 50])
+        self.assertEqual(FactValue.objects.count(), 2)
+        self.assertEqual(FactValue.objects.get(pk=hashes['a' * 50]).data, 'a' * 50)
+        with CaptureQueriesContext(connection) as queries:
+            utils.get_fact_values(['a' * 50])
+        self.assertEqual(len(queries), 0)
+
+    @unittest.mock.patch('server.utils.settings.FACT_VALUE_STORE_THRESHOLD', 10)
+    def test_fact_data_q(self):
+        self.assertEqual(utils.get_fact_data_q('', 'short'), Q(fact_data='short'))
+        self.assertEqual(
+            utils.get_fact_data_q('__exact', 'x' * 20, prefix='facts__'),
+            Q(facts__fact_value=utils.get_fact_value_hash('x' * 20)))
+        self.assertEqual(
+            utils.get_fact_data_q('__icontains', 'x'),
+            Q(fact_data__icontains='x') | Q(fact_value__data__icontains='x'))
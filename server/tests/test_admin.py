@@ -7,6 +7,7 @@ from sal.test_utils import AdminTestCase
 class ServerAdminTest(AdminTestCase):
     """Test the admin site is configured to have all expected views."""
     admin_endpoints = {
-        'apikey', 'businessunit', 'fact', 'historicalfact', 'machinedetailplugin', 'machinegroup',
+        'apikey', 'businessunit', 'deletionjob', 'fact', 'historicalfact', 'machinedetailplugin', 'machinegroup',
         'machine', 'manageditem', 'manageditemhistory', 'managementsource', 'message',
-        'pluginscriptrow', 'pluginscriptsubmission', 'plugin', 'report', 'salsetting'}
+        'pluginscriptrow', 'pluginscriptsubmission', 'plugin', 'queuedcheckin', 'report',
+        'salsetting'}
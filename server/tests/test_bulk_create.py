@@ -0,0 +1,64 @@
+"""Tests for the bulk insert helper."""
+
+
+import io
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from server import utils
+from server.models import Machine, PluginScriptRow, PluginScriptSubmission
+
+
+class BulkCreateTest(TestCase):
+    """Test the backend independent bulk insert helper."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        self.submission = PluginScriptSubmission.objects.create(machine=machine, plugin='Test')
+
+    def test_empty(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(utils.bulk_create(PluginScriptRow, []), [])
+        self.assertEqual(len(queries), 0)
+
+    def test_batched_inserts(self):
+        rows = [
+            PluginScriptRow(submission=self.submission, pluginscript_name=str(i), pluginscript_data=str(i))
+            for i in range(1500)]
+        with CaptureQueriesContext(connection) as queries:
+            utils.bulk_create(PluginScriptRow, rows)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        fields = PluginScriptRow._meta.concrete_fields
+        expected = -(-1500 // min(connection.ops.bulk_batch_size(fields, rows), utils.BULK_CREATE_BATCH_SIZE))
+        self.assertEqual(len(inserts), expected)
+        self.assertLess(len(inserts), 1500)
+        self.assertEqual(PluginScriptRow.objects.count(), 1500)
+
+    def test_typed_columns(self):
+        rows = [
+            PluginScriptRow(submission=self.submission, pluginscript_name='int', pluginscript_data='5'),
+            PluginScriptRow(
+                submission=self.submission, pluginscript_name='date',
+                pluginscript_data='2020-01-02T03:04:05Z')]
+        utils.bulk_create(PluginScriptRow, rows)
+        int_row = PluginScriptRow.objects.get(pluginscript_name='int')
+        self.assertEqual(int_row.pluginscript_data_int, 5)
+        self.assertEqual(int_row.pluginscript_data_string, '5')
+        date_row = PluginScriptRow.objects.get(pluginscript_name='date')
+        self.assertEqual(date_row.pluginscript_data_date.year, 2020)
+
+    def test_backfill(self):
+        PluginScriptRow.objects.bulk_create([
+            PluginScriptRow(submission=self.submission, pluginscript_name=str(i), pluginscript_data=str(i))
+            for i in range(1, 11)])
+        self.assertEqual(PluginScriptRow.objects.filter(pluginscript_data_int=0).count(), 10)
+        out = io.StringIO()
+        call_command('backfill_plugin_script_values', batch_size=3, stdout=out)
+        self.assertEqual(PluginScriptRow.objects.filter(pluginscript_data_int=0).count(), 0)
+        self.assertIn('updated 10', out.getvalue())
+        self.assertEqual(PluginScriptRow.objects.get(pluginscript_name='7').pluginscript_data_int, 7)
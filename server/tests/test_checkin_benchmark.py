@@ -0,0 +1,44 @@
+"""Tests for the checkin benchmark command."""
+
+
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from server import utils
+from server.models import Machine
+
+
+class CheckinBenchmarkTest(TestCase):
+    """Test the checkin benchmark command."""
+
+    def setUp(self):
+        utils.clear_management_source_cache()
+        utils.clear_fact_name_cache()
+        utils.set_setting('send_data', False)
+
+    def test_benchmark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command(
+                'checkin_benchmark', machines=2, rounds=2, facts=5, managed_items=5, messages=1,
+                plugin_rows=2, output=path, stdout=io.StringIO())
+            with open(path) as handle:
+                results = json.load(handle)
+
+            out = io.StringIO()
+            call_command(
+                'checkin_benchmark', machines=2, rounds=1, facts=5, managed_items=5, compare=path,
+                stdout=out)
+
+        self.assertEqual(results['checkins'], 4)
+        self.assertEqual(results['errors'], 0)
+        self.assertGreater(results['queries_per_checkin'], 0)
+        self.assertGreater(results['rows_written'], 0)
+        self.assertEqual(set(results['latency_ms']), {'p50', 'p95', 'p99', 'mean', 'max'})
+        self.assertEqual(Machine.objects.filter(serial__startswith='BENCH').count(), 2)
+        self.assertIn('requests_per_second:', out.getvalue())
@@ -0,0 +1,126 @@
+"""Tests for batched deletion and deletion jobs."""
+
+
+import unittest.mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from sal.decorators import get_machine_group_by_key
+from server import deletion, utils
+from server.models import DeletionJob, Machine, MachineGroup, PluginScriptRow, PluginScriptSubmission
+
+
+class DeletionTest(TestCase):
+    """Test the batched deletion helper."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        PluginScriptSubmission.objects.bulk_create([
+            PluginScriptSubmission(machine=machine, plugin=str(i)) for i in range(10)])
+        self.submissions = list(PluginScriptSubmission.objects.order_by('pk'))
+        PluginScriptRow.objects.bulk_create([
+            PluginScriptRow(submission=submission, pluginscript_name='row', pluginscript_data='')
+            for submission in self.submissions])
+
+    def test_delete_in_batches(self):
+        progress = []
+        deleted = deletion.delete_in_batches(
+            PluginScriptSubmission.objects.exclude(plugin='0'), batch_size=4,
+            progress=progress.append)
+        self.assertEqual(deleted, 9)
+        self.assertEqual(progress, [4, 8, 9])
+        self.assertEqual(PluginScriptSubmission.objects.get().plugin, '0')
+        self.assertEqual(PluginScriptRow.objects.count(), 1)
+
+    def test_resume_from_checkpoint(self):
+        utils.set_setting('deletion_checkpoint_test', self.submissions[4].pk)
+        self.assertEqual(deletion.get_checkpoint('test'), str(self.submissions[4].pk))
+        deleted = deletion.delete_in_batches(
+            PluginScriptSubmission.objects.all(), batch_size=2, checkpoint='test')
+        self.assertEqual(deleted, 5)
+        self.assertEqual(PluginScriptSubmission.objects.count(), 5)
+        self.assertIsNone(deletion.get_checkpoint('test'))
+
+
+class DeletionJobTest(TestCase):
+    """Test deleting business units and machine groups."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json',
+        'user_fixture.json']
+
+    def setUp(self):
+        user = User.objects.get(pk=1)
+        user_profile = user.userprofile
+        user_profile.level = 'GA'
+        user_profile.save()
+        self.client.force_login(user)
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+        self.machine_group = self.machine.machine_group
+
+    def test_small_group_deleted_immediately(self):
+        response = self.client.get(f'/machine_group/really/delete/{self.machine_group.pk}/')
+        self.assertRedirects(response, f'/dashboard/{self.machine_group.business_unit_id}/')
+        self.assertFalse(MachineGroup.objects.filter(pk=self.machine_group.pk).exists())
+        self.assertFalse(DeletionJob.objects.exists())
+
+    @unittest.mock.patch('server.deletion.INLINE_DELETE_LIMIT', 0)
+    def test_large_group_queued(self):
+        total = self.machine_group.machine_set.count()
+        response = self.client.get(f'/machine_group/really/delete/{self.machine_group.pk}/')
+        job = DeletionJob.objects.get()
+        self.assertRedirects(response, f'/deletion_job/{job.pk}/')
+        self.assertEqual((job.status, job.total, job.target_name), ('QUEUED', total, self.machine_group.name))
+
+        # Until the job runs, the group is hidden and can't check in.
+        self.assertTrue(MachineGroup.objects.get(pk=self.machine_group.pk).pending_deletion)
+        self.assertIsNone(get_machine_group_by_key(self.machine_group.key))
+        self.assertNotContains(self.client.get(f'/dashboard/{self.machine_group.business_unit_id}/'),
+                               f'/machinegroup/{self.machine_group.pk}/')
+
+        self.assertEqual(deletion.run_deletion_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted, job.percent_done), ('DONE', total, 100))
+        self.assertFalse(MachineGroup.objects.filter(pk=self.machine_group.pk).exists())
+        self.assertFalse(Machine.objects.filter(pk=self.machine.pk).exists())
+        self.assertContains(self.client.get(f'/deletion_job/{job.pk}/'), 'has been deleted')
+
+    @unittest.mock.patch('server.deletion.INLINE_DELETE_LIMIT', 0)
+    def test_machines_checked_in_during_job_deleted(self):
+        self.client.get(f'/machine_group/really/delete/{self.machine_group.pk}/')
+        original = deletion.delete_in_batches
+        passes = []
+
+        def delete_in_batches(queryset, **kwargs):
+            deleted = original(queryset, **kwargs)
+            passes.append(deleted)
+            if len(passes) == 1:
+                # Another process still had the group cached.
+                Machine.objects.create(serial='LATE', machine_group=self.machine_group)
+            return deleted
+
+        with unittest.mock.patch('server.deletion.delete_in_batches', delete_in_batches):
+            deletion.run_deletion_jobs()
+        self.assertEqual(passes[1:], [1])
+        self.assertFalse(Machine.objects.filter(serial='LATE').exists())
+        self.assertFalse(MachineGroup.objects.filter(pk=self.machine_group.pk).exists())
+
+    @unittest.mock.patch('server.deletion.INLINE_DELETE_LIMIT', 0)
+    def test_failed_job_retried(self):
+        self.client.get(f'/machine_group/really/delete/{self.machine_group.pk}/')
+        job = DeletionJob.objects.get()
+        with unittest.mock.patch('server.deletion.delete_in_batches', side_effect=RuntimeError('Oops')):
+            deletion.run_deletion_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('FAILED', 'Oops'))
+        self.assertEqual(deletion.run_deletion_jobs(), 0)
+        self.assertContains(self.client.get(f'/deletion_job/{job.pk}/'), f'/deletion_job/retry/{job.pk}/')
+
+        response = self.client.get(f'/deletion_job/retry/{job.pk}/')
+        self.assertRedirects(response, f'/deletion_job/{job.pk}/')
+        self.assertEqual(deletion.run_deletion_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DONE')
+        self.assertFalse(MachineGroup.objects.filter(pk=self.machine_group.pk).exists())
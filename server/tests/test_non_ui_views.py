@@ -4,24 +4,32 @@
 import base64
 import bz2
 import datetime
+import gzip
 import dateutil
 import json
 import plistlib
 import pytz
 import re
+from unittest import skipIf
 from unittest.mock import patch
 
 from django.conf import settings
+from django.contrib import admin
+from django.core.management import call_command
 from django.http.response import Http404
-from django.test import TestCase, Client
-from django.utils.timezone import now
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import make_aware, now
 
 import server.utils
+from server.admin import FactAdmin, ManagedItemAdmin
+from sal.decorators import MACHINE_GROUP_KEY_CACHE
 from sal.plugin import Widget, ReportPlugin, DetailPlugin
-from server import non_ui_views
+from server import checkin_queue, checkin_timing, non_ui_views
 from server.models import (
     MachineGroup, Machine, ManagementSource, ManagedItem, ManagedItemHistory, Fact, HistoricalFact,
-    Message, Plugin, Report, MachineDetailPlugin)
+    Message, Plugin, Report, MachineDetailPlugin, QueuedCheckin, SubmissionHash, FactName, FactValue)
 
 
 class CheckinDataTest(TestCase):
@@ -31,6 +39,9 @@ class CheckinDataTest(TestCase):
         'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -145,6 +156,25 @@ class CheckinDataTest(TestCase):
         response = self.client.post(self.url, data, content_type=self.content_type)
         self.assertEqual(response.status_code, 200)
 
+    def test_machine_written_once(self):
+        """Test that a checkin updates only the changed machine fields, once."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        submission = {
+            'Machine': {'extra_data': {'serial': machine.serial, 'hostname': 'snake'}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}},
+            'Munki': {'extra_data': {'manifest': 'the_firm', 'munki_version': '1000.0.0'}}}
+        self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "server_machine"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"last_checkin"', updates[0])
+        self.assertNotIn('"hostname"', updates[0])
+        machine.refresh_from_db()
+        self.assertEqual(machine.hostname, 'snake')
+        self.assertEqual(machine.manifest, 'the_firm')
+
     def test_management_source_creation(self):
         """Test checkin creates management sources."""
         machine = Machine.objects.get(serial='C0DEADBEEF')
@@ -155,6 +185,458 @@ class CheckinDataTest(TestCase):
         self.client.post(self.url, data, content_type=self.content_type)
         self.assertTrue(ManagementSource.objects.filter(name='Munki').exists())
 
+    def test_compressed_checkin(self):
+        """Test checkins may be compressed with Content-Encoding."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': machine.serial, 'hostname': 'gzipped'}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}}}).encode()
+        for body, encoding in ((gzip.compress(data), 'gzip'), (bz2.compress(data), 'bzip2')):
+            response = self.client.post(
+                self.url, body, content_type=self.content_type, HTTP_CONTENT_ENCODING=encoding)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Machine.objects.get(serial='C0DEADBEEF').hostname, 'gzipped')
+
+    def test_invalid_compressed_checkin(self):
+        """Test bad or unknown encodings are rejected."""
+        response = self.client.post(
+            self.url, b'not gzip', content_type=self.content_type, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            self.url, b'{}', content_type=self.content_type, HTTP_CONTENT_ENCODING='br')
+        self.assertEqual(response.status_code, 415)
+
+    @patch('server.non_ui_views.settings.CHECKIN_MAX_BODY_SIZE', 100)
+    def test_checkin_too_large(self):
+        """Test the decompressed size of checkins is limited."""
+        body = gzip.compress(json.dumps({'Machine': {'extra_data': {'serial': 'x' * 200}}}).encode())
+        response = self.client.post(
+            self.url, body, content_type=self.content_type, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 413)
+
+    @skipIf(non_ui_views.ijson is None, 'ijson is not installed')
+    def test_checkin_streamed(self):
+        """Test checkins are parsed with ijson when it's installed."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}}})
+        with patch('server.non_ui_views.json.loads') as loads:
+            response = self.client.post(self.url, data, content_type=self.content_type)
+        loads.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        for body in ('{', ''):
+            response = self.client.post(self.url, body, content_type=self.content_type)
+            self.assertEqual(response.status_code, 400)
+
+    @patch('server.non_ui_views.ijson', None)
+    def test_checkin_without_ijson(self):
+        """Test checkins are parsed without the optional ijson package."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}}})
+        response = self.client.post(self.url, data, content_type=self.content_type)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(self.url, '{', content_type=self.content_type)
+        self.assertEqual(response.status_code, 400)
+
+    def test_management_source_cache_cleared(self):
+        """Test a cleared cache does not return deleted sources."""
+        source = server.utils.get_management_source('Munki')
+        self.assertEqual(server.utils.get_management_source('Munki', create=False), source)
+        source.delete()
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
+        self.assertIsNone(server.utils.get_management_source('Munki', create=False))
+
+
+class CheckinTimingTest(TestCase):
+    """Tests for checkin phase timing."""
+
+    fixtures = [
+        'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
+
+    def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
+        settings.BASIC_AUTH = False
+        self.client = Client()
+        self.url = '/checkin/'
+        server.utils.set_setting('send_data', False)
+        checkin_timing.clear_histograms()
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        self.data = json.dumps({
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}},
+            'Munki': {'facts': {'a': 'b'}}})
+
+    def test_disabled(self):
+        response = self.client.post(self.url, self.data, content_type='application/json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(checkin_timing.get_histograms(), {})
+
+    @patch('server.non_ui_views.settings.CHECKIN_TIMING', True)
+    def test_enabled(self):
+        response = self.client.post(self.url, self.data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        header = response['Server-Timing']
+        for name in ('decode', 'machine', 'sources', 'reconcile', 'plugins', 'total'):
+            self.assertIn(f'{name};desc=', header)
+        histograms = checkin_timing.get_histograms()
+        self.assertEqual(histograms['total']['count'], 1)
+        self.assertEqual(sum(histograms['reconcile']['buckets'].values()), 1)
+
+    def test_phase_without_recorder(self):
+        with checkin_timing.phase('nothing'):
+            pass
+        self.assertEqual(checkin_timing.get_histograms(), {})
+
+
+@patch('server.non_ui_views.settings.CHECKIN_QUEUE', True)
+class CheckinQueueTest(TestCase):
+    """Functional tests for queued client checkins."""
+
+    fixtures = [
+        'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
+
+    def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
+        settings.BASIC_AUTH = False
+        self.client = Client()
+        self.content_type = 'application/json'
+        self.url = '/checkin/'
+        # Avoid sending analytics to the project while testing!
+        server.utils.set_setting('send_data', False)
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def post_facts(self, facts):
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': self.machine.serial}},
+            'Sal': {'extra_data': {'key': self.machine.machine_group.key}},
+            'Munki': {'facts': facts}})
+        return self.client.post(self.url, data, content_type=self.content_type)
+
+    def test_checkin_queued(self):
+        """Test that queued checkins are accepted without processing."""
+        response = self.post_facts({'test_user': 'Snake Plisskin'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(QueuedCheckin.objects.get().serial, self.machine.serial)
+        self.assertFalse(Fact.objects.exists())
+        self.assertEqual(checkin_queue.get_queue_stats()['depth'], 1)
+
+    def test_checkin_queue_requires_machine_group(self):
+        """Test that checkins for missing machine groups are not queued."""
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': self.machine.serial}},
+            'Sal': {'extra_data': {'key': 'Not a key'}}})
+        response = self.client.post(self.url, data=data, content_type=self.content_type)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(QueuedCheckin.objects.exists())
+
+    def test_queue_drain(self):
+        """Test that the worker processes checkins in submission order."""
+        self.post_facts({'test_user': 'Snake Plisskin'})
+        self.post_facts({'test_user': 'Bob Hauk'})
+        self.assertEqual(checkin_queue.drain(), 2)
+        self.assertFalse(QueuedCheckin.objects.exists())
+        fact = self.machine.facts.get(fact_name__name='test_user')
+        self.assertEqual(fact.fact_data, 'Bob Hauk')
+
+    @patch('server.non_ui_views.HISTORICAL_FACTS', ['test_user'])
+    def test_queue_drain_received_time(self):
+        """Test that spooled checkins are recorded when they were received."""
+        received = now() - datetime.timedelta(hours=1)
+        self.post_facts({'test_user': 'Snake Plisskin'})
+        QueuedCheckin.objects.update(received=received)
+        checkin_queue.drain()
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.last_checkin, received)
+        history = HistoricalFact.objects.get(machine=self.machine, fact_name__name='test_user')
+        self.assertEqual(history.fact_recorded, received)
+
+    @patch('server.checkin_queue.process_job')
+    def test_queue_retry(self, process_job):
+        """Test that failed checkins are retried before later ones."""
+        process_job.side_effect = ValueError
+        self.post_facts({'test_user': 'Snake Plisskin'})
+        self.post_facts({'test_user': 'Bob Hauk'})
+        self.assertEqual(checkin_queue.drain(), 0)
+        self.assertEqual(process_job.call_count, 1)
+        first, second = QueuedCheckin.objects.all()
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(first.available, now())
+        self.assertEqual(second.attempts, 0)
+
+        # The serial stays blocked until the failed checkin can retry.
+        process_job.side_effect = None
+        self.assertEqual(checkin_queue.drain(), 0)
+        QueuedCheckin.objects.filter(pk=first.pk).update(available=now())
+        self.assertEqual(checkin_queue.drain(), 2)
+
+    @patch('server.checkin_queue.process_job')
+    def test_queue_skips_claimed(self, process_job):
+        """Test that checkins another worker has claimed are skipped."""
+        self.post_facts({'test_user': 'Snake Plisskin'})
+        self.post_facts({'test_user': 'Bob Hauk'})
+        first = QueuedCheckin.objects.order_by('id').first()
+        original = checkin_queue.claim
+
+        def claim(job):
+            # Another worker tries the first checkin after it's listed.
+            QueuedCheckin.objects.filter(pk=first.pk).update(attempts=1)
+            return original(job)
+
+        with patch('server.checkin_queue.claim', claim):
+            self.assertEqual(checkin_queue.drain(), 0)
+        process_job.assert_not_called()
+        self.assertEqual(QueuedCheckin.objects.count(), 2)
+
+    @patch('server.checkin_queue.process_job')
+    def test_queue_max_attempts(self, process_job):
+        """Test that checkins are marked failed after too many tries."""
+        process_job.side_effect = ValueError
+        self.post_facts({'test_user': 'Snake Plisskin'})
+        checkin_queue.drain(max_attempts=1)
+        self.assertTrue(QueuedCheckin.objects.get().failed)
+        self.assertEqual(checkin_queue.get_queue_stats()['failed'], 1)
+
+
+class CheckinBatchTest(TestCase):
+    """Functional tests for batched client checkins."""
+
+    fixtures = [
+        'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
+
+    def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
+        settings.BASIC_AUTH = False
+        self.client = Client()
+        self.url = '/checkin/batch/'
+        server.utils.set_setting('send_data', False)
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def submission(self, serial, key=None, facts=None):
+        return {
+            'Machine': {'extra_data': {'serial': serial}},
+            'Sal': {'extra_data': {'key': key or self.machine.machine_group.key}},
+            'Munki': {'facts': facts or {}}}
+
+    def test_batch_requires_key_auth(self):
+        settings.BASIC_AUTH = True
+        response = self.client.post(self.url, data={})
+        self.assertEqual(response.status_code, 401)
+
+    def test_batch(self):
+        """Test each submission in a batch is processed on its own."""
+        data = json.dumps([
+            self.submission(self.machine.serial, facts={'a': '1'}),
+            self.submission('new+serial'),
+            {'Machine': {}},
+            self.submission('C0DEADBEEF', key='Not a key'),
+            self.submission(self.machine.serial, facts={'a': '2'})])
+        response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [200, 200, 400, 404, 200])
+        self.assertEqual(results[1]['serial'], 'NEWSERIAL')
+        self.assertTrue(Machine.objects.filter(serial='NEWSERIAL').exists())
+        self.assertEqual(self.machine.facts.get(fact_name__name='a').fact_data, '2')
+
+    def test_batch_failure_isolated(self):
+        """Test an error in one submission doesn't roll back the others."""
+        data = json.dumps([self.submission('FIRST'), self.submission('SECOND')])
+        original = non_ui_views.process_checkin
+
+        def fail_second(submission, *args, **kwargs):
+            machine = original(submission, *args, **kwargs)
+            if machine.serial == 'SECOND':
+                raise RuntimeError('Failed')
+            return machine
+
+        with patch('server.non_ui_views.process_checkin', fail_second):
+            response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual([r['status'] for r in response.json()['results']], [200, 500])
+        self.assertTrue(Machine.objects.filter(serial='FIRST').exists())
+        self.assertFalse(Machine.objects.filter(serial='SECOND').exists())
+
+    def test_ndjson_batch(self):
+        """Test NDJSON batches, where bad lines only fail themselves."""
+        lines = [json.dumps(self.submission(self.machine.serial)), '{', '', json.dumps(
+            self.submission('OTHER'))]
+        body = gzip.compress('\n'.join(lines).encode())
+        response = self.client.post(
+            self.url, body, content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(
+            [r['status'] for r in response.json()['results']], [200, 400, 200])
+
+    def test_batch_machines_looked_up_together(self):
+        data = json.dumps([self.submission(f'SERIAL{n}') for n in range(5)])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, data, content_type='application/json')
+        machine_selects = [
+            q for q in queries if q['sql'].startswith('SELECT') and 'FROM "server_machine"' in q['sql']]
+        self.assertEqual(len(machine_selects), 1)
+
+    @patch('server.non_ui_views.settings.CHECKIN_BATCH_MAX_SIZE', 2)
+    def test_batch_too_large(self):
+        data = json.dumps([self.submission(self.machine.serial)] * 3)
+        response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(self.machine.facts.exists())
+
+    @skipIf(non_ui_views.ijson is None, 'ijson is not installed')
+    def test_batch_streamed(self):
+        for body in ('{}', '"x"', '', '[1, '):
+            response = self.client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        with patch('server.non_ui_views.json.loads') as loads:
+            data = json.dumps([self.submission(self.machine.serial), self.submission('OTHER')])
+            response = self.client.post(self.url, data, content_type='application/json')
+        loads.assert_not_called()
+        self.assertEqual([r['status'] for r in response.json()['results']], [200, 200])
+
+    @patch('server.non_ui_views.ijson', None)
+    def test_batch_without_ijson(self):
+        response = self.client.post(self.url, '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        data = json.dumps([self.submission(self.machine.serial)])
+        response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['status'], 200)
+
+    @patch('server.non_ui_views.settings.ADD_NEW_MACHINES', False)
+    def test_batch_no_new_machines(self):
+        data = json.dumps([self.submission('UNKNOWN'), self.submission(self.machine.serial)])
+        response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual([r['status'] for r in response.json()['results']], [404, 200])
+
+    @patch('server.non_ui_views.settings.CHECKIN_QUEUE', True)
+    def test_batch_queued(self):
+        data = json.dumps([self.submission(self.machine.serial), self.submission('OTHER')])
+        response = self.client.post(self.url, data, content_type='application/json')
+        self.assertEqual([r['status'] for r in response.json()['results']], [202, 202])
+        self.assertEqual(
+            list(QueuedCheckin.objects.order_by('id').values_list('serial', flat=True)),
+            [self.machine.serial, 'OTHER'])
+
+
+class CheckinCacheTest(TransactionTestCase):
+    """Test the rows cached by checkins stay in step with the database."""
+
+    fixtures = [
+        'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
+
+    def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
+        settings.BASIC_AUTH = False
+        self.client = Client()
+        server.utils.set_setting('send_data', False)
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def submission(self, serial):
+        return {
+            'Machine': {'extra_data': {'serial': serial}},
+            'Sal': {'extra_data': {'key': self.machine.machine_group.key}},
+            'Munki': {'facts': {'new_fact': 'value', 'large_fact': 'x' * 2000}}}
+
+    def test_management_sources_cached(self):
+        """Test repeat checkins do not look up management sources."""
+        data = json.dumps(self.submission(self.machine.serial))
+        self.client.post('/checkin/', data, content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/checkin/', data, content_type='application/json')
+        self.assertFalse(any('"server_managementsource"' in q['sql'] for q in queries))
+
+    def test_deleted_source_recovered(self):
+        """Test checkins recover from a source deleted by another process."""
+        data = json.dumps(self.submission(self.machine.serial))
+        self.client.post('/checkin/', data, content_type='application/json')
+        stale = server.utils.get_management_source('Munki')
+        ManagementSource.objects.filter(pk=stale.pk).delete()
+
+        response = self.client.post('/checkin/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(server.utils.get_management_source('Munki').pk, stale.pk)
+        self.assertEqual(
+            self.machine.facts.get(fact_name__name='new_fact').management_source.name, 'Munki')
+
+    def test_deleted_source_recovered_by_queue(self):
+        """Test queued checkins are retried with fresh caches."""
+        data = json.dumps(self.submission(self.machine.serial))
+        self.client.post('/checkin/', data, content_type='application/json')
+        ManagementSource.objects.filter(name='Munki').delete()
+
+        checkin_queue.enqueue(self.machine.serial, data)
+        self.assertEqual(checkin_queue.drain(), 0)
+        QueuedCheckin.objects.update(available=now())
+        self.assertEqual(checkin_queue.drain(), 1)
+        self.assertFalse(QueuedCheckin.objects.exists())
+        self.assertTrue(self.machine.facts.filter(fact_name__name='new_fact').exists())
+
+    @patch('server.non_ui_views.settings.ADD_NEW_MACHINES', True)
+    def test_deleted_machine_group(self):
+        """Test checkins for a group deleted by another process 404."""
+        machine_group = self.machine.machine_group
+        data = json.dumps(self.submission(self.machine.serial))
+        self.client.post('/checkin/', data, content_type='application/json')
+        machine_group.delete()
+        # Another process still has the group cached.
+        MACHINE_GROUP_KEY_CACHE.set(machine_group.key, machine_group)
+
+        response = self.client.post('/checkin/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(MACHINE_GROUP_KEY_CACHE.get(machine_group.key))
+
+        MACHINE_GROUP_KEY_CACHE.set(machine_group.key, machine_group)
+        checkin_queue.enqueue(self.machine.serial, data)
+        self.assertEqual(checkin_queue.drain(), 0)
+        QueuedCheckin.objects.update(available=now())
+        self.assertEqual(checkin_queue.drain(), 0)
+        self.assertTrue(QueuedCheckin.objects.get().failed)
+
+    def test_maintenance_keeps_sources_with_hashes(self):
+        """Test sources that only have submission hashes aren't deleted."""
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': self.machine.serial}},
+            'Sal': {'extra_data': {'key': self.machine.machine_group.key}},
+            'Munki': {}})
+        self.client.post('/checkin/', data, content_type='application/json')
+        call_command('server_maintenance')
+        self.assertTrue(ManagementSource.objects.filter(name='Munki').exists())
+        response = self.client.post('/checkin/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    @patch('server.utils.settings.FACT_VALUE_STORE_THRESHOLD', 1000)
+    def test_rolled_back_batch_item(self):
+        for name in ('Machine', 'Sal', 'Munki'):
+            server.utils.get_management_source(name)
+        original = non_ui_views.process_checkin
+
+        def fail(submission, *args, **kwargs):
+            original(submission, *args, **kwargs)
+            raise RuntimeError('Failed')
+
+        data = json.dumps([self.submission(self.machine.serial)])
+        with patch('server.non_ui_views.process_checkin', fail):
+            response = self.client.post('/checkin/batch/', data, content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['status'], 500)
+        self.assertFalse(FactName.objects.filter(name='new_fact').exists())
+
+        data = json.dumps(self.submission(self.machine.serial))
+        response = self.client.post('/checkin/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.machine.facts.get(fact_name__name='new_fact').fact_data, 'value')
+        self.assertEqual(
+            self.machine.facts.get(fact_name__name='large_fact').fact_value.data, 'x' * 2000)
+
 
 class BrokenClientTest(TestCase):
     """Functional tests for broken client checkins."""
@@ -163,6 +645,9 @@ class BrokenClientTest(TestCase):
         'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.url = '/report_broken_client/'
@@ -189,6 +674,9 @@ class CheckinFactTest(TestCase):
         'fact_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -215,11 +703,156 @@ class CheckinFactTest(TestCase):
         })
         self.client.post(self.url, data, content_type=self.content_type)
         machine.refresh_from_db()
-        fact = machine.facts.get(fact_name='test_user')
-        self.assertEqual(fact.fact_name, 'test_user')
+        fact = machine.facts.get(fact_name__name='test_user')
+        self.assertEqual(fact.fact_name.name, 'test_user')
         self.assertEqual(fact.fact_data, 'Snake Plisskin')
         self.assertEqual(fact.management_source.name, 'Munki')
 
+    def test_facts_reconciled(self):
+        """Test that only changed facts are written."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        data = {
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}},
+            'Munki': {'facts': {'test_user': 'Snake Plisskin', 'uptime': 1, 'gone': 'soon'}}
+        }
+        self.client.post(self.url, json.dumps(data), content_type=self.content_type)
+        unchanged = machine.facts.get(fact_name__name='uptime')
+        updated = machine.facts.get(fact_name__name='test_user')
+
+        data['Munki']['facts'] = {'test_user': 'Bob Hauk', 'uptime': 1, 'new': 'fact'}
+        self.client.post(self.url, json.dumps(data), content_type=self.content_type)
+        self.assertEqual(machine.facts.get(fact_name__name='uptime').pk, unchanged.pk)
+        fact = machine.facts.get(fact_name__name='test_user')
+        self.assertEqual(fact.pk, updated.pk)
+        self.assertEqual(fact.fact_data, 'Bob Hauk')
+        self.assertTrue(machine.facts.filter(fact_name__name='new').exists())
+        self.assertFalse(machine.facts.filter(fact_name__name='gone').exists())
+
+    def test_reconcile_churn(self):
+        """Test that reconciliation reports row churn."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        source = ManagementSource.objects.create(name='Munki')
+        names = server.utils.get_fact_names(['same', 'changed', 'new'])
+        Fact.objects.create(
+            machine=machine, management_source=source, fact_name=names['same'], fact_data='1')
+        Fact.objects.create(
+            machine=machine, management_source=source, fact_name=names['changed'], fact_data='a')
+        object_queue = {
+            'facts': [
+                Fact(machine=machine, management_source=source, fact_name=names['same'], fact_data=1),
+                Fact(machine=machine, management_source=source, fact_name=names['changed'],
+                     fact_data='b'),
+                Fact(machine=machine, management_source=source, fact_name=names['new'], fact_data='c')],
+            'historical_facts': [], 'managed_items': [], 'managed_item_histories': [],
+            'messages': []}
+        churn = non_ui_views.reconcile_objects(object_queue, machine)
+        # The two facts from the fixture are no longer submitted.
+        self.assertEqual(churn['facts'], {'inserted': 1, 'updated': 1, 'deleted': 2})
+        self.assertEqual(churn['messages'], {'inserted': 0, 'updated': 0, 'deleted': 0})
+
+    def test_reconcile_naive_datetimes(self):
+        """Test that naive submitted dates match their stored rows."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        source = ManagementSource.objects.create(name='Munki')
+        date_managed = datetime.datetime(2020, 2, 29, 13, 0)
+        ManagedItem.objects.create(
+            machine=machine, management_source=source, name='Item', status='PRESENT',
+            date_managed=make_aware(date_managed))
+        item = ManagedItem(
+            machine=machine, management_source=source, name='Item', status='PRESENT',
+            date_managed=date_managed)
+        churn = server.utils.reconcile(
+            machine.manageditem_set.all(), [item], ('management_source_id', 'name'),
+            ('date_managed', 'status', 'data'))
+        self.assertEqual(churn, {'inserted': 0, 'updated': 0, 'deleted': 0})
+
+    @patch('server.non_ui_views.HISTORICAL_FACTS', ['test_user'])
+    def test_unchanged_sections_skipped(self):
+        """Test unchanged sections don't rewrite their rows."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        submission = {
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}},
+            'Munki': {'facts': {'test_user': 'Snake Plisskin', 'other': 'a'}}}
+        self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+        self.assertEqual(SubmissionHash.objects.filter(machine=machine).count(), 3)
+        Fact.objects.filter(fact_name__name='other').update(fact_data='tampered')
+        last_checkin = Machine.objects.get(pk=machine.pk).last_checkin
+        stats = non_ui_views.get_section_stats()
+
+        with patch('server.utils.get_fact_names', wraps=server.utils.get_fact_names) as get_fact_names:
+            self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+        # Only the historical fact of the unchanged section is looked up.
+        self.assertEqual(list(get_fact_names.call_args[0][0]), ['test_user'])
+        self.assertEqual(Fact.objects.get(fact_name__name='other').fact_data, 'tampered')
+        self.assertEqual(HistoricalFact.objects.filter(fact_name__name='test_user').count(), 2)
+        self.assertGreater(Machine.objects.get(pk=machine.pk).last_checkin, last_checkin)
+        new_stats = non_ui_views.get_section_stats()
+        self.assertEqual(new_stats['checked'] - stats['checked'], 3)
+        self.assertEqual(new_stats['skipped'] - stats['skipped'], 3)
+
+        # Changing a section rewrites it.
+        submission['Munki']['facts']['new'] = 'b'
+        self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+        self.assertEqual(Fact.objects.get(fact_name__name='other').fact_data, 'a')
+        self.assertTrue(Fact.objects.filter(fact_name__name='new').exists())
+
+        # Dropping a section removes its rows and its hash.
+        del submission['Munki']
+        self.client.post(self.url, json.dumps(submission), content_type=self.content_type)
+        self.assertFalse(machine.facts.exists())
+        self.assertEqual(SubmissionHash.objects.filter(machine=machine).count(), 2)
+
+    def test_admin_deletions_restored(self):
+        """Test rows deleted in the admin are restored by the next checkin."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        data = json.dumps({
+            'Machine': {'extra_data': {'serial': machine.serial}},
+            'Sal': {'extra_data': {'key': machine.machine_group.key}},
+            'Munki': {
+                'facts': {'test_user': 'Snake Plisskin'},
+                'managed_items': {'Taco': {'status': 'PRESENT'}}}})
+        self.client.post(self.url, data, content_type=self.content_type)
+        FactAdmin(Fact, admin.site).delete_queryset(None, machine.facts.all())
+        ManagedItemAdmin(ManagedItem, admin.site).delete_model(None, machine.manageditem_set.get())
+        self.assertEqual(SubmissionHash.objects.filter(machine=machine).count(), 2)
+
+        self.client.post(self.url, data, content_type=self.content_type)
+        self.assertEqual(machine.facts.get().fact_data, 'Snake Plisskin')
+        self.assertEqual(machine.manageditem_set.get().name, 'Taco')
+
+    @patch('server.non_ui_views.settings.FACT_VALUE_STORE_THRESHOLD', 10)
+    @patch('server.non_ui_views.HISTORICAL_FACTS', ['big'])
+    def test_large_fact_values_stored(self):
+        """Test that large fact values are stored once and shared."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        large = 'x' * 100
+
+        def post_facts(facts):
+            data = json.dumps({
+                'Machine': {'extra_data': {'serial': machine.serial}},
+                'Sal': {'extra_data': {'key': machine.machine_group.key}},
+                'Munki': {'facts': facts}})
+            self.client.post(self.url, data, content_type=self.content_type)
+
+        post_facts({'big': large, 'copy': large, 'small': 'y'})
+        self.assertEqual(FactValue.objects.get().data, large)
+        fact = machine.facts.get(fact_name__name='big')
+        self.assertEqual((fact.fact_data, fact.value), ('', large))
+        self.assertEqual(machine.facts.get(fact_name__name='small').fact_value, None)
+        self.assertEqual(machine.historical_facts.get().value, large)
+
+        post_facts({'big': 'z' * 100, 'copy': large, 'small': large})
+        self.assertEqual(machine.facts.get(fact_name__name='big').value, 'z' * 100)
+        self.assertEqual(machine.facts.get(fact_name__name='small').value, large)
+        self.assertEqual(FactValue.objects.count(), 2)
+
+        HistoricalFact.objects.all().delete()
+        post_facts({})
+        call_command('server_maintenance')
+        self.assertFalse(FactValue.objects.exists())
+
     @patch('server.non_ui_views.HISTORICAL_FACTS', ['test_user'])
     def test_historical_facts_created(self):
         """Test historical facts get created."""
@@ -231,12 +864,12 @@ class CheckinFactTest(TestCase):
         })
         self.client.post(self.url, data, content_type=self.content_type)
         machine.refresh_from_db()
-        fact = machine.facts.get(fact_name='test_user')
-        historical_fact = machine.historical_facts.get(fact_name='test_user')
-        self.assertEqual(fact.fact_name, 'test_user')
+        fact = machine.facts.get(fact_name__name='test_user')
+        historical_fact = machine.historical_facts.get(fact_name__name='test_user')
+        self.assertEqual(fact.fact_name.name, 'test_user')
         self.assertEqual(fact.fact_data, 'Snake Plisskin')
         self.assertEqual(fact.management_source.name, 'Munki')
-        self.assertEqual(historical_fact.fact_name, 'test_user')
+        self.assertEqual(historical_fact.fact_name.name, 'test_user')
         self.assertEqual(historical_fact.fact_data, 'Snake Plisskin')
         self.assertEqual(historical_fact.management_source.name, 'Munki')
 
@@ -251,7 +884,7 @@ class CheckinFactTest(TestCase):
         })
         self.client.post(self.url, data, content_type=self.content_type)
         machine.refresh_from_db()
-        self.assertRaises(Fact.DoesNotExist, machine.facts.get, fact_name='ignore_this')
+        self.assertRaises(Fact.DoesNotExist, machine.facts.get, fact_name__name='ignore_this')
 
 
 class CheckinMessageTest(TestCase):
@@ -262,6 +895,9 @@ class CheckinMessageTest(TestCase):
         'message_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -302,6 +938,9 @@ class CheckinManagedItemTest(TestCase):
         'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -386,6 +1025,9 @@ class CheckinMunkiItemTest(TestCase):
         'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -415,6 +1057,9 @@ class CheckinManagedItemHistoryTest(TestCase):
         'machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
 
     def setUp(self):
+        server.utils.clear_management_source_cache()
+        server.utils.clear_fact_name_cache()
+        server.utils.clear_fact_value_cache()
         settings.BASIC_AUTH = False
         self.client = Client()
         self.content_type = 'application/json'
@@ -472,6 +1117,32 @@ class CheckinManagedItemHistoryTest(TestCase):
         machine.refresh_from_db()
         self.assertTrue(ManagedItemHistory.objects.count() == 1)
 
+    def test_history_reconciliation_query_count(self):
+        """Test that history reconciliation is one query for any number of items."""
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        munki = ManagementSource.objects.create(name='Munki')
+        for index in range(3):
+            ManagedItemHistory.objects.create(
+                machine=machine, name='Item 0', management_source=munki, status='PENDING',
+                recorded=now() - datetime.timedelta(days=index))
+        ManagedItemHistory.objects.create(
+            machine=machine, name='Item 1', management_source=munki, status='PRESENT',
+            recorded=now() - datetime.timedelta(days=5))
+        ManagedItemHistory.objects.create(
+            machine=machine, name='Item 1', management_source=munki, status='PENDING',
+            recorded=now() - datetime.timedelta(days=1))
+
+        for item_count in (2, 100):
+            object_queue = {'managed_items': [], 'managed_item_histories': []}
+            for index in range(item_count):
+                object_queue['managed_items'].append(ManagedItem(
+                    name=f'Item {index}', machine=machine, management_source=munki,
+                    status='PENDING', date_managed=now()))
+            with self.assertNumQueries(1):
+                non_ui_views.process_managed_item_histories(object_queue, machine)
+            # Both of the existing items were last recorded as pending.
+            self.assertEqual(len(object_queue['managed_item_histories']), item_count - 2)
+
 
 class CheckinHelperTest(TestCase):
     """Tests for helper functions that support the checkin view."""
@@ -0,0 +1,42 @@
+"""Tests for the history table partitioning helpers."""
+
+
+import datetime
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from server import partitions, utils
+from server.models import HistoricalFact, Machine
+
+
+class PartitionTest(TestCase):
+    """Test the history table partitioning helpers."""
+    fixtures = ['machine_group_fixtures.json', 'business_unit_fixtures.json', 'machine_fixtures.json']
+
+    def test_months(self):
+        start = partitions.month_start(datetime.datetime(2026, 11, 18, 23, 0))
+        self.assertEqual(start, datetime.datetime(2026, 11, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(partitions.add_months(start, 2), start.replace(year=2027, month=1))
+        name = partitions.get_partition_name(HistoricalFact, start)
+        self.assertEqual(name, 'server_historicalfact_p202611')
+        self.assertEqual(partitions.parse_partition_name(HistoricalFact, name), start)
+        default = partitions.get_default_partition_name(HistoricalFact)
+        self.assertEqual(default, 'server_historicalfact_default')
+        self.assertIsNone(partitions.parse_partition_name(HistoricalFact, default))
+
+    def test_retention_without_partitions(self):
+        self.assertFalse(partitions.is_partitioned(HistoricalFact))
+        machine = Machine.objects.get(serial='C0DEADBEEF')
+        cutoff = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        for days in (-1, 1):
+            HistoricalFact.objects.create(
+                machine=machine, fact_name=utils.get_fact_names(['test'])['test'], fact_data='',
+                fact_recorded=cutoff + datetime.timedelta(days=days))
+        partitions.enforce_retention(HistoricalFact, cutoff)
+        self.assertEqual(HistoricalFact.objects.get().fact_recorded, cutoff + datetime.timedelta(days=1))
+
+    def test_command_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_history')
@@ -122,3 +122,28 @@ class ReportSettingsTest(TestCase):
         self.client.get(f'{self.url}/tacos/')
         # There are two included by default.
         self.assertEqual(Report.objects.count(), 2)
+
+
+class CheckinMetricsTest(TestCase):
+    """Functional tests for the checkin metrics view."""
+    fixtures = ['user_fixture.json']
+
+    def setUp(self):
+        self.url = '/settings/checkin_metrics/'
+        self.client = Client()
+
+    def test_requires_ga(self):
+        self.client.force_login(User.objects.get(pk=2))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_metrics(self):
+        ga_user = User.objects.get(pk=1)
+        user_profile = ga_user.userprofile
+        user_profile.level = 'GA'
+        user_profile.save()
+        self.client.force_login(ga_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'timing_enabled', 'timing', 'sections', 'admission', 'queue'})
+        self.assertEqual(response.json()['queue']['depth'], 0)
@@ -0,0 +1,53 @@
+"""Tests for the stored sortable version keys."""
+
+
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from search.models import SavedSearch, SearchGroup, SearchRow
+from search.views import search_machines
+from server.models import Machine
+from utils.versions import get_version_key
+
+
+class VersionKeyTest(TestCase):
+    """Test the sortable version keys are maintained and used."""
+    fixtures = [
+        'machine_fixtures.json', 'business_unit_fixtures.json', 'machine_group_fixtures.json']
+
+    def setUp(self):
+        self.machine = Machine.objects.get(serial='C0DEADBEEF')
+
+    def test_keys_saved(self):
+        self.machine.operating_system = '10.15.7'
+        self.machine.save()
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.operating_system_key, get_version_key('10.15.7'))
+
+        self.machine.munki_version = '5.2.1'
+        self.machine.save(update_fields=['munki_version'])
+        self.machine.refresh_from_db()
+        self.assertEqual(self.machine.munki_version_key, get_version_key('5.2.1'))
+
+    def test_backfill(self):
+        Machine.objects.update(operating_system='11.0', operating_system_key=None)
+        out = io.StringIO()
+        call_command('backfill_version_keys', batch_size=1, stdout=out)
+        self.assertEqual(
+            set(Machine.objects.values_list('operating_system_key', flat=True)), {get_version_key('11.0')})
+        self.assertIn('Checked 2 machines, updated 2.', out.getvalue())
+
+    def test_range_search(self):
+        for machine in Machine.objects.all():
+            machine.operating_system = '10.9' if machine.pk == self.machine.pk else '10.15.7'
+            machine.save()
+        saved_search = SavedSearch.objects.create(created_by=User.objects.create(username='test'))
+        search_group = SearchGroup.objects.create(saved_search=saved_search)
+        SearchRow.objects.create(
+            search_group=search_group, search_models='Machine', search_field='operating_system',
+            operator='<', search_term='10.10', position=0)
+        results = search_machines(saved_search.pk, Machine.objects.all())
+        self.assertEqual([machine['serial'] for machine in results], ['C0DEADBEEF'])
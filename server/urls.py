@@ -19,6 +19,7 @@ urlpatterns = [
 
     # Checkin routes.
     path('checkin/', checkin, name='checkin'),
+    path('checkin/batch/', checkin_batch, name='checkin_batch'),
     path('report_broken_client/', report_broken_client, name='report_broken_client'),
     path('preflight-v2/get-script/<plugin_name>/<script_name>/', preflight_v2_get_script,
          name='preflight_v2_get_script'),
@@ -46,6 +47,8 @@ urlpatterns = [
     path('machine_group/delete/<int:group_id>/', delete_machine_group, name='delete_machine_group'),
     path('machine_group/really/delete/<int:group_id>/', really_delete_machine_group,
          name='really_delete_machine_group'),
+    path('deletion_job/<int:job_id>/', deletion_job, name='deletion_job'),
+    path('deletion_job/retry/<int:job_id>/', retry_deletion, name='retry_deletion'),
     path('new-machine-group/<int:bu_id>/', new_machine_group, name='new_machine_group'),
     path('edit-machine-group/<int:group_id>/', edit_machine_group, name='edit_machine_group'),
 
@@ -103,6 +106,7 @@ urlpatterns = [
     path('settings/save_historical_days/', settings_historical_data,
          name='settings_historical_data'),
     path('settings/', settings_page, name='settings_page'),
+    path('settings/checkin_metrics/', checkin_metrics, name='checkin_metrics'),
     path('new_version/never/', new_version_never, name='new_version_never'),
     path('new_version/week/', new_version_week, name='new_version_week'),
     path('new_version/day/', new_version_day, name='new_version_day')
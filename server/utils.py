@@ -1,11 +1,14 @@
+import datetime
 import hashlib
 import itertools
 import json
+import logging
 import os
 import pathlib
 import plistlib
 import time
 import xml.etree.ElementTree as ET
+from collections import defaultdict
 from distutils.version import LooseVersion
 from itertools import chain
 
@@ -14,15 +17,20 @@ import requests
 from django.conf import settings
 # from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.core.exceptions import ValidationError
-from django.db import connection
-from django.db.models import Count, Max
+from django.db import connection, transaction
+from django.db.models import Count, Exists, Max, OuterRef, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
 from django.templatetags.static import static
+from django.utils import timezone
 
-from sal.decorators import is_global_admin
+from sal.decorators import MACHINE_GROUP_KEY_CACHE, is_global_admin
 from sal.plugin import BasePlugin, Widget, PluginManager, DetailPlugin, ReportPlugin
 from sal.settings import PROJECT_DIR
+from server import checkin_timing
 from server.models import *
+from utils.caching import LRUCache, TTLCache
 from utils.text_utils import safe_text
 
 
@@ -37,6 +45,31 @@ FALSY = {'FALSE', 'NO'}
 STRINGY_BOOLS = TRUTHY.union(FALSY)
 TWENTY_FOUR_HOURS = 86400
 EXCLUDED_SCRIPT_TYPES = ('.pyc',)
+# Sources are only ever deleted by `server_maintenance`, which clears
+# its own process' cache; the TTL bounds staleness everywhere else, and
+# checkins that fail on a deleted source are retried with empty caches.
+MANAGEMENT_SOURCE_CACHE = TTLCache(ttl=3600)
+# FactNames are never renamed, so entries can only go stale if a name
+# is deleted.
+FACT_NAME_CACHE = TTLCache(ttl=3600)
+# Names per query when looking up uncached fact names.
+FACT_NAME_BATCH_SIZE = 500
+# Hashes of recently stored fact values. Entries expire so that values
+# removed by `server_maintenance` aren't assumed to exist for long.
+FACT_VALUE_CACHE = LRUCache(maxsize=10000, ttl=300)
+# Upper bound on rows per INSERT for backends without a parameter limit.
+BULK_CREATE_BATCH_SIZE = 1000
+# Plugin models whose enabled plugins are run for each processing hook.
+PLUGIN_HOOKS = {
+    'checkin_processor': (Report, Plugin, MachineDetailPlugin),
+    'profiles_processor': (Plugin, MachineDetailPlugin)}
+# Enabled plugins overriding each hook. Changes made in this process
+# clear it right away; other processes pick them up within the TTL.
+PLUGIN_HOOK_CACHE = TTLCache(ttl=300)
+# Processors slower than this, in seconds, are logged.
+SLOW_PLUGIN_HOOK = 1.0
+
+logger = logging.getLogger(__name__)
 
 
 def db_table_exists(table_name):
@@ -181,6 +214,290 @@ def is_postgres():
     return db_setting == postgres_backend
 
 
+def get_management_source(name, create=True):
+    """Get a ManagementSource by name from the process-local cache.
+
+    The first lookup in a process loads every source in one query;
+    after that, only names that have not been seen yet hit the
+    database.
+
+    Args:
+        name (str): Name of the ManagementSource.
+        create (bool): Create the source if it does not exist.
+            Defaults to `True`.
+
+    Returns:
+        ManagementSource, or `None` if it does not exist and `create`
+        is `False`.
+    """
+    source = MANAGEMENT_SOURCE_CACHE.get(name)
+    if source is None and not len(MANAGEMENT_SOURCE_CACHE):
+        source = warm_management_source_cache().get(name)
+
+    if source is None:
+        if create:
+            source, _ = ManagementSource.objects.get_or_create(name=name)
+        else:
+            source = ManagementSource.objects.filter(name=name).first()
+        if source is not None:
+            cache_on_commit(MANAGEMENT_SOURCE_CACHE, {name: source})
+
+    return source
+
+
+def warm_management_source_cache():
+    """Cache every management source, returning them by name."""
+    sources = {source.name: source for source in ManagementSource.objects.all()}
+    cache_on_commit(MANAGEMENT_SOURCE_CACHE, sources)
+    return sources
+
+
+def clear_management_source_cache():
+    MANAGEMENT_SOURCE_CACHE.clear()
+
+
+def clear_checkin_caches():
+    """Forget the rows cached for checkins, in case any were deleted."""
+    # Imported here, as the inventory app's views need this module.
+    from inventory.views import clear_application_id_cache
+    MACHINE_GROUP_KEY_CACHE.clear()
+    clear_management_source_cache()
+    clear_fact_name_cache()
+    clear_fact_value_cache()
+    clear_application_id_cache()
+
+
+def get_fact_names(names):
+    """Get the FactNames for some fact names, creating missing ones.
+
+    Names are looked up in the process-local cache; only names that
+    have not been seen yet hit the database.
+
+    Args:
+        names (iterable of str): Fact names.
+
+    Returns:
+        dict of name to FactName.
+    """
+    fact_names = {}
+    missing = []
+    for name in set(names):
+        fact_name = FACT_NAME_CACHE.get(name)
+        if fact_name is None:
+            missing.append(name)
+        else:
+            fact_names[name] = fact_name
+
+    for start in range(0, len(missing), FACT_NAME_BATCH_SIZE):
+        batch = missing[start:start + FACT_NAME_BATCH_SIZE]
+        found = {fact_name.name: fact_name for fact_name in FactName.objects.filter(name__in=batch)}
+        new = [FactName(name=name) for name in batch if name not in found]
+        if new:
+            # Another process may be adding the same names.
+            FactName.objects.bulk_create(new, ignore_conflicts=True)
+            found.update(
+                (fact_name.name, fact_name)
+                for fact_name in FactName.objects.filter(name__in=[f.name for f in new]))
+        cache_on_commit(FACT_NAME_CACHE, found)
+        fact_names.update(found)
+
+    return fact_names
+
+
+def cache_on_commit(cache, items):
+    """Add items to a cache once the current transaction commits.
+
+    Rows inserted in a transaction that is rolled back never existed,
+    so caching them straight away would have later checkins refer to
+    missing rows. Outside a transaction, items are cached immediately.
+
+    Args:
+        cache (TTLCache): The cache to fill.
+        items (dict): Keys and values to cache.
+    """
+    items = dict(items)
+
+    def fill_cache():
+        for key, value in items.items():
+            cache.set(key, value)
+
+    if items:
+        transaction.on_commit(fill_cache)
+
+
+def clear_fact_name_cache():
+    FACT_NAME_CACHE.clear()
+
+
+def should_store_fact_value(value):
+    """Return whether a fact value belongs in the FactValue store."""
+    threshold = get_django_setting('FACT_VALUE_STORE_THRESHOLD')
+    return threshold is not None and isinstance(value, str) and len(value) > threshold
+
+
+def get_fact_values(values):
+    """Store fact values as FactValues, if they aren't already.
+
+    Values whose hash was stored recently by this process are assumed
+    to still exist, and are not sent to the database again.
+
+    Args:
+        values (iterable of str): Fact values.
+
+    Returns:
+        dict of value to the SHA-256 hex digest of its FactValue.
+    """
+    hashes = {value: get_fact_value_hash(value) for value in set(values)}
+    missing = [
+        FactValue(sha256=sha256, data=value) for value, sha256 in hashes.items()
+        if FACT_VALUE_CACHE.get(sha256) is None]
+    if missing:
+        FactValue.objects.bulk_create(
+            missing, batch_size=BULK_CREATE_BATCH_SIZE, ignore_conflicts=True)
+        cache_on_commit(FACT_VALUE_CACHE, {fact_value.sha256: True for fact_value in missing})
+    return hashes
+
+
+def clear_fact_value_cache():
+    FACT_VALUE_CACHE.clear()
+
+
+def invalidate_submission_hashes(queryset):
+    """Forget the hashes of the checkin sections some rows came from.
+
+    Checkins skip sections whose hash hasn't changed, so Facts,
+    ManagedItems and Messages that are changed or deleted outside a
+    checkin would otherwise stay that way until the client sends
+    something different. Call this before changing or deleting them.
+
+    Args:
+        queryset (QuerySet): Facts, ManagedItems or Messages.
+    """
+    SubmissionHash.objects.filter(Exists(queryset.order_by().filter(
+        machine=OuterRef('machine'), management_source=OuterRef('management_source')))).delete()
+
+
+def get_fact_data_q(lookup, value, prefix=''):
+    """Build a Q object comparing fact values, wherever they're stored.
+
+    Exact comparisons against values that would be stored as
+    FactValues compare hashes rather than text. Other lookups check
+    both inline and stored values.
+
+    Args:
+        lookup (str): Field lookup, e.g. '__exact' or '__icontains'.
+            An empty string means exact.
+        value (str): Value to compare facts to.
+        prefix (str): Path to the Fact model, e.g. 'facts__'.
+
+    Returns:
+        Q object.
+    """
+    if lookup in ('', '__exact'):
+        if should_store_fact_value(value):
+            return Q(**{f'{prefix}fact_value': get_fact_value_hash(value)})
+        return Q(**{f'{prefix}fact_data': value})
+    return (
+        Q(**{f'{prefix}fact_data{lookup}': value}) |
+        Q(**{f'{prefix}fact_value__data{lookup}': value}))
+
+
+def get_fact_value_hash(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def bulk_create(model, objects, ignore_conflicts=False):
+    """Insert objects in as few queries as the database allows.
+
+    Works on every supported backend; the batch size is the smaller of
+    `BULK_CREATE_BATCH_SIZE` and the backend's query parameter limit,
+    and all batches are written in one transaction.
+
+    `bulk_create` skips `save()`, so models that compute fields there
+    should implement a `prepare_for_bulk_create(objects)` classmethod
+    that does the same work for a list of unsaved objects.
+
+    Args:
+        model (Model): Class of the objects to create.
+        objects (iterable of Model): Unsaved objects.
+        ignore_conflicts (bool): Skip objects that violate a unique
+            constraint, e.g. because another process created them.
+
+    Returns:
+        List of the created objects. Auto-incremented primary keys are
+        only set on backends that can return them.
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+
+    if hasattr(model, 'prepare_for_bulk_create'):
+        model.prepare_for_bulk_create(objects)
+
+    fields = model._meta.concrete_fields
+    batch_size = min(connection.ops.bulk_batch_size(fields, objects), BULK_CREATE_BATCH_SIZE)
+    with transaction.atomic():
+        return model.objects.bulk_create(
+            objects, batch_size=max(batch_size, 1), ignore_conflicts=ignore_conflicts)
+
+
+def reconcile(queryset, objects, key_fields, value_fields):
+    """Apply the difference between stored rows and submitted objects.
+
+    Args:
+        queryset (QuerySet): All of the stored rows being replaced,
+            e.g. a machine's facts.
+        objects (list of Model): Unsaved objects that should be the
+            queryset's rows once complete.
+        key_fields (tuple of str): Attribute names identifying a row.
+        value_fields (tuple of str): Field names that are updated in
+            place when a row's values change.
+
+    Returns:
+        dict of 'inserted', 'updated', and 'deleted' row counts.
+    """
+    model = queryset.model
+    fields = [model._meta.get_field(name) for name in value_fields]
+
+    existing = defaultdict(list)
+    # Order doesn't matter here, and default orderings may need joins.
+    for row in queryset.order_by():
+        existing[tuple(getattr(row, name) for name in key_fields)].append(row)
+
+    to_create = []
+    to_update = []
+    for obj in objects:
+        rows = existing.get(tuple(getattr(obj, name) for name in key_fields))
+        if not rows:
+            to_create.append(obj)
+            continue
+        row = rows.pop()
+        changed = False
+        for field in fields:
+            # Convert to the type that would have been stored, so that
+            # e.g. integer fact values compare equal to their text.
+            value = field.to_python(getattr(obj, field.attname))
+            # Stored datetimes are aware, and a naive one never
+            # compares equal to them.
+            if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            if value != getattr(row, field.attname):
+                setattr(row, field.attname, value)
+                changed = True
+        if changed:
+            to_update.append(row)
+
+    to_delete = [row.pk for rows in existing.values() for row in rows]
+    if to_delete:
+        stale = model.objects.filter(pk__in=to_delete)
+        stale._raw_delete(stale.db)
+    if to_update:
+        model.objects.bulk_update(to_update, value_fields)
+    bulk_create(model, to_create)
+
+    return {'inserted': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
+
+
 def friendly_machine_model(machine):
     # See if the machine's model already has one (and only one) friendly name
     output = None
@@ -381,13 +698,9 @@ def process_plugin_script(results, machine):
                 pluginscript_name=safe_text(key),
                 pluginscript_data=safe_text(value),
                 submission_and_script_name=(safe_text('{}: {}'.format(plugin_name, key))))
-            if is_postgres():
-                rows_to_create.append(plugin_row)
-            else:
-                plugin_row.save()
+            rows_to_create.append(plugin_row)
 
-    if is_postgres() and rows_to_create:
-        PluginScriptRow.objects.bulk_create(rows_to_create)
+    bulk_create(PluginScriptRow, rows_to_create)
 
 
 def get_newest_plugin_results(results):
@@ -466,22 +779,67 @@ def get_plugin_scripts(plugin, hash_only=False, script_name=None):
 
 
 def run_plugin_processing(machine, report_data):
-    enabled_reports = Report.objects.all()
-    enabled_plugins = Plugin.objects.all()
-    enabled_detail_plugins = MachineDetailPlugin.objects.all()
-    for enabled_plugin in itertools.chain(enabled_reports, enabled_plugins, enabled_detail_plugins):
-        plugin = PluginManager.get_plugin_by_name(enabled_plugin.name)
-        if plugin:
-            plugin.checkin_processor(machine, report_data)
+    run_plugin_hook('checkin_processor', machine, report_data)
 
 
 def run_profiles_plugin_processing(machine, profiles_list):
-    enabled_plugins = Plugin.objects.all()
-    enabled_detail_plugins = MachineDetailPlugin.objects.all()
-    for enabled_plugin in itertools.chain(enabled_plugins, enabled_detail_plugins):
-        plugin = PluginManager.get_plugin_by_name(enabled_plugin.name)
-        if plugin:
-            plugin.profiles_processor(machine, profiles_list)
+    run_plugin_hook('profiles_processor', machine, profiles_list)
+
+
+def run_plugin_hook(hook, machine, data):
+    """Call a processing hook on every enabled plugin that has one.
+
+    Each call is timed as a `plugin.<name>` checkin phase, and calls
+    slower than `SLOW_PLUGIN_HOOK` are logged.
+
+    Args:
+        hook (str): Name of the plugin method, from `PLUGIN_HOOKS`.
+        machine (Machine): The machine checking in.
+        data: Submitted data passed on to the hook.
+    """
+    for name, processor in get_plugin_hooks(hook):
+        start = time.perf_counter()
+        with checkin_timing.phase(f'plugin.{name}'):
+            processor(machine, data)
+        duration = time.perf_counter() - start
+        if duration > SLOW_PLUGIN_HOOK:
+            logger.warning("Plugin %s took %.2f seconds in %s", name, duration, hook)
+
+
+def get_plugin_hooks(hook):
+    """Get the enabled plugins that override a processing hook.
+
+    Plugins that inherit `BasePlugin`'s no-op implementation are left
+    out, so checkins don't have to call them.
+
+    Args:
+        hook (str): Name of the plugin method, from `PLUGIN_HOOKS`.
+
+    Returns:
+        List of (plugin name, bound hook method) tuples, in the order
+        the plugins are enabled.
+    """
+    hooks = PLUGIN_HOOK_CACHE.get(hook)
+    if hooks is None:
+        hooks = []
+        default = getattr(BasePlugin, hook)
+        for model in PLUGIN_HOOKS[hook]:
+            for name in model.objects.values_list('name', flat=True):
+                plugin = PluginManager.get_plugin_by_name(name)
+                if plugin and getattr(type(plugin), hook) is not default:
+                    hooks.append((name, getattr(plugin, hook)))
+        PLUGIN_HOOK_CACHE.set(hook, hooks)
+    return hooks
+
+
+@receiver(post_save, sender=Plugin)
+@receiver(post_delete, sender=Plugin)
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+@receiver(post_save, sender=MachineDetailPlugin)
+@receiver(post_delete, sender=MachineDetailPlugin)
+def clear_plugin_hook_cache(sender=None, **kwargs):
+    PLUGIN_HOOK_CACHE.clear()
 
 
 def load_default_plugins():
@@ -15,7 +15,8 @@ from sal.decorators import (
 from server.forms import (BusinessUnitForm, EditUserBusinessUnitForm, EditBusinessUnitForm,
                           MachineGroupForm, EditMachineGroupForm, NewMachineForm)
 from server.models import (BusinessUnit, MachineGroup, Machine, UserProfile, Report, Plugin,
-                           PluginScriptSubmission, PluginScriptRow, ManagedItem, Fact)
+                           PluginScriptSubmission, PluginScriptRow, ManagedItem, Fact, DeletionJob)
+from server.deletion import delete_group, retry_deletion_job
 from server.non_ui_views import process_plugin
 from server import utils
 
@@ -77,6 +78,7 @@ def index(request):
         business_units = BusinessUnit.objects.all()
     else:
         business_units = user.businessunit_set.all()
+    business_units = business_units.filter(pending_deletion=False)
 
     context = {
         'user': request.user,
@@ -176,7 +178,9 @@ def delete_business_unit(request, bu_id):
 @ga_required
 def really_delete_business_unit(request, bu_id):
     business_unit = get_object_or_404(BusinessUnit, pk=int(bu_id))
-    business_unit.delete()
+    job = delete_group(business_unit)
+    if job:
+        return redirect('deletion_job', job.id)
     return redirect(index)
 
 
@@ -184,7 +188,7 @@ def really_delete_business_unit(request, bu_id):
 @access_required(BusinessUnit)
 def bu_dashboard(request, **kwargs):
     business_unit = kwargs['business_unit']
-    machine_groups = business_unit.machinegroup_set.all()
+    machine_groups = business_unit.machinegroup_set.filter(pending_deletion=False)
 
     # Load in the default plugins if needed
     utils.load_default_plugins()
@@ -221,10 +225,27 @@ def delete_machine_group(request, group_id):
 def really_delete_machine_group(request, group_id):
     machine_group = get_object_or_404(MachineGroup, pk=int(group_id))
     business_unit = machine_group.business_unit
-    machine_group.delete()
+    job = delete_group(machine_group)
+    if job:
+        return redirect('deletion_job', job.id)
     return redirect('bu_dashboard', business_unit.id)
 
 
+@login_required
+@ga_required
+def deletion_job(request, job_id):
+    job = get_object_or_404(DeletionJob, pk=job_id)
+    return render(request, 'server/deletion_job.html', {'user': request.user, 'job': job})
+
+
+@login_required
+@ga_required
+def retry_deletion(request, job_id):
+    job = get_object_or_404(DeletionJob, pk=job_id)
+    retry_deletion_job(job)
+    return redirect('deletion_job', job.id)
+
+
 @login_required
 @access_required(MachineGroup)
 def group_dashboard(request, **kwargs):
@@ -309,8 +330,8 @@ def machine_detail(request, **kwargs):
     business_unit = machine_group.business_unit
 
     try:
-        ip_address_fact = machine.facts.get(fact_name='ipv4_address')
-        ip_address = ip_address_fact.fact_data
+        ip_address_fact = machine.facts.get(fact_name__name='ipv4_address')
+        ip_address = ip_address_fact.value
     except (Fact.MultipleObjectsReturned, Fact.DoesNotExist):
         ip_address = None
 
@@ -426,8 +447,8 @@ def _get_management_facts(machine, source_name, fact_names, prefix=None):
         prefix = source_name
     for fact_name in fact_names:
         try:
-            fact = machine.facts.get(management_source__name=source_name, fact_name=fact_name)
-            result.append((f'{prefix} {fact_name}', fact.fact_data))
+            fact = machine.facts.get(management_source__name=source_name, fact_name__name=fact_name)
+            result.append((f'{prefix} {fact_name}', fact.value))
         except Fact.DoesNotExist:
             pass
 
@@ -472,9 +493,12 @@ def machine_detail_facts(request, machine_id, management_source, **kwargs):
     if management_source == 'None':
         management_source = None
     if machine.facts.count() != 0:
-        facts = machine.facts.filter(management_source__name=management_source)
+        facts = (
+            machine.facts.filter(management_source__name=management_source)
+            .select_related('fact_name', 'fact_value')
+            .order_by('fact_name__name'))
         if settings.EXCLUDED_FACTS:
-            facts = facts.exclude(fact_name__in=settings.EXCLUDED_FACTS)
+            facts = facts.exclude(fact_name__name__in=settings.EXCLUDED_FACTS)
     else:
         facts = None
 
@@ -0,0 +1,73 @@
+import collections
+import math
+import random
+import threading
+import time
+
+
+class Budget:
+    """Thread-safe count of work in flight in this process, up to a limit.
+
+    Also tracks how long admitted work takes, and how much was turned
+    away recently, to suggest how long rejected clients should wait
+    before retrying.
+    """
+
+    # Rejected requests are assumed to be retried within this many
+    # seconds, so they count towards the backlog until then.
+    REJECTION_WINDOW = 60
+    MAX_RETRY_AFTER = 300
+    # Weight of each new duration in the moving average.
+    SMOOTHING = 0.1
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+        self.mean_duration = 1.0
+        self._rejections = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot, returning whether one was available."""
+        with self._lock:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            now = time.monotonic()
+            self.rejected += 1
+            self._rejections.append(now)
+            self._expire_rejections(now)
+            return False
+
+    def release(self, duration):
+        """Give back a slot, recording how many seconds it was held."""
+        with self._lock:
+            self.in_flight -= 1
+            self.mean_duration += self.SMOOTHING * (duration - self.mean_duration)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before retrying.
+
+        This is the time it would take to work through everything in
+        flight and everything recently turned away, with some jitter
+        so that rejected clients don't all come back at once.
+        """
+        with self._lock:
+            self._expire_rejections(time.monotonic())
+            backlog = self.in_flight + len(self._rejections)
+            seconds = backlog * self.mean_duration / max(self.limit, 1)
+        seconds *= random.uniform(1, 1.5)
+        return min(max(math.ceil(seconds), 1), self.MAX_RETRY_AFTER)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'mean_duration_ms': round(self.mean_duration * 1000, 2)}
+
+    def _expire_rejections(self, now):
+        while self._rejections and self._rejections[0] < now - self.REJECTION_WINDOW:
+            self._rejections.popleft()
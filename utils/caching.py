@@ -0,0 +1,76 @@
+import collections
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe, process-local cache whose entries expire.
+
+    Each web or worker process gets its own copy, so anything cached
+    here can be up to `ttl` seconds out of date with respect to changes
+    made by other processes. Changes made in this process should call
+    `pop` or `clear` to take effect immediately.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, (None, default))[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class LRUCache(TTLCache):
+    """TTLCache that also holds at most `maxsize` entries.
+
+    When full, setting a new key evicts the least recently used one.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__(ttl=ttl)
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -0,0 +1,88 @@
+"""Incremental decompression of HTTP request bodies."""
+
+
+import bz2
+import gzip
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def get_supported_encodings():
+    encodings = {'', 'identity', 'gzip', 'x-gzip', 'bzip2', 'x-bzip2', 'bz2'}
+    if zstandard is not None:
+        encodings.add('zstd')
+    return encodings
+
+
+def open_encoded_stream(stream: BinaryIO, encoding: str = '', max_size: int = None) -> BinaryIO:
+    """Wrap a stream to read it decompressed, as it's consumed.
+
+    Args:
+        stream: File-like object with a `read` method, e.g. a Django
+            request.
+        encoding (str): HTTP `Content-Encoding` of the stream. gzip
+            and bzip2 are always supported; zstd requires the
+            `zstandard` package.
+        max_size (int): Maximum number of decompressed bytes that may
+            be read before `BodyTooLarge` is raised. Defaults to no
+            limit.
+
+    Returns:
+        A file-like object returning the decompressed bytes.
+
+    Raises:
+        UnsupportedEncoding if the encoding can't be decompressed.
+    """
+    encoding = encoding.strip().lower()
+    if encoding not in get_supported_encodings():
+        raise UnsupportedEncoding(f'Unsupported Content-Encoding "{encoding}"')
+
+    if encoding in ('gzip', 'x-gzip'):
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    elif encoding in ('bzip2', 'x-bzip2', 'bz2'):
+        stream = bz2.BZ2File(stream)
+    elif encoding == 'zstd':
+        stream = zstandard.ZstdDecompressor().stream_reader(stream)
+
+    return LimitedReader(stream, max_size) if max_size else stream
+
+
+class LimitedReader:
+    """Read from a stream, raising BodyTooLarge past `max_size` bytes."""
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.size = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            chunk = self.read(CHUNK_SIZE)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self.read(CHUNK_SIZE)
+            return b''.join(chunks)
+
+        # Never ask for more than one byte past the limit, so a
+        # decompression bomb can't be expanded into memory.
+        data = self.stream.read(min(size, self.max_size - self.size + 1))
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise BodyTooLarge(f'Body is larger than {self.max_size} bytes')
+        return data
@@ -14,7 +14,8 @@ import server.utils
 import utils.text_utils
 
 
-IGNORED_CSV_FIELDS = ('id', 'machine_group', 'report')
+IGNORED_CSV_FIELDS = (
+    'id', 'machine_group', 'report', *server.models.Machine.VERSION_KEY_FIELDS.values())
 MACHINE_FIELDS = [
     field.name for field in server.models.Machine._meta.get_fields()
     if not field.is_relation and field.name not in IGNORED_CSV_FIELDS]
@@ -0,0 +1,32 @@
+"""General functional tests for the admission module."""
+
+
+from django.test import TestCase
+
+from utils.admission import Budget
+
+
+class BudgetTest(TestCase):
+    """Test the admission control Budget."""
+
+    def test_acquire_and_release(self):
+        budget = Budget(2)
+        self.assertTrue(budget.acquire())
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+        budget.release(1.0)
+        self.assertTrue(budget.acquire())
+        self.assertEqual(budget.to_dict()['in_flight'], 2)
+        self.assertEqual(budget.rejected, 1)
+
+    def test_retry_after_grows_with_backlog(self):
+        budget = Budget(1)
+        budget.acquire()
+        budget.release(10.0)
+        budget.mean_duration = 10.0
+        budget.acquire()
+        short = budget.retry_after()
+        for _ in range(20):
+            budget.acquire()
+        self.assertGreater(budget.retry_after(), short)
+        self.assertLessEqual(budget.retry_after(), Budget.MAX_RETRY_AFTER)
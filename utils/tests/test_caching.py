@@ -0,0 +1,55 @@
+"""General functional tests for the caching module."""
+
+
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from utils.caching import LRUCache, TTLCache
+
+
+class TTLCacheTest(TestCase):
+    """Test the TTLCache."""
+
+    def test_get_and_set(self):
+        cache = TTLCache()
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('key', 'default'), 'default')
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(len(cache), 1)
+
+    def test_pop_and_clear(self):
+        cache = TTLCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    @patch('utils.caching.time.monotonic')
+    def test_entries_expire(self, monotonic):
+        monotonic.return_value = 100
+        cache = TTLCache(ttl=10)
+        cache.set('key', 'value')
+        monotonic.return_value = 110
+        self.assertEqual(cache.get('key'), 'value')
+        monotonic.return_value = 111
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(len(cache), 0)
+
+
+class LRUCacheTest(TestCase):
+    """Test the LRUCache."""
+
+    def test_least_recently_used_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
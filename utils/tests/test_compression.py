@@ -0,0 +1,55 @@
+"""General functional tests for the compression module."""
+
+
+import bz2
+import gzip
+import io
+import unittest
+
+from django.test import TestCase
+
+from utils import compression
+
+
+DATA = b'{"Machine": {}}' * 1000
+
+
+class CompressionTest(TestCase):
+    """Test the request body decompression."""
+
+    def test_identity(self):
+        for encoding in ('', 'identity'):
+            stream = compression.open_encoded_stream(io.BytesIO(DATA), encoding)
+            self.assertEqual(stream.read(), DATA)
+
+    def test_gzip(self):
+        stream = compression.open_encoded_stream(io.BytesIO(gzip.compress(DATA)), 'gzip')
+        self.assertEqual(stream.read(), DATA)
+
+    def test_bz2(self):
+        stream = compression.open_encoded_stream(io.BytesIO(bz2.compress(DATA)), 'bzip2')
+        self.assertEqual(stream.read(), DATA)
+
+    @unittest.skipUnless(compression.zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        data = compression.zstandard.ZstdCompressor().compress(DATA)
+        stream = compression.open_encoded_stream(io.BytesIO(data), 'zstd')
+        self.assertEqual(stream.read(), DATA)
+
+    def test_unsupported(self):
+        with self.assertRaises(compression.UnsupportedEncoding):
+            compression.open_encoded_stream(io.BytesIO(DATA), 'br')
+
+    def test_max_size(self):
+        stream = compression.open_encoded_stream(io.BytesIO(DATA), max_size=len(DATA))
+        self.assertEqual(stream.read(), DATA)
+        stream = compression.open_encoded_stream(
+            io.BytesIO(gzip.compress(DATA)), 'gzip', max_size=len(DATA) - 1)
+        with self.assertRaises(compression.BodyTooLarge):
+            stream.read()
+
+    def test_max_size_incremental(self):
+        stream = compression.open_encoded_stream(io.BytesIO(DATA), max_size=100)
+        self.assertEqual(len(stream.read(60)), 60)
+        with self.assertRaises(compression.BodyTooLarge):
+            stream.read(60)
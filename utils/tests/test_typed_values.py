@@ -0,0 +1,53 @@
+"""General functional tests for the typed_values module."""
+
+
+from datetime import datetime
+
+import pytz
+from django.test import TestCase
+
+from utils import typed_values
+
+
+class TypedValuesTest(TestCase):
+    """Test the typed value extractor."""
+
+    def test_int(self):
+        result = typed_values.get_typed_value('42')
+        self.assertEqual(result.int_value, 42)
+        self.assertEqual(result.string_value, '42')
+
+    def test_int_out_of_range(self):
+        self.assertEqual(typed_values.get_typed_value('4294967296').int_value, 0)
+
+    def test_epoch(self):
+        result = typed_values.get_typed_value('1600000000')
+        self.assertEqual(result.int_value, 1600000000)
+        self.assertEqual(result.date_value, datetime(2020, 9, 13, 12, 26, 40, tzinfo=pytz.UTC))
+
+    def test_zero_has_no_date(self):
+        self.assertIsNone(typed_values.get_typed_value('0').date_value)
+
+    def test_yyyymmdd(self):
+        result = typed_values.get_typed_value('20200102')
+        self.assertEqual(result.date_value, datetime(2020, 1, 2, tzinfo=pytz.UTC))
+
+    def test_iso_8601(self):
+        result = typed_values.get_typed_value('2020-01-02T03:04:05Z')
+        self.assertEqual(result.int_value, 0)
+        self.assertEqual(result.date_value, datetime(2020, 1, 2, 3, 4, 5, tzinfo=pytz.UTC))
+        result = typed_values.get_typed_value('2020-01-02 03:04:05')
+        self.assertEqual(result.date_value, datetime(2020, 1, 2, 3, 4, 5, tzinfo=pytz.UTC))
+
+    def test_other_date_formats(self):
+        result = typed_values.get_typed_value('Jan 2 2020')
+        self.assertEqual(result.date_value, datetime(2020, 1, 2, tzinfo=pytz.UTC))
+
+    def test_not_a_date(self):
+        result = typed_values.get_typed_value('Munki')
+        self.assertEqual(result, (0, 'Munki', None))
+        self.assertEqual(typed_values.get_typed_value(None), (0, 'None', None))
+
+    def test_batch(self):
+        results = typed_values.get_typed_values(['1', '1', 'two'])
+        self.assertEqual(set(results), {'1', 'two'})
@@ -0,0 +1,35 @@
+"""General functional tests for the versions module."""
+
+
+from django.test import TestCase
+
+from utils.versions import get_version_key
+
+
+class VersionKeyTest(TestCase):
+    """Test the sortable version keys."""
+
+    def test_numeric_order(self):
+        versions = ['10.15.7', '1.10', '11.0', '1.9', '10.9', '1.0.1', '1.0']
+        self.assertEqual(
+            sorted(versions, key=get_version_key),
+            ['1.0', '1.0.1', '1.9', '1.10', '10.9', '10.15.7', '11.0'])
+
+    def test_letters(self):
+        self.assertLess(get_version_key('1.0'), get_version_key('1.0b1'))
+        self.assertLess(get_version_key('1.0b1'), get_version_key('1.0b2'))
+        self.assertLess(get_version_key('1.0.1'), get_version_key('1.0b1'))
+        self.assertEqual(get_version_key('1.0B1'), get_version_key('1.0b1'))
+
+    def test_separators_and_zeros(self):
+        self.assertEqual(get_version_key('1.02'), get_version_key('1-2'))
+        self.assertEqual(get_version_key('14.0 (23A344)'), get_version_key('14.0.23.a.344'))
+
+    def test_long_numbers(self):
+        self.assertLess(get_version_key('999999999'), get_version_key('1000000000'))
+        self.assertLess(get_version_key('1.20230101120000'), get_version_key('2.0'))
+
+    def test_empty(self):
+        self.assertIsNone(get_version_key(None))
+        self.assertEqual(get_version_key(''), '')
+        self.assertLess(get_version_key(''), get_version_key('0'))
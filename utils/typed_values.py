@@ -0,0 +1,93 @@
+"""Derive the typed search columns stored alongside plugin script data."""
+
+
+import functools
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+import pytz
+from dateutil.parser import parse
+
+
+# Range of the IntegerField the int value is stored in.
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+INT_RE = re.compile(r'^\s*[-+]?\d+\s*$')
+
+
+class TypedValue(NamedTuple):
+    int_value: int
+    string_value: str
+    date_value: Optional[datetime]
+
+
+def get_typed_values(values: Iterable[Any]) -> Dict[Any, TypedValue]:
+    """Derive the typed values for a batch of raw values.
+
+    Each distinct value is only processed once, so batches with
+    repeated values (e.g. the same plugin on every machine) are cheap.
+
+    Args:
+        values: Raw values, usually strings.
+
+    Returns:
+        Dict mapping each distinct value to its TypedValue.
+    """
+    results = {}
+    for value in values:
+        if value not in results:
+            results[value] = get_typed_value(value)
+    return results
+
+
+def get_typed_value(value: Any) -> TypedValue:
+    if isinstance(value, str) and INT_RE.match(value):
+        number = int(value)
+        int_value = number if INT_MIN <= number <= INT_MAX else 0
+        return TypedValue(int_value, value, _int_to_date(value.strip(), number))
+
+    try:
+        int_value = int(value)
+    except (ValueError, TypeError, OverflowError):
+        int_value = 0
+    if not INT_MIN <= int_value <= INT_MAX:
+        int_value = 0
+
+    date_value = _parse_date(value) if isinstance(value, str) else None
+    return TypedValue(int_value, str(value), date_value)
+
+
+def _int_to_date(text: str, number: int) -> Optional[datetime]:
+    """Interpret an integer as YYYYMMDD or as epoch seconds."""
+    if len(text) == 8:
+        try:
+            return datetime.strptime(text, '%Y%m%d').replace(tzinfo=pytz.UTC)
+        except ValueError:
+            pass
+    if number == 0:
+        return None
+    try:
+        return datetime.fromtimestamp(number, tz=pytz.UTC)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(text: str) -> Optional[datetime]:
+    # ISO-8601 is by far the most common format, and much cheaper to
+    # parse than letting dateutil guess.
+    iso_text = text.strip()
+    if iso_text.endswith('Z'):
+        iso_text = iso_text[:-1] + '+00:00'
+    try:
+        date_value = datetime.fromisoformat(iso_text)
+    except ValueError:
+        try:
+            date_value = parse(text)
+        except (ValueError, OverflowError):
+            return None
+
+    if not date_value.tzinfo:
+        date_value = date_value.replace(tzinfo=pytz.UTC)
+    return date_value
@@ -0,0 +1,43 @@
+"""Derive the sortable keys stored alongside version strings."""
+
+
+import re
+from typing import Optional
+
+
+# Length of the key columns.
+KEY_LENGTH = 255
+COMPONENT_RE = re.compile(r'\d+|[a-z]+')
+
+
+def get_version_key(version: Optional[str]) -> Optional[str]:
+    """Build a key that sorts versions in the order LooseVersion would.
+
+    Versions are split into runs of digits and letters, ignoring any
+    other separators. Numbers are prefixed with their number of digits,
+    so that they compare numerically as text, and components are joined
+    with '.', which sorts before everything else, so that "1.0" sorts
+    before "1.0.1". Numbers sort before letters, so "1.0.1" sorts
+    before "1.0b1" (LooseVersion can't compare those at all).
+
+    The key is compared with a plain string comparison, so the database
+    can sort and range filter versions on it, e.g.
+    `operating_system_key__lt=get_version_key('10.15')`.
+
+    Args:
+        version: The version string.
+
+    Returns:
+        The key, or None for a None version.
+    """
+    if version is None:
+        return None
+    components = []
+    for component in COMPONENT_RE.findall(str(version).lower()):
+        if component.isdigit():
+            component = component.lstrip('0') or '0'
+            # Lengths past 9 carry on through ':', ';' etc., which sort
+            # after the digits.
+            component = chr(ord('0') + len(component)) + component
+        components.append(component)
+    return '.'.join(components)[:KEY_LENGTH]